@@ -0,0 +1,68 @@
+# Collection hot paths, per field type mix and collection size.
+from datacrystals import collection, column
+
+
+def test_call(benchmark, mix, rows, filled):
+    # append throughput, one crystal at a time
+    elems = list(filled)
+    Collec = type(filled)
+
+    def append():
+        c = Collec()
+        for e in elems:
+            c(e)
+
+    benchmark.pedantic(append, rounds=3)
+
+
+def test_iter(benchmark, mix, rows, filled):
+    benchmark.pedantic(list, args=(filled,), rounds=3)
+
+
+def test_contains(benchmark, mix, rows, filled):
+    # the last crystal : a full scan without a key
+    last = filled[len(filled) - 1]
+    benchmark(lambda: last in filled)
+
+
+def test_contains_key(benchmark, mix, rows, filled):
+    keyed = collection(type(filled).Inner, key=True).from_bytes(filled.to_bytes())
+    last = keyed[len(keyed) - 1]
+    benchmark(lambda: last in keyed)
+
+
+def test_optimize(benchmark, mix, rows, filled):
+    # first call on a collection, then cached
+    def fresh():
+        return (type(filled).from_bytes(filled.to_bytes()),), {}
+
+    benchmark.pedantic(lambda c: c.optimize(), setup=fresh, rounds=3)
+
+
+def test_optimize_cached(benchmark, mix, rows, filled):
+    filled.optimize()
+    benchmark(filled.optimize)
+
+
+def test_str(benchmark, mix, rows, filled):
+    benchmark.pedantic(str, args=(filled,), rounds=3)
+
+
+def test_where(benchmark, mix, rows, filled):
+    # about half of the rows, vectorized
+    pivot = filled[len(filled) // 2].a
+    benchmark.pedantic(filled.where, args=(column("a") < pivot,), rounds=3)
+
+
+def test_filter(benchmark, mix, rows, filled):
+    # the same rows, from a python function of each crystal
+    pivot = filled[len(filled) // 2].a
+    benchmark.pedantic(filled.filter, args=(lambda e: e.a < pivot,), rounds=3)
+
+
+def test_select(benchmark, mix, rows, filled):
+    benchmark.pedantic(filled.select, args=("a", "c"), rounds=3)
+
+
+def test_sort_by(benchmark, mix, rows, filled):
+    benchmark.pedantic(filled.sort_by, args=("c", "a"), rounds=3)
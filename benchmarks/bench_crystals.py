@@ -0,0 +1,40 @@
+# Crystal construction : validated, trusted (from stored rows), slotted.
+from datacrystals import datacrystal
+
+from .conftest import MIXES
+
+# the same crystal types, slotted
+SLOTTED = {
+    mix: datacrystal(
+        type(cls.__name__, (), {"__annotations__": cls.__annotations__}), slots=True
+    )
+    for mix, (cls, _) in MIXES.items()
+}
+
+
+def _values(mix):
+    cls, columns = MIXES[mix]
+    return cls, {k: v[0] for k, v in columns(1).items()}
+
+
+def test_construct(benchmark, mix):
+    cls, values = _values(mix)
+    benchmark(lambda: cls(**values))
+
+
+def test_construct_slots(benchmark, mix):
+    _, values = _values(mix)
+    slotted = SLOTTED[mix]
+    benchmark(lambda: slotted(**values))
+
+
+def test_from_trusted(benchmark, mix):
+    cls, values = _values(mix)
+    row = tuple(cls(**values).__dict__[n] for n in values)
+    benchmark(lambda: cls._from_trusted(*row))
+
+
+def test_validate_columns(benchmark, mix, rows):
+    cls, columns = MIXES[mix]
+    data = columns(rows)
+    benchmark.pedantic(cls.validate_columns, args=(data,), rounds=3)
@@ -0,0 +1,59 @@
+# Startup and declaration costs : importing the package, declaring crystal and collection types.
+import subprocess
+import sys
+from dataclasses import make_dataclass
+from decimal import Decimal
+from itertools import count
+
+from datacrystals import collection, datacrystal
+
+from .conftest import Mixed
+
+# modules that must not be imported until they are used
+LAZY = ("hypothesis", "tabulate")
+
+
+def _python(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def test_import(benchmark):
+    imported = benchmark.pedantic(
+        _python,
+        args=(
+            f"import sys, datacrystals; print([m for m in {LAZY} if m in sys.modules])",
+        ),
+        rounds=5,
+    )
+    assert imported.strip() == "[]"
+
+
+def test_import_dependencies(benchmark):
+    # the floor for test_import : what datacrystals cannot avoid importing
+    benchmark.pedantic(_python, args=("import pandas, pydantic",), rounds=5)
+
+
+_names = count()
+
+
+def _declare():
+    return datacrystal(
+        make_dataclass(
+            f"Declared{next(_names)}", [("a", int), ("b", Decimal), ("c", str)]
+        )
+    )
+
+
+def test_declare(benchmark):
+    benchmark(_declare)
+
+
+def test_collection_type(benchmark):
+    benchmark.pedantic(collection, setup=lambda: ((_declare(),), {}), rounds=100)
+
+
+def test_collection_type_cached(benchmark):
+    collection(Mixed)
+    benchmark(collection, Mixed)
@@ -0,0 +1,71 @@
+# Joins of `rows` crystals with rows // 10 others : time, and peak memory of the join (in extra_info).
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datacrystals import collection, datacrystal
+
+
+@datacrystal
+class Trade:
+    ts: datetime
+    account: int
+    quantity: int
+
+
+@datacrystal
+class Account:
+    account: int
+    limit: int
+
+
+_built = {}
+
+
+def _collections(rows: int, shuffled: bool):
+    if (rows, shuffled) not in _built:
+        accounts = np.arange(max(rows // 10, 1), dtype="int64")
+        if shuffled:
+            accounts = np.random.default_rng(0).permutation(accounts)
+        _built[(rows, shuffled)] = (
+            collection(Trade).from_columns(
+                {
+                    "ts": pd.date_range("2021-01-01", periods=rows, freq="s"),
+                    "account": np.arange(rows, dtype="int64") * 7 % len(accounts),
+                    "quantity": np.arange(rows, dtype="int64"),
+                }
+            ),
+            collection(Account).from_columns({"account": accounts, "limit": accounts}),
+        )
+    return _built[(rows, shuffled)]
+
+
+def _peak(benchmark, join):
+    tracemalloc.start()
+    try:
+        join()
+        benchmark.extra_info["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# sorted right keys : sort-merge, shuffled ones : hash join
+@pytest.mark.parametrize("shuffled", [False, True])
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_join(benchmark, rows, shuffled, how):
+    trades, accounts = _collections(rows, shuffled)
+    join = lambda: trades.join(accounts, on="account", how=how)  # noqa: E731
+    _peak(benchmark, join)
+    assert len(benchmark.pedantic(join, rounds=3)) == rows
+
+
+def test_join_asof(benchmark, rows):
+    trades, _ = _collections(rows, False)
+    # every 10th trade, as of each trade
+    sparse = collection(Trade).from_columns(trades._df.iloc[::10])
+    join = lambda: trades.join(sparse, on="ts", how="asof", by="account")  # noqa: E731
+    _peak(benchmark, join)
+    assert len(benchmark.pedantic(join, rounds=3)) == rows
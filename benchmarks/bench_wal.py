@@ -0,0 +1,46 @@
+# Durable collections : append throughput per fsync policy (group commit), and recovery time.
+import shutil
+import tempfile
+
+import pytest
+
+
+@pytest.fixture
+def root():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+@pytest.mark.parametrize("fsync", ["group", "never"])
+def test_durable_call(benchmark, mix, rows, filled, root, fsync):
+    elems = list(filled)
+    Collec = type(filled)
+
+    def setup():
+        shutil.rmtree(root)
+        return (Collec.durable(root, fsync=fsync, snapshot_every=None),), {}
+
+    def append(c):
+        for e in elems:
+            c(e)
+        c.flush()
+
+    benchmark.pedantic(append, setup=setup, rounds=3)
+    if benchmark.stats is not None:  # None with --benchmark-disable
+        benchmark.extra_info["appends_per_s"] = rows / benchmark.stats.stats.mean
+
+
+# replaying the whole log, or loading a snapshot
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_recover(benchmark, mix, rows, filled, root, snapshot):
+    Collec = type(filled)
+    c = Collec.durable(root, snapshot_every=None)
+    for e in filled:
+        c(e)
+    c.flush()
+    if snapshot:
+        c.snapshot()
+
+    recovered = benchmark.pedantic(Collec.durable, args=(root,), rounds=3)
+    assert len(recovered) == rows
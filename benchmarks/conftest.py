@@ -0,0 +1,95 @@
+# Benchmarks of crystal and collection hot paths, with pytest-benchmark.
+# Run with `nox -s benchmarks` : results are saved as JSON, and compared with the previous run.
+from decimal import Decimal
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+import pytest
+
+from datacrystals import collection, datacrystal
+
+# collection sizes, up to --max-rows
+ROWS = [10 ** e for e in range(3, 8)]
+
+
+@datacrystal
+class Ints:
+    a: int
+    b: int
+    c: int
+
+
+@datacrystal
+class Decimals:
+    a: Decimal
+    b: Decimal
+    c: Decimal
+
+
+@datacrystal
+class Strs:
+    a: str
+    b: str
+    c: str
+
+
+@datacrystal
+class Mixed:
+    a: int
+    b: Decimal
+    c: str
+
+
+def _ints(n: int) -> np.ndarray:
+    return np.arange(n, dtype="int64") * 7 % 1000
+
+
+# field type mixes : crystal type, and columns of n rows for it
+MIXES: Dict[str, Tuple[Any, Callable[[int], Dict[str, Any]]]] = {
+    "int": (Ints, lambda n: {"a": _ints(n), "b": _ints(n) + 1, "c": _ints(n) + 2}),
+    "decimal": (
+        Decimals,
+        lambda n: {k: [Decimal(int(v)).scaleb(-2) for v in _ints(n)] for k in "abc"},
+    ),
+    "str": (Strs, lambda n: {k: [f"s{v}" for v in _ints(n)] for k in "abc"}),
+    "mixed": (
+        Mixed,
+        lambda n: {
+            "a": _ints(n),
+            "b": [Decimal(int(v)).scaleb(-2) for v in _ints(n)],
+            "c": [f"s{v}" for v in _ints(n)],
+        },
+    ),
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--max-rows",
+        type=int,
+        default=10 ** 5,
+        help="largest collection size to benchmark (up to 10**7)",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "rows" in metafunc.fixturenames:
+        max_rows = metafunc.config.getoption("max_rows")
+        metafunc.parametrize("rows", [n for n in ROWS if n <= max_rows])
+
+
+@pytest.fixture(params=list(MIXES))
+def mix(request):
+    return request.param
+
+
+_built: Dict[Tuple[str, int], Any] = {}
+
+
+@pytest.fixture
+def filled(mix, rows):
+    """A collection of `rows` crystals of the `mix` type, built once per session (do not append to it)."""
+    if (mix, rows) not in _built:
+        cls, columns = MIXES[mix]
+        _built[(mix, rows)] = collection(cls).from_columns(columns(rows))
+    return _built[(mix, rows)]
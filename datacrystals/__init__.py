@@ -1,17 +1,27 @@
+import functools
 import inspect
 
 from ._collection import _collection_from_class as collection
 from ._crystals import datacrystal
+from ._display import display
+from ._memoize import memoize
+from ._query import column
 
 
 # This is just a user helper, nothing fancy should happen here,
 # just pointing to the appropriate functionality depending on detected usage
-def crystalize(_wrpd):
+def crystalize(_wrpd=None, *, slots: bool = False):
 
     # TODO : cover all possible cases in a sensible manner (instance method, class method, static method ?)...
 
+    if _wrpd is None:  # with options, as @crystalize(slots=True)
+        return functools.partial(crystalize, slots=slots)
+
     if inspect.isclass(_wrpd):
-        return datacrystal(_wrpd)
+        return datacrystal(_wrpd, slots=slots)
+
+    elif inspect.isfunction(_wrpd):
+        return memoize(_wrpd)
 
     else:
         raise NotImplementedError(_wrpd)
@@ -0,0 +1,121 @@
+# Aggregation of collections, declared per field, vectorized on existing data, incremental on appends.
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+# reducer name -> (reduction of a non-empty column, combination of two reduced values)
+# names are the same as pandas groupby aggregations, to vectorize per bucket.
+REDUCERS: Dict[str, Tuple[Callable[[pd.Series], Any], Callable[[Any, Any], Any]]] = {
+    "first": (lambda col: col.iat[0], lambda a, b: a),
+    "last": (lambda col: col.iat[-1], lambda a, b: b),
+    "max": (lambda col: col.max(), lambda a, b: max(a, b)),
+    "min": (lambda col: col.min(), lambda a, b: min(a, b)),
+    "sum": (lambda col: col.sum(), lambda a, b: a + b),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _floor(v: Any, every: Any) -> Any:
+    """
+    Start of the bucket of size `every` containing v.
+    Works the same on scalars and on pandas Series, for numbers and for datetimes (with timedelta).
+
+    >>> _floor(42, 10)
+    40
+    >>> from datetime import timedelta
+    >>> _floor(datetime(2021, 1, 1, 13, 42), timedelta(hours=1))
+    datetime.datetime(2021, 1, 1, 13, 0)
+    """
+    if isinstance(v, pd.Series) and pd.api.types.is_datetime64_any_dtype(v):
+        return v.dt.floor(pd.Timedelta(every))
+    if isinstance(v, datetime):
+        return v - (v - _EPOCH) % every
+    return v - v % every
+
+
+class _Reduction:
+    """Reduced values of some fields, updated incrementally."""
+
+    __slots__ = ("reducers", "values")
+
+    def __init__(self, reducers: Tuple[Tuple[str, str], ...]):
+        self.reducers = reducers
+        self.values: Optional[Dict[str, Any]] = None  # nothing reduced yet
+
+    def add(self, values: Dict[str, Any]) -> None:
+        # values are already reduced (from a row, or from a frame)
+        if self.values is None:
+            self.values = {name: values[name] for name, _ in self.reducers}
+        else:
+            for name, reducer in self.reducers:
+                combine = REDUCERS[reducer][1]
+                self.values[name] = combine(self.values[name], values[name])
+
+    def add_frame(self, frame: pd.DataFrame) -> None:
+        if len(frame):
+            self.add(
+                {
+                    name: REDUCERS[reducer][0](frame[name])
+                    for name, reducer in self.reducers
+                }
+            )
+
+
+class Rollup:
+    """
+    Live aggregation of a collection in buckets of size `every` on the field `on`.
+
+    Completed buckets are appended, as crystals, to the `done` collection.
+    The bucket currently filling up is the `current` crystal.
+    Each append to the source collection only costs O(new rows).
+    """
+
+    def __init__(self, collection_type, _cls, reducers, on: str, every: Any):
+        self.on = on
+        self.every = every
+        self.done = collection_type()
+
+        self._cls = _cls
+        self._reducers = tuple((n, r) for n, r in reducers if n != on)
+        self._bucket: Any = None
+        self._current = _Reduction(self._reducers)
+
+    @property
+    def current(self) -> Any:
+        """The (partial) aggregation of the latest bucket, or None if nothing was aggregated yet."""
+        if self._current.values is None:
+            return None
+        return self._cls(**{self.on: self._bucket}, **self._current.values)
+
+    def _merge(self, bucket: Any, values: Dict[str, Any]) -> None:
+        if self._bucket is not None and bucket != self._bucket:
+            if bucket < self._bucket:
+                raise ValueError(f"{self.on} cannot go back to a previous bucket")
+            self.done(self.current)  # that bucket is now complete
+            self._current = _Reduction(self._reducers)
+        self._bucket = bucket
+        self._current.add(values)
+
+    def add_row(self, row: Dict[str, Any]) -> None:
+        self._merge(_floor(row[self.on], self.every), row)
+
+    def add_frame(self, frame: pd.DataFrame) -> None:
+        if not len(frame):
+            return
+        # vectorized per bucket in the new rows, then merged bucket per bucket
+        buckets = _floor(frame[self.on], self.every)
+        if self._reducers:
+            reduced = frame.groupby(buckets, sort=False).agg(dict(self._reducers))
+            for bucket, values in zip(reduced.index, reduced.to_dict("records")):
+                self._merge(bucket, values)
+        else:  # only the buckets themselves
+            for bucket in buckets.unique():
+                self._merge(bucket, {})
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,122 @@
+# Arrow interchange for collections, without building any crystal instance.
+# pyarrow is optional : this module is only imported when arrow is actually used.
+from dataclasses import fields
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ._columns import _optional_of
+
+ArrowLike = Union[pa.Table, pa.RecordBatch]
+
+
+def _arrow_type(tp: Any) -> Optional[pa.DataType]:
+    # the arrow type for a field type, or None when it is inferred from the values
+    tp = _optional_of(tp) or tp
+    if not isinstance(tp, type):
+        return None
+    if issubclass(tp, bool):
+        return pa.bool_()
+    if issubclass(tp, int):
+        return pa.int64()
+    if issubclass(tp, float):
+        return pa.float64()
+    if issubclass(tp, str):
+        return pa.string()
+    if issubclass(tp, datetime):
+        return pa.timestamp(
+            "ns"
+        )  # as in pandas, no conversion (see _timestamps for time zones)
+    if issubclass(tp, date):
+        return pa.date32()
+    if issubclass(tp, Decimal):
+        if getattr(tp, "decimal_places", None) is None:
+            # no arrow decimal without a fixed scale (nor for NaN, Infinity) : exact as str
+            return pa.string()
+        return pa.decimal128(getattr(tp, "max_digits", None) or 38, tp.decimal_places)
+    return None
+
+
+def _timestamps(name: str, col: pd.Series) -> Tuple[pd.Series, pa.DataType]:
+    # datetimes with a time zone keep it : an arrow column has one, as a pandas one
+    if col.dtype == object and any(getattr(v, "tzinfo", None) is not None for v in col):
+        col = pd.Series(
+            col.tolist(), index=col.index
+        )  # one time zone (and None) is inferred
+        if col.dtype == object:
+            raise ValueError(f"{name} values are in several time zones, not only one")
+    if getattr(col.dtype, "tz", None) is None:
+        return col, pa.timestamp("ns")
+    return col, pa.array(col.iloc[:0]).type
+
+
+def _to_arrow(_cls: Type[Any], frame: pd.DataFrame) -> pa.Table:
+    """
+    The columns of a collection as an arrow table, with a schema derived from the datacrystal field types.
+    Numeric and time columns are exported without copy, the arrow buffers are the column arrays.
+
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...     question: str = "What is the answer ?"
+    ...
+    >>> table = _to_arrow(Shard, pd.DataFrame({"answer": [42, 51], "question": ["Why ?", "What ?"]}))
+    >>> table.schema
+    answer: int64 not null
+    question: string not null
+    -- schema metadata --
+    datacrystal: 'Shard'
+    """
+    arrays, schema = [], []
+    for f in fields(_cls):
+        col = frame[f.name]
+        tp = _arrow_type(f.type)
+        if tp == pa.timestamp("ns"):
+            col, tp = _timestamps(f.name, col)
+        if tp == pa.string() and len(col) and col.dtype == object:
+            # decimals, or validated str (Note : Decimal('NaN') is not a missing value)
+            col = col.map(lambda v: v if v is None else str(v))
+        # Note : a float NaN is a value, not a missing one (only None is)
+        arr = pa.array(col, type=tp, from_pandas=tp != pa.float64())
+        # Note : a type cannot be inferred without values, they are all null then
+        nullable = _optional_of(f.type) is not None or pa.types.is_null(arr.type)
+        arrays.append(arr)
+        schema.append(pa.field(f.name, arr.type, nullable=nullable))
+
+    return pa.Table.from_arrays(
+        arrays, schema=pa.schema(schema, metadata={"datacrystal": _cls.__name__})
+    )
+
+
+def _from_arrow(data: ArrowLike) -> pd.DataFrame:
+    """
+    Columns from an arrow table (or record batch), to be validated as a collection.
+    Numeric and time columns without nulls are not copied, pandas arrays are views on the arrow buffers.
+    """
+    if isinstance(data, pa.RecordBatch):
+        data = pa.Table.from_batches([data])
+    if not isinstance(data, pa.Table):
+        raise TypeError(f"Cannot use {type(data).__name__} as an arrow table")
+    # split blocks : no consolidation, hence no copy
+    # ints with nulls as python objects, not as floats (losing precision)
+    frame = data.to_pandas(
+        split_blocks=True, date_as_object=True, integer_object_nulls=True
+    )
+    # floats with nulls as python objects too, None and NaN are different values
+    for name, column in zip(data.column_names, data.columns):
+        if pa.types.is_floating(column.type) and column.null_count:
+            values = frame[name].to_numpy(dtype=object)
+            values[np.asarray(column.is_null())] = None
+            frame[name] = pd.Series(values, index=frame.index, dtype=object)
+    return frame
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,232 @@
+# Compact binary formats, aware of datacrystal field types : packed structs for crystals, column blocks for collections.
+import functools
+import json
+import pickle
+import struct
+from dataclasses import fields
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from ._columns import _frame_of, _optional_of
+from ._mapped import _Column, _kind, _kinds
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# first byte of a packed crystal
+_PACKED, _PICKLED = 0, 1
+
+# struct codes of fixed width kinds (variable width values are prefixed by their length)
+_CODES = {"bool": "?", "int64": "q", "float64": "d", "datetime64[ns]": "q"}
+
+MAGIC = b"DCC\x01"
+_HEADER = struct.Struct("<4sI")  # magic, and json header size
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _layout(cls: Type[Any]) -> Tuple[struct.Struct, Tuple[Tuple[str, str], ...]]:
+    # struct of a crystal fixed part (tag, null mask, then fields), and kind of each field
+    layout = [(f.name, _kind(f.type) or "pickle") for f in fields(cls)]
+    nulls = (len(layout) + 7) // 8
+    codes = "".join(_CODES.get(kind, "I") for _, kind in layout)
+    return struct.Struct(f"<B{nulls}s{codes}"), tuple(layout)
+
+
+def _pack(elem: Any) -> bytes:
+    """
+    A crystal packed in a struct, with variable width values (str, Decimal, ...) appended after it.
+
+    >>> from decimal import Decimal
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Tick:
+    ...     ts: datetime
+    ...     price: Decimal
+    ...
+    >>> t = Tick(ts=datetime(2021, 1, 1), price=Decimal("1.5"))
+    >>> len(_pack(t))
+    17
+    >>> _unpack(Tick, _pack(t)) == t
+    True
+    """
+    cls = type(elem)
+    return _pack_row(cls, tuple(getattr(elem, n) for n, _ in _layout(cls)[1]))
+
+
+def _pack_row(
+    cls: Type[Any], values: Tuple[Any, ...], allow_pickle: bool = True
+) -> bytes:
+    """
+    The values of a crystal (in field order) packed, as _pack() does, without the crystal itself.
+    Without allow_pickle, values out of the packed representation raise ValueError instead of being pickled.
+    """
+    packer, layout = _layout(cls)
+    mask = 0
+    fixed: List[Any] = []
+    variable: List[bytes] = []
+    try:
+        for i, ((_, kind), v) in enumerate(zip(layout, values)):
+            if v is None:
+                mask |= 1 << i
+                fixed.append(0)
+            elif kind == "datetime64[ns]":
+                if v.tzinfo is not None or getattr(v, "nanosecond", 0):
+                    raise ValueError("Only naive datetimes in microseconds are packed")
+                fixed.append((v - _EPOCH) // _MICROSECOND)
+            elif kind in _CODES:
+                fixed.append(v)
+            elif kind == "pickle":
+                if not allow_pickle:
+                    raise ValueError(f"{type(v).__name__} values are only pickled")
+                raw = pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+                fixed.append(len(raw))
+                variable.append(raw)
+            else:
+                raw = str(v).encode()
+                fixed.append(len(raw))
+                variable.append(raw)
+        nulls = mask.to_bytes((len(layout) + 7) // 8, "little")
+        return packer.pack(_PACKED, nulls, *fixed) + b"".join(variable)
+    except (struct.error, ValueError, OverflowError):
+        # out of the packed representation (big ints, time zones...)
+        if not allow_pickle:
+            raise ValueError(f"{values} cannot be packed without pickle")
+        return bytes([_PICKLED]) + pickle.dumps(
+            tuple(values), protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+
+def _unpack(cls: Type[Any], raw: bytes, allow_pickle: bool = False) -> Any:
+    """
+    The crystal from its packed bytes. Values are not validated again.
+    Values out of the packed representation (big ints, time zones, fields of other types) are pickled,
+    and unpickling can run arbitrary code : they are only unpacked with allow_pickle=True, from bytes you trust.
+    """
+    return cls._from_trusted(*_unpack_row(cls, raw, allow_pickle))
+
+
+def _unpickled(raw: bytes, allow_pickle: bool) -> Any:
+    if not allow_pickle:
+        raise ValueError("Pickled values are only unpacked with allow_pickle=True")
+    return pickle.loads(raw)
+
+
+def _unpack_row(
+    cls: Type[Any], raw: bytes, allow_pickle: bool = False
+) -> Tuple[Any, ...]:
+    """The values of a crystal (in field order) from its packed bytes."""
+    packer, layout = _layout(cls)
+    if raw[0] == _PICKLED:
+        return _unpickled(raw[1:], allow_pickle)
+
+    _, nulls, *fixed = packer.unpack_from(raw)
+    mask = int.from_bytes(nulls, "little")
+    pos = packer.size
+    values = []
+    for i, ((_, kind), v) in enumerate(zip(layout, fixed)):
+        if kind in _CODES:
+            if kind == "datetime64[ns]":
+                v = _EPOCH + v * _MICROSECOND
+        else:
+            data = raw[pos : pos + v]
+            pos += v
+            if kind == "pickle":
+                v = _unpickled(data, allow_pickle)
+            elif kind == "decimal":
+                v = Decimal(data.decode())
+            else:
+                v = data.decode()
+        values.append(None if mask >> i & 1 else v)
+    return tuple(values)
+
+
+def _pack_columns(
+    cls: Type[Any], frame: pd.DataFrame, counts: Optional[np.ndarray] = None
+) -> bytes:
+    """
+    The columns of a collection in one block per column, after a json header.
+    Fixed width columns are their raw array bytes, variable width ones are utf-8 data and end offsets.
+    The counts of the rows of a bag, if any, are a last int64 block.
+    Raises TypeError if a field has no known column representation.
+    """
+    kinds = _kinds(cls)
+    header: Dict[str, Any] = {"crystal": cls.__name__, "length": len(frame)}
+    if counts is not None:
+        header["counts"] = True
+    columns, blocks = [], []
+    for f in fields(cls):
+        col = _Column(None, f.name, kinds[f.name], _optional_of(f.type) is not None)
+        values = frame[f.name]
+        encoded = col.encode(
+            values.to_numpy() if values.dtype != object else values.tolist()
+        )
+        columns.append(
+            {
+                "name": f.name,
+                "kind": col.kind,
+                "sizes": {e: len(b) for e, b in encoded.items()},
+            }
+        )
+        blocks.extend(encoded.values())
+    header["columns"] = columns
+    if counts is not None:
+        blocks.append(np.asarray(counts, dtype="<i8").tobytes())
+
+    head = json.dumps(header).encode()
+    return _HEADER.pack(MAGIC, len(head)) + head + b"".join(blocks)
+
+
+def _reduce(elem: Any) -> Tuple[Any, ...]:
+    # pickling crystals in their packed form (unpickling them is trusting them already)
+    return _unpack, (type(elem), _pack(elem), True)
+
+
+def _columns_header(raw: bytes) -> Tuple[Dict[str, Any], int]:
+    # the json header of packed columns, and its end position
+    magic, size = _HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError("Not a packed collection")
+    return json.loads(bytes(raw[_HEADER.size : _HEADER.size + size])), size
+
+
+def _unpack_counts(raw: bytes) -> Optional[np.ndarray]:
+    """The counts of rows packed from a bag (the last block), or None."""
+    header, _ = _columns_header(raw)
+    if not header.get("counts"):
+        return None
+    length = header["length"]
+    return np.frombuffer(raw, dtype="<i8", count=length, offset=len(raw) - 8 * length)
+
+
+def _unpack_columns(cls: Type[Any], raw: bytes) -> pd.DataFrame:
+    """Columns from their packed bytes. Fixed width columns without null are views on these bytes."""
+    header, size = _columns_header(raw)
+    kinds = _kinds(cls)
+    stored = {c["name"]: c["kind"] for c in header["columns"]}
+    if stored != kinds:
+        raise ValueError(f"Packed columns {stored} are not {cls.__name__} {kinds}")
+
+    length = header["length"]
+    view = memoryview(raw)
+    pos = _HEADER.size + size
+    series = {}
+    for f, c in zip(fields(cls), header["columns"]):
+        buffers = {}
+        for ext, n in c["sizes"].items():
+            buffers[ext] = view[pos : pos + n]
+            pos += n
+        col = _Column(None, f.name, c["kind"], _optional_of(f.type) is not None)
+        col.load(buffers, length)
+        series[f.name] = col.series(0, length)
+
+    return _frame_of(series, pd.RangeIndex(length))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
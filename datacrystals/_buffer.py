@@ -0,0 +1,309 @@
+# Append-only columnar storage backing collections.
+# One mutation point (append/extend), the DataFrame is only a (lazy) view of it.
+import sys
+from bisect import bisect_left, bisect_right
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ._columns import _frame_of
+from ._compact import _Incompressible
+
+DEFAULT_CHUNKSIZE = 4096
+
+
+def _reindexed(frame: pd.DataFrame) -> pd.DataFrame:
+    # a default RangeIndex, without copying data (reset_index would copy)
+    idx = frame.index
+    if isinstance(idx, pd.RangeIndex) and idx.start == 0 and idx.step == 1:
+        return frame
+    frame = frame.copy(deep=False)
+    frame.index = pd.RangeIndex(len(frame))
+    return frame
+
+
+def _optimized(
+    frame: pd.DataFrame, floats: AbstractSet[str], views: bool = False
+) -> pd.DataFrame:
+    # best dtypes pandas has for object columns (nullable ones only where there are nulls),
+    # and floats (losing precision) only where requested.
+    # Columns with a numpy dtype already are kept as they are : with views, not even copied (views on mapped files).
+    columns = {}
+    for name in frame.columns:
+        col = frame[name]
+        if name in floats:
+            columns[name] = col.astype("float64")
+        elif col.dtype != object:
+            columns[name] = col if views else col.copy()
+        else:
+            # Note : str stays object, a read-only string array cannot even be sliced
+            converted = col.convert_dtypes(convert_string=False)
+            numpy_dtype = getattr(converted.dtype, "numpy_dtype", None)
+            if (
+                numpy_dtype is not None
+                and numpy_dtype != object
+                and not converted.hasnans
+            ):
+                # numpy arrays, for batches, where there is no null to mask
+                converted = converted.astype(numpy_dtype)
+            # not converted, maybe not copied : we need our own (to make it read-only)
+            columns[name] = col.copy() if converted.dtype == col.dtype else converted
+    return _frame_of(columns, frame.index)
+
+
+def _readonly(frame: pd.DataFrame) -> pd.DataFrame:
+    # in place : the arrays backing the frame (and any view on them) cannot be written to anymore
+    for block in frame._mgr.blocks:
+        values = block.values
+        for arr in (
+            values,
+            getattr(values, "_data", None),
+            getattr(values, "_mask", None),
+            getattr(values, "_ndarray", None),
+        ):
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+    return frame
+
+
+def _column(values: List[Any]) -> Any:
+    # pandas would infer None among numbers as NaN (and ints as floats), that is not the appended value
+    if any(v is None for v in values):
+        return pd.Series(values, dtype=object)
+    return values
+
+
+class _ColumnBuffer:
+    """
+    Column-chunked, append-only buffer.
+
+    Rows are appended to one python list per column (amortized O(1)),
+    sealed into a DataFrame chunk every `chunksize` rows,
+    and all chunks are consolidated into one DataFrame only when it is actually needed.
+
+    >>> buf = _ColumnBuffer(["answer", "question"], chunksize=2)
+    >>> for a in range(5):
+    ...     buf.append((a, "What is it ?"))
+    >>> len(buf)
+    5
+    >>> buf.row(2)
+    (2, 'What is it ?')
+    >>> buf.slice(1, 4).answer.tolist()
+    [1, 2, 3]
+    >>> buf.searchsorted("answer", 3)
+    3
+    >>> buf.frame().answer.tolist()
+    [0, 1, 2, 3, 4]
+
+    With codecs (see _compact), sealed chunks are stored compactly, and decoded when read.
+    """
+
+    __slots__ = (
+        "columns",
+        "chunksize",
+        "codecs",
+        "_chunks",
+        "_starts",
+        "_sealed",
+        "_open",
+        "_pending",
+    )
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        frame: Optional[pd.DataFrame] = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        codecs: Optional[Dict[str, Any]] = None,
+    ):
+        self.columns = tuple(columns)
+        self.chunksize = chunksize
+        self.codecs = dict(codecs or {})  # per column
+
+        self._chunks: List[pd.DataFrame] = []
+        self._starts: List[int] = []  # position of the first row of each chunk
+        self._sealed = 0
+        # rows not sealed yet, one list per column
+        self._open: Tuple[List[Any], ...] = tuple([] for _ in self.columns)
+        self._pending = 0  # needed in case there is no column, we still count rows
+
+        if frame is not None:
+            self.extend(frame)
+
+    def __len__(self) -> int:
+        return self._sealed + self._pending
+
+    def append(self, row: Tuple[Any, ...]) -> None:
+        for col, v in zip(self._open, row):
+            col.append(v)
+        self._pending += 1
+
+        if self._pending >= self.chunksize:
+            self._seal()
+
+    def extend(self, frame: pd.DataFrame) -> None:
+        # Note : the frame is kept as a chunk, no copy is made here (unless it is encoded).
+        if len(frame):
+            self._seal()
+            self._chunks.append(self._encoded(frame))
+            self._starts.append(self._sealed)
+            self._sealed += len(frame)
+
+    def _seal(self) -> None:
+        if self._pending:
+            chunk = pd.DataFrame(
+                {n: _column(col) for n, col in zip(self.columns, self._open)},
+                columns=list(self.columns),
+                index=pd.RangeIndex(self._pending),
+            )
+            self._chunks.append(self._encoded(chunk))
+            self._starts.append(self._sealed)
+            self._sealed += self._pending
+
+            self._open = tuple([] for _ in self.columns)
+            self._pending = 0
+
+    def _encoded(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not self.codecs:
+            return frame
+        frame = frame.copy(deep=False)
+        for name, codec in list(self.codecs.items()):
+            try:
+                frame[name] = codec.encode(frame[name], self._chunks, name)
+            except _Incompressible:
+                # stored as is from now on, including previous chunks
+                for c in self._chunks:
+                    c[name] = codec.decode(c[name])
+                del self.codecs[name]
+        return frame
+
+    def _decoded(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not self.codecs:
+            return frame
+        frame = frame.copy(deep=False)
+        for name, codec in self.codecs.items():
+            frame[name] = codec.decode(frame[name])
+        return frame
+
+    def flush(self) -> None:
+        """Seal pending rows (nothing to write, all is in memory)."""
+        self._seal()
+
+    def nbytes(self) -> Dict[str, int]:
+        """Memory used by each column, as stored (shallow : python objects referenced are not counted)."""
+        sizes = {n: sys.getsizeof(col) for n, col in zip(self.columns, self._open)}
+        for chunk in self._chunks:
+            for n in self.columns:
+                sizes[n] += int(chunk[n].memory_usage(index=False, deep=False))
+        return sizes
+
+    def row(self, position: int) -> Tuple[Any, ...]:
+        """Values of one row, without consolidating the dataframe."""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+
+        if position >= self._sealed:
+            return tuple(col[position - self._sealed] for col in self._open)
+
+        c = bisect_right(self._starts, position) - 1
+        chunk, i = self._chunks[c], position - self._starts[c]
+        return tuple(
+            (
+                chunk[n].iat[i]
+                if n not in self.codecs
+                else self.codecs[n].value(chunk[n].iat[i])
+            )
+            for n in self.columns
+        )
+
+    def searchsorted(self, name: str, value: Any, side: str = "left") -> int:
+        """
+        Binary search of value in a column sorted in ascending order, across chunks and pending rows.
+        Same semantics as numpy.searchsorted, without consolidating the dataframe.
+        The column must not be encoded.
+        """
+        # first chunk whose last value is not before value
+        lo, hi = 0, len(self._chunks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            last = self._chunks[mid][name].iat[-1]
+            if last < value or (side == "right" and last == value):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self._chunks):
+            col = self._chunks[lo][name]
+            return self._starts[lo] + int(col.searchsorted(value, side=side))
+
+        pending = self._open[self.columns.index(name)]
+        bisect = bisect_right if side == "right" else bisect_left
+        return self._sealed + bisect(pending, value)
+
+    def slice(self, start: int, stop: int) -> pd.DataFrame:
+        """
+        Rows from start to stop, without consolidating the dataframe.
+        This is a view (no copy) when these rows are all in the same chunk.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+
+        pieces = []
+        for chunk, first in zip(self._chunks, self._starts):
+            a, b = max(start - first, 0), min(stop - first, len(chunk))
+            if a < b:
+                pieces.append(self._decoded(chunk.iloc[a:b]))
+        if stop > self._sealed:
+            a, b = max(start - self._sealed, 0), stop - self._sealed
+            pieces.append(
+                pd.DataFrame(
+                    {n: _column(col[a:b]) for n, col in zip(self.columns, self._open)},
+                    columns=list(self.columns),
+                    index=pd.RangeIndex(b - a),
+                )
+            )
+
+        if not pieces:
+            return pd.DataFrame(columns=list(self.columns))
+        if len(pieces) == 1:
+            return _reindexed(pieces[0])
+        return pd.concat(pieces, ignore_index=True)
+
+    def frame(self) -> pd.DataFrame:
+        """Consolidate all appended rows into one DataFrame (only done once per batch of appends)."""
+        self._seal()
+
+        if not self._chunks:
+            return pd.DataFrame(columns=list(self.columns))
+
+        if len(self._chunks) > 1:
+            self._chunks = [self._concat(self._chunks)]
+            self._starts = [0]
+        else:
+            self._chunks = [_reindexed(self._chunks[0])]
+
+        return self._decoded(self._chunks[0])
+
+    def _concat(self, chunks: List[pd.DataFrame]) -> pd.DataFrame:
+        if not self.codecs:
+            return pd.concat(chunks, ignore_index=True)
+        # column per column, for codecs to keep their compact representation
+        return pd.DataFrame(
+            {
+                n: (
+                    self.codecs[n].concat([c[n] for c in chunks])
+                    if n in self.codecs
+                    else pd.concat([c[n] for c in chunks], ignore_index=True)
+                )
+                for n in self.columns
+            },
+            columns=list(self.columns),
+        )
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -1,16 +1,84 @@
+import copyreg
 import functools
+import operator
+from array import array
 from collections.abc import Collection
-from dataclasses import asdict, fields
+from dataclasses import MISSING, fields
 from decimal import Decimal
-from typing import List, Type
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
-import hypothesis.strategies as st
+import numpy as np
 import pandas as pd
 
+from ._aggregate import REDUCERS, Rollup, _floor, _Reduction
+from ._binary import (
+    _pack_columns,
+    _pack_row,
+    _unpack_columns,
+    _unpack_counts,
+    _unpack_row,
+)
+from ._buffer import _ColumnBuffer, _optimized, _readonly, _reindexed
+from ._columns import ColumnsLike, _optional_of
+from ._compact import _codecs
+from ._display import _render_lines, display
+from ._index import _HashIndex, _RowSet
+from ._join import _join
+from ._mapped import _kinds, _MappedBuffer
+from ._parallel import _parallel
+from ._query import QUERY_CHUNKSIZE, Expression, _checked, _projection, _where, column
+from ._stream import _Stream
+from ._views import _batch_class, _row_view_class, _view_columns
+from ._wal import FRAME, ROW, _Log, _replay
 
-# Attempting to make this functional, the easy way.
-@functools.lru_cache(typed=True)
-def _collection_from_class(_cls):
+# a list keeps all crystals appended, a set only distinct ones, a bag distinct ones with their count
+KINDS = ("list", "set", "bag")
+
+
+class _CollectionType(type):
+    """
+    Type of collection types. These are built dynamically, and cannot be imported :
+    they are pickled as the crystal type and options they are built from.
+    """
+
+
+def _collection_type(_cls, options: Mapping[str, Any]):
+    # the same collection type, retrieved from cache, or built again in another process
+    return _collection_from_class(_cls, **options)
+
+
+copyreg.pickle(_CollectionType, lambda c: (_collection_type, (c.Inner, c._options)))
+
+
+def _restore(cls, data: Union[bytes, List[Any]], counts: Optional[array] = None):
+    # unpickling a collection, from its bytes, or from its crystals (and counts, for a bag)
+    inst = cls.from_bytes(data) if isinstance(data, bytes) else cls(*data)
+    if counts is not None:
+        inst._counts = counts
+    return inst
+
+
+def _collection_from_class(
+    _cls,
+    *,
+    key: Union[bool, str, Sequence[str], None] = None,
+    asynchronous: bool = False,
+    index: Optional[str] = None,
+    reducers: Optional[Mapping[str, str]] = None,
+    compact: bool = False,
+    kind: str = "list",
+):
     """
     >>> from datacrystals import datacrystal
     >>> @datacrystal
@@ -41,124 +109,1052 @@ def _collection_from_class(_cls):
     >>> collec2 == collec
     True
 
+    A hash index can be maintained on all fields (key=True), or on some of them, to make membership O(1):
+    >>> IndexedCollection = _collection_from_class(Shard, key="answer")
+    >>> collec3 = IndexedCollection(s1, s2)
+    >>> s1 in collec3
+    True
+    >>> collec3.lookup(51)
+    [1]
+
+    An asynchronous collection can be followed, as it grows, with `async for`:
+    >>> import asyncio
+    >>> StreamCollection = _collection_from_class(Shard, asynchronous=True)
+    >>> collec4 = StreamCollection(s1)
+    >>> async def consume():
+    ...     async for s in collec4:
+    ...         print(s.answer)
+    ...         if s.answer == 51:
+    ...             break
+    >>> async def produce():
+    ...     await collec4.put(s2)
+    >>> async def main():
+    ...     await asyncio.gather(consume(), produce())
+    >>> asyncio.run(main())
+    42
+    51
+
+    A collection can also be indexed on an ordered field (like time), appending in that order only,
+    to query it by binary search:
+    >>> TimeCollection = _collection_from_class(Shard, index="answer")
+    >>> collec5 = TimeCollection(s1, s2)
+    >>> collec5.asof(50)
+    Shard(answer=42, question='What is it ??')
+    >>> len(collec5.between(40, 60)), len(collec5.last(1))
+    (2, 1)
+
+    Declaring how each field is reduced ("first", "last", "max", "min" or "sum") allows aggregating a collection,
+    as a whole, or in buckets:
+    >>> SumCollection = _collection_from_class(Shard, reducers={"answer": "sum"})
+    >>> SumCollection(s1, s2).aggregate()
+    Shard(answer=93, question='What is the answer ?')
+
+    A collection can store its data compactly (small ints, categorical str, decimals as scaled int64),
+    and still give back the exact same values:
+    >>> CompactCollection = _collection_from_class(Shard, compact=True)
+    >>> list(CompactCollection(s1, s2)) == [s1, s2]
+    True
+
+    A collection can be stored in a directory, memory-mapped, to hold more than memory can:
+    >>> import tempfile
+    >>> stored = _collection_from_class(Shard).open(tempfile.mkdtemp())
+    >>> stored(s1).flush()[0]
+    Shard(answer=42, question='What is it ??')
+
+    Instead of a list, a collection can be a set, ignoring repeated crystals,
+    or a bag, counting them (in O(1), from the hash of rows):
+    >>> BagCollection = _collection_from_class(Shard, kind="bag")
+    >>> bag = BagCollection(s1, s2, s1)
+    >>> len(bag), bag.count(s1)
+    (2, 2)
+
+    Rows are selected, projected and sorted column per column, into new (typed) collections:
+    >>> from datacrystals import column
+    >>> collec = _collection_from_class(Shard)(s1, s2)
+    >>> [s.answer for s in collec.where(column("answer") > 50)]
+    [51]
+    >>> collec.sort_by("question").select("question")[0]
+    ShardQuestion(question='No but really ??')
     """
 
+    names = _cls.__crystal_fields__.names
+
+    # normalizing arguments, so that the same collection type is retrieved from cache
+    if key is None or key is False:
+        nkey = None
+    elif key is True:
+        nkey = names
+    else:
+        nkey = (key,) if isinstance(key, str) else tuple(key)
+        unknown = set(nkey).difference(names)
+        if unknown:
+            raise ValueError(f"{unknown} are not fields of {_cls.__name__}")
+
+    if index is not None and index not in names:
+        raise ValueError(f"{index} is not a field of {_cls.__name__}")
+
+    if kind not in KINDS:
+        raise ValueError(f"{kind} is not a collection kind: {KINDS}")
+
+    if reducers is None:
+        nreducers = None
+    else:
+        unknown = set(reducers).difference(names)
+        if unknown:
+            raise ValueError(f"{unknown} are not fields of {_cls.__name__}")
+        unknown = set(reducers.values()).difference(REDUCERS)
+        if unknown:
+            raise ValueError(f"{unknown} are not known reducers: {set(REDUCERS)}")
+        # None has no order, nor sum
+        nullable = {
+            f.name
+            for f in fields(_cls)
+            if _optional_of(f.type) is not None
+            and reducers.get(f.name) in ("max", "min", "sum")
+        }
+        if nullable:
+            raise ValueError(f"{nullable} are Optional, only first or last reduce them")
+        required = {
+            f.name
+            for f in fields(_cls)
+            if f.default is MISSING and f.default_factory is MISSING  # type: ignore
+        }
+        if required.difference(reducers):
+            raise ValueError(f"{required.difference(reducers)} need a reducer")
+        # in field order, and hashable
+        nreducers = tuple((n, reducers[n]) for n in names if n in reducers)
+
+    return _make_collection(
+        _cls, nkey, bool(asynchronous), index, nreducers, bool(compact), kind
+    )
+
+
+# Attempting to make this functional, the easy way.
+# Note : unbounded, a collection type is never built twice (an evicted one would be a different type).
+@functools.lru_cache(maxsize=None, typed=True)
+def _make_collection(
+    _cls,
+    key: Optional[Tuple[str, ...]],
+    asynchronous: bool,
+    index: Optional[str],
+    reducers: Optional[Tuple[Tuple[str, str], ...]],
+    compact: bool,
+    kind: str,
+):
+
     collection_attr = {}
 
-    @st.composite
-    def _collect_strategy(draw, cls, max_size=5):
-        tl = draw(st.lists(elements=_cls.strategy(), max_size=max_size))
-        return cls(*tl)
+    _names = _cls.__crystal_fields__.names
+    # Decimal fields, that may be converted to floats when optimizing
+    _decimals = set()
+    for f in fields(_cls):
+        tp = _optional_of(f.type) or f.type
+        if isinstance(tp, type) and issubclass(tp, Decimal):
+            _decimals.add(f.name)
+
+    def _row(elem: _cls) -> tuple:
+        # cheaper than asdict() (no recursive deepcopy), in the column order
+        return tuple(getattr(elem, n) for n in _names)
+
+    def _checked_row(elem: _cls) -> tuple:
+        # only crystals of this type are appended : they are validated already
+        if not isinstance(elem, _cls):
+            raise TypeError(f"{type(elem).__name__} is not a {_cls.__name__}")
+        return _row(elem)
+
+    def _collect_strategy(cls, max_size=5):
+        # hypothesis is only imported when a strategy is used
+        import hypothesis.strategies as st
+
+        return st.lists(elements=_cls.strategy(), max_size=max_size).map(
+            lambda tl: cls(*tl)
+        )
 
     collection_attr["strategy"] = classmethod(_collect_strategy)
 
-    def init(self, *inners: _cls):
-        # Reminder : this object is considered monotonic (only appending is possible via call)
-        df = pd.DataFrame.from_records(
-            [asdict(dc) for dc in inners],
-            columns=[f.name for f in fields(_cls)],
+    if key is not None:
+        _keypos = tuple(_names.index(k) for k in key)
+
+    if index is not None:
+        _ipos = _names.index(index)
+
+    def _logged(slf, kind: int, payload: bytes, rows: int):
+        # appended rows, as they were accepted (distinct already) : replaying them appends the same rows
+        slf._log.write(kind, payload, rows)
+        if slf._log.due:
+            slf._log.snapshot(_pack_columns(_cls, slf._df))
+
+    # the only two ways to add data, keeping the index up to date
+
+    def _append_row(slf, row: tuple):
+        if kind != "list":
+            found = slf._rows.find(row, slf._data.row)
+            if found is not None:  # already there
+                if kind == "bag":
+                    slf._counts[found] += 1
+                return
+
+        if slf._log is not None:
+            # packed first : a row that cannot be logged (nor replayed without pickle) is not appended
+            payload = _pack_row(_cls, row, allow_pickle=False)
+
+        if index is not None:
+            v = row[_ipos]
+            if v is None or (slf._last is not None and v < slf._last):
+                raise ValueError(f"{index} cannot go back from {slf._last} to {v}")
+
+        # Note : stored data may still reject the row (see _MappedBuffer), nothing is changed before
+        slf._data.append(row)
+        if index is not None:
+            slf._last = v
+        if kind != "list":
+            slf._rows.add(row, len(slf._data) - 1)
+            if kind == "bag":
+                slf._counts.append(1)
+        if slf._index is not None:
+            slf._index.add(tuple(row[p] for p in _keypos), len(slf._data) - 1)
+        if reducers is not None:
+            values = dict(zip(_names, row))
+            slf._reduction.add(values)
+            for r in slf._rollups:
+                r.add_row(values)
+        if asynchronous:
+            slf._stream.notify()
+        if slf._log is not None:
+            _logged(slf, ROW, payload, 1)
+
+    def _distinct(slf, frame: pd.DataFrame):
+        # rows of frame not already there (nor repeated in frame), as a frame, with their row tuples,
+        # their counts in frame, and the positions of rows already there, repeated
+        rows = (
+            zip(*(frame[n].tolist() for n in _names)) if _names else [()] * len(frame)
         )
+        keep: List[int] = []
+        new: dict = {}  # only this frame new rows, by ordinal
+        counts: List[int] = []
+        repeated: List[int] = []
+        for pos, row in enumerate(rows):
+            found = slf._rows.find(row, slf._data.row)
+            if found is not None:
+                repeated.append(found)
+            elif row in new:
+                counts[new[row]] += 1
+            else:
+                new[row] = len(keep)
+                keep.append(pos)
+                counts.append(1)
+        if len(keep) < len(frame):
+            frame = frame.iloc[keep].reset_index(drop=True)
+        return frame, list(new), counts, repeated
+
+    def _append_frame(slf, frame: pd.DataFrame):
+        if kind != "list":
+            frame, rows, counts, repeated = _distinct(slf, frame)
+
+        if slf._log is not None and len(frame):
+            # packed first : columns that cannot be logged are not appended
+            payload = _pack_columns(_cls, frame)
+
+        if index is not None and len(frame):
+            col = frame[index]
+            if (
+                col.isna().any()
+                or not col.is_monotonic_increasing
+                or (slf._last is not None and col.iat[0] < slf._last)
+            ):
+                raise ValueError(f"{index} must be appended in ascending order")
 
+        start = len(slf._data)
+        slf._data.extend(frame)
+        if index is not None and len(frame):
+            slf._last = frame[index].iat[-1]
+        if kind != "list":
+            for pos, row in enumerate(rows, start):
+                slf._rows.add(row, pos)
+            if kind == "bag":
+                slf._counts.extend(counts)
+                for pos in repeated:
+                    slf._counts[pos] += 1
+        if slf._index is not None:
+            slf._index.extend(frame, start)
+        if reducers is not None:
+            slf._reduction.add_frame(frame)
+            for r in slf._rollups:
+                r.add_frame(frame)
+        if asynchronous:
+            slf._stream.notify()
+        if slf._log is not None and len(frame):
+            _logged(slf, FRAME, payload, len(frame))
+
+    # also for other collection types to append checked data
+    collection_attr["_append_frame"] = _append_frame
+
+    def init(self, *inners: _cls):
+        # Reminder : this object is considered monotonic (only appending is possible via call)
         self.Inner = _cls
-        self._df = df
+        # Note : the index field is never encoded, to binary search it as is.
+        self._data = _ColumnBuffer(
+            _names, codecs=_codecs(_cls, exclude=index) if compact else None
+        )
+        self._index = None if key is None else _HashIndex(key)
+        if asynchronous:
+            self._stream = _Stream(maxlag=1024)
+        self._last = None  # last value of the index field
+        if kind != "list":
+            self._rows = _RowSet()  # hashes of distinct rows
+        if kind == "bag":
+            self._counts = array("q")  # count of each distinct row
+        self.__cache__ = {}  # derived representations, only growing along with data
+        self._log = None  # append log, for a durable collection
+        if reducers is not None:
+            self._reduction = _Reduction(reducers)
+            self._rollups: List[Rollup] = []
+        for dc in inners:
+            _append_row(self, _checked_row(dc))
 
-    collection_attr["__annotations__"] = {"Inner": Type, "_df": pd.DataFrame}
+    collection_attr["__annotations__"] = {
+        "Inner": Type,
+        "_data": _ColumnBuffer,
+        "_index": Optional[_HashIndex],
+        "__cache__": dict,
+    }
     collection_attr["__init__"] = init
+    collection_attr["Inner"] = _cls
+    collection_attr["_options"] = {
+        "key": key,
+        "asynchronous": asynchronous,
+        "index": index,
+        "reducers": None if reducers is None else dict(reducers),
+        "compact": compact,
+        "kind": kind,
+    }
+    collection_attr["key"] = key
+    collection_attr["asynchronous"] = asynchronous
+    collection_attr["index"] = index
+    collection_attr["reducers"] = None if reducers is None else dict(reducers)
+    collection_attr["compact"] = compact
+    collection_attr["kind"] = kind
+
+    # the dataframe is only consolidated from the append buffer when needed
+    def _df(slf) -> pd.DataFrame:
+        return slf._data.frame()
+
+    collection_attr["_df"] = property(_df)
+
+    # bulk constructors, validating per column instead of per instance
+
+    def from_columns(cls, columns: ColumnsLike):
+        """Build a collection from a dict of arrays, a record array or a dataframe, without building any instance."""
+        return cls().extend(columns)
+
+    collection_attr["from_columns"] = classmethod(from_columns)
+
+    def from_records(cls, records: Iterable[Any]):
+        """Build a collection from a record array, or an iterable of mappings or tuples (in field order)."""
+        if isinstance(records, np.ndarray):
+            return cls().extend(records)
+        # one list per column, validated as columns : pandas would turn ints with None into floats
+        records = list(records)
+        if records and isinstance(records[0], Mapping):
+            names = list(dict.fromkeys(k for r in records for k in r))
+            return cls().extend({n: [r.get(n) for r in records] for n in names})
+        for r in records:
+            if len(r) != len(_names):
+                raise ValueError(f"{r} does not have the {len(_names)} fields {_names}")
+        return cls().extend({n: [r[i] for r in records] for i, n in enumerate(_names)})
+
+    collection_attr["from_records"] = classmethod(from_records)
+
+    # binary format, also used for pickling
+
+    def to_bytes(self) -> bytes:
+        """
+        All rows in a compact binary format, one block per column.
+        The counts of a bag are stored along.
+        Raises TypeError if a field type has no known column representation,
+        ValueError for values out of it (ints beyond 64 bits, datetimes with a time zone).
+        """
+        return _pack_columns(_cls, self._df, self._counts if kind == "bag" else None)
+
+    collection_attr["to_bytes"] = to_bytes
+
+    def from_bytes(cls, raw: bytes):
+        """A collection from its bytes, not validated again. Numeric columns are views on these bytes."""
+        inst = _from_frame(cls, _unpack_columns(_cls, raw))
+        counts = _unpack_counts(raw)
+        if kind == "bag" and counts is not None:
+            inst._counts = array("q", counts.tobytes())
+        return inst
+
+    collection_attr["from_bytes"] = classmethod(from_bytes)
+
+    def pickled(self):
+        # Note : only data is pickled, not consumers, rollups, nor storage
+        try:
+            return _restore, (type(self), to_bytes(self))  # with counts
+        except (TypeError, ValueError):  # some fields have no column representation
+            counts = (self._counts,) if kind == "bag" else ()
+            return _restore, (type(self), list(self)) + counts
+
+    collection_attr["__reduce__"] = pickled
+
+    # arrow interchange (pyarrow is optional, only imported when used)
+
+    def to_arrow(self):
+        """
+        The collection as an arrow Table. Numeric and time columns are exported without copy.
+        Datetimes keep their time zone, raising ValueError if a field holds several of them.
+        """
+        from ._arrow import _to_arrow
+
+        return _to_arrow(_cls, self._df)
+
+    collection_attr["to_arrow"] = to_arrow
+
+    def from_arrow(cls, data):
+        """Build a collection from an arrow Table or RecordBatch, validated per column, without building any instance."""
+        from ._arrow import _from_arrow
+
+        # Note : arrow buffers are immutable, the columns viewing them are not copied
+        inst = cls()
+        _append_frame(inst, _cls.validate_columns(_from_arrow(data)))
+        return inst
+
+    collection_attr["from_arrow"] = classmethod(from_arrow)
+
+    def extend(self, data):
+        """
+        Append many rows at once, from columns or from an iterable of crystals.
+        Columns are copied once validated : changing them afterwards does not change the collection.
+        """
+        if isinstance(data, (pd.DataFrame, Mapping, np.ndarray)):
+            _append_frame(self, _cls.validate_columns(data).copy())
+        else:
+            for elem in data:
+                _append_row(self, _checked_row(elem))
+        return self
 
-    collection_attr["__cache__"] = {}
+    collection_attr["extend"] = extend
+
+    # persistent storage, memory-mapped
+
+    def _attach(slf, data):
+        # replacing the (empty) storage by data already stored, and catching up derived state
+        slf._data = data
+        if len(data):
+            if index is not None:
+                slf._last = data.row(len(data) - 1)[_ipos]
+            if slf._index is not None or reducers is not None or kind != "list":
+                frame = data.frame()
+                if kind != "list":
+                    # Note : stored rows are distinct already
+                    _, rows, _, _ = _distinct(slf, frame)
+                    for pos, row in enumerate(rows):
+                        slf._rows.add(row, pos)
+                if slf._index is not None:
+                    slf._index.extend(frame, 0)
+                if reducers is not None:
+                    slf._reduction.add_frame(frame)
+
+    def open_path(cls, path: str):
+        """
+        A collection stored in the directory `path` (created if it does not exist), memory-mapped.
+        Opening does not read data : only the columns and rows accessed later are paged in.
+        Except with a `key`, for a set, or with reducers : opening then reads all stored rows once,
+        to build the index, the distinct rows, or the reductions.
+        Appended rows are written every few thousand appends, and on flush().
+        """
+        if kind == "bag":
+            raise TypeError("A bag cannot be stored : counts would be lost")
+        inst = cls()
+        _attach(inst, _MappedBuffer(path, _cls))
+        return inst
+
+    collection_attr["open"] = classmethod(open_path)
+
+    def flush(self):
+        """Write appended rows to disk, for a stored or durable collection. Nothing to do otherwise."""
+        self._data.flush()
+        if self._log is not None:
+            self._log.commit()
+        return self
+
+    collection_attr["flush"] = flush
+
+    # durability in memory : an append log, and snapshots
+
+    def durable(
+        cls,
+        path: str,
+        fsync: str = "group",
+        group: int = 1024,
+        interval: float = 0.01,
+        snapshot_every: Optional[int] = 1 << 20,
+    ):
+        """
+        A collection in memory, logging every append in the directory `path` (created if it does not exist).
+        Opening loads the last snapshot, and replays only the log after it.
+        Appends are committed by groups of `group`, at most `interval` seconds after the first append of a group
+        (from a timer thread, even when appends pause), on flush(), and when the interpreter exits :
+        a crash only loses appends not committed yet. With fsync="group" each group is synced to disk,
+        with "always" each append is committed and synced on its own, with "never" nothing is synced.
+        Every `snapshot_every` rows logged, all rows are stored as columns and the log before them dropped.
+        Only one collection appends to a directory at a time.
+        """
+        if kind == "bag":
+            raise TypeError("A bag cannot be stored : counts would be lost")
+        header = {"crystal": _cls.__name__, **_kinds(_cls)}
+        inst = cls()
+
+        def replayed(k: int, raw: bytes):
+            if k == ROW:
+                _append_row(inst, _unpack_row(_cls, raw))
+            else:
+                _append_frame(inst, _unpack_columns(_cls, raw))
+
+        seq = _replay(path, header, functools.partial(replayed, FRAME), replayed)
+        inst._log = _Log(path, seq, header, fsync, group, interval, snapshot_every)
+        return inst
+
+    collection_attr["durable"] = classmethod(durable)
+
+    def snapshot(self):
+        """Store all rows of a durable collection as columns now, and drop the log before them."""
+        if self._log is None:
+            raise TypeError("Only a durable collection has snapshots")
+        self._log.snapshot(to_bytes(self))
+        return self
+
+    collection_attr["snapshot"] = snapshot
 
     # optimization interfacing with "lower compute libs"
-    def optimize(slf):
-        opt_copy = slf._df.copy(deep=True)
-        if len(opt_copy):
-            opt_copy.convert_dtypes()
-            # also convert decimal to floats, losing precision
-            for f in fields(_cls):
-                if f.type is Decimal:
-                    setattr(opt_copy, f, getattr(opt_copy, f).to_numpy("float64"))
+    def optimize(slf, floats: Iterable[str] = ()) -> pd.DataFrame:
+        """
+        The data with the best dtypes pandas has for it, computed once and cached on this collection.
+        After appends, only new rows are optimized. The returned frame is shared, and read-only.
+        Decimal fields listed in `floats` are converted to float64, losing precision.
 
-        return opt_copy
+        On a stored collection (see open()) nothing is cached : fixed width columns are kept as they are,
+        views on the mapped files, only other columns (read anyway) are converted.
+        """
+        floats = frozenset(floats)
+        unknown = set(floats.difference(_decimals))
+        if unknown:
+            raise ValueError(f"{unknown} are not Decimal fields of {_cls.__name__}")
+
+        if isinstance(slf._data, _MappedBuffer):
+            return _readonly(_optimized(slf._data.frame(), floats, views=True))
+
+        opt = slf.__cache__.get(("optimize", floats))
+        if opt is None:
+            opt = slf.__cache__[("optimize", floats)] = _ColumnBuffer(_names)
+        if len(opt) < len(slf._data):
+            opt.extend(_optimized(slf._data.slice(len(opt), len(slf._data)), floats))
+
+        # a new frame, so that replacing a column in it does not change the cache
+        return _readonly(opt.frame()).copy(deep=False)
 
     collection_attr["optimize"] = optimize
 
+    # queries on the index field, by binary search
+
+    def _from_frame(cls, frame: pd.DataFrame):
+        # a new collection of the same type, around frame (without copy)
+        inst = cls()
+        _append_frame(inst, frame)
+        return inst
+
+    def between(self, start, stop):
+        """Elements with an index between start and stop (both included), in O(log n)."""
+        a = self._data.searchsorted(index, start, side="left")
+        b = self._data.searchsorted(index, stop, side="right")
+        return _subset(self, self._data.slice(a, b), np.arange(a, b), type(self))
+
+    def asof(self, at):
+        """Last element with an index not after `at`, or None, in O(log n)."""
+        pos = self._data.searchsorted(index, at, side="right") - 1
+        return None if pos < 0 else _cls._from_trusted(*self._data.row(pos))
+
+    def last(self, n: int = 1):
+        """The `n` elements with the latest index."""
+        a = max(len(self._data) - n, 0)
+        return _subset(
+            self, self._data.slice(a, None), np.arange(a, len(self._data)), type(self)
+        )
+
+    if index is not None:
+        collection_attr["between"] = between
+        collection_attr["asof"] = asof
+        collection_attr["last"] = last
+
+    # aggregation, from the reducers declared per field
+
+    def aggregate(self):
+        """The whole collection reduced into one crystal (maintained on each append), or None if empty."""
+        values = self._reduction.values
+        return None if values is None else _cls(**values)
+
+    def _bucketing_on(on: Optional[str]) -> str:
+        on = index if on is None else on
+        if on not in _names:
+            raise ValueError(f"Cannot aggregate in buckets on {on}")
+        return on
+
+    def resample(self, every, on: Optional[str] = None):
+        """
+        A new collection, with one crystal per bucket of size `every` on the field `on` (the index by default).
+        That field holds the start of each bucket, other fields are reduced in one vectorized pass.
+        """
+        on = _bucketing_on(on)
+        frame = self._df
+        if not len(frame):
+            return type(self)()
+        buckets = _floor(frame[on], every)
+        others = {n: r for n, r in reducers if n != on}
+        if not others:  # only the buckets themselves
+            return type(self).from_columns({on: buckets.drop_duplicates()})
+        reduced = frame.groupby(buckets).agg(others)
+        return type(self).from_columns(reduced.reset_index())
+
+    def rollup(self, every, on: Optional[str] = None):
+        """
+        Live aggregation in buckets of size `every` on the index field (the only one appended in order).
+        Completed buckets are in the `done` collection of the returned Rollup, the latest one is `current`.
+        It is then maintained incrementally, on each append to this collection.
+        """
+        on = _bucketing_on(on)
+        if on != index:
+            raise ValueError(f"Cannot roll up on {on}, only on the index {index}")
+        r = Rollup(type(self), _cls, reducers, on, every)
+        r.add_frame(self._df)
+        self._rollups.append(r)
+        return r
+
+    if reducers is not None:
+        collection_attr["aggregate"] = aggregate
+        collection_attr["resample"] = resample
+        collection_attr["rollup"] = rollup
+
     # abc.Collection interface
 
     def contains(self, item: _cls):
-        # relying on index behavior
-        if len(self._df) > 0:
-            # Note : we cannot rely on functional behavior here, methods like __iter__ create new instances...
-            var = [getattr(self._df, f) == getattr(item, f) for f in fields(item)]
-            return all(var)  # Note: This returns True if there is no field
-        return False
+        # Note : we cannot rely on functional behavior here, methods like __iter__ create new instances...
+        if not isinstance(item, (_cls, _View)) or not len(self._data):
+            return False
+        row = _row(item)
+
+        if kind != "list":
+            return self._rows.find(row, self._data.row) is not None
+
+        if self._index is not None:
+            # O(1) lookup, then comparing fields not in key on matching rows only
+            positions = self._index.get(tuple(row[p] for p in _keypos))
+            if len(key) == len(_names):
+                return bool(positions)
+            return any(self._data.row(p) == row for p in positions)
+
+        # one vectorized comparison per field, and per row answer
+        df = self._df
+        found = np.ones(len(df), dtype=bool)
+        for n, v in zip(_names, row):
+            col = df[n]
+            if v is None:  # never equal to anything, with ==
+                if col.dtype == object:
+                    found &= np.fromiter((x is None for x in col), bool, len(col))
+                else:  # stored as NaN (or NaT)
+                    found &= col.isna().to_numpy()
+            else:
+                found &= (col == v).to_numpy(dtype=bool)
+        return bool(found.any())
 
     collection_attr["__contains__"] = contains
 
+    def count(self, item: _cls) -> int:
+        """How many times this crystal was appended to the bag, in O(1)."""
+        found = self._rows.find(_row(item), self._data.row)
+        return 0 if found is None else self._counts[found]
+
+    def counts(slf) -> np.ndarray:
+        # a copy : the counts array cannot grow while a view exports its buffer
+        return np.array(slf._counts, dtype="int64")
+
+    if kind == "bag":
+        collection_attr["count"] = count
+        collection_attr["counts"] = property(
+            counts, doc="Count of each distinct crystal, aligned with rows."
+        )
+
+    def lookup(self, *values) -> List[int]:
+        """Positions of rows matching the key values, in O(1) via the index."""
+        return self._index.get(values)
+
+    if key is not None:  # only available if there is an index
+        collection_attr["lookup"] = lookup
+
     def iter(self):
-        for i in self._df.itertuples(index=True):
-            # dropping index (needed in case class has no attrs, we technically still have an instance)
-            attr = {a: v for a, v in i._asdict().items() if a != "Index"}
-            yield _cls(
-                **attr
-            )  # TODO : functional behavior on instance creation to simplify things ???
+        # slice by slice, not to consolidate (or load, if stored) everything at once
+        step = self._data.chunksize
+        for start in range(0, len(self._data), step):
+            frame = self._data.slice(start, start + step)
+            # with the index, for rows to exist even if the crystal has no field
+            # rows were validated on the way in : no validation here
+            for _, *row in frame.itertuples(index=True, name=None):
+                yield _cls._from_trusted(*row)
 
     collection_attr["__iter__"] = iter
 
+    def getitem(self, at: Union[int, slice]):
+        """The crystal at a position, or a collection of the same type with a slice of rows (not copied)."""
+        if isinstance(at, slice):
+            start, stop, step = at.indices(len(self._data))
+            positions = np.arange(start, stop, step)
+            if step == 1:
+                frame = self._data.slice(start, stop)
+                return _subset(self, frame, positions, type(self))
+            if not len(positions):
+                return type(self)()
+            lo = positions.min()
+            frame = self._data.slice(lo, positions.max() + 1)
+            frame = frame.iloc[positions - lo].reset_index(drop=True)
+            return _subset(self, frame, positions, type(self))
+        return _cls._from_trusted(*self._data.row(at))
+
+    collection_attr["__getitem__"] = getitem
+
+    _View = _row_view_class(_cls)
+
+    def rows(self):
+        """
+        Iterate on read-only row views, directly backed by the column arrays (times are read as datetimes).
+        No instance is built unless materialize() is called on a view, and none is validated again.
+        """
+        df = self._df
+        columns = _view_columns(df, _names)
+        for pos in range(len(df)):
+            yield _View(columns, pos)
+
+    collection_attr["rows"] = rows
+    collection_attr["View"] = _View
+
+    _Batch = _batch_class(_cls)
+
+    def iter_batches(self, size: int, optimized: bool = False):
+        """
+        Iterate on batches of up to `size` rows, each exposing its fields as numpy arrays.
+        These are slices of the (optionally optimized) dataframe, no data is copied.
+        """
+        if size < 1:
+            raise ValueError(f"Batch size must be positive, not {size}")
+        df = self.optimize() if optimized else self._df
+        for start in range(0, len(df), size):
+            yield _Batch(df.iloc[start : start + size], start)
+
+    collection_attr["iter_batches"] = iter_batches
+    collection_attr["Batch"] = _Batch
+
+    # python functions over all crystals, optionally in parallel
+
+    def pmap(
+        self,
+        fn: Callable[[_cls], Any],
+        into: Optional[Type] = None,
+        workers: Optional[int] = 1,
+    ):
+        """
+        A collection of `into` crystals (by default, of this type), with the results of fn on each crystal, in order.
+        With several workers (None for all cores), shards of the columns are sent to a process pool in shared memory.
+        """
+        out = type(self) if into is None else _collection_from_class(into)
+        results = _parallel("map", _cls, self._data, fn, out.Inner, workers=workers)
+        inst = out()
+        for shard in results:
+            if isinstance(shard, bytes):  # already checked, in the worker
+                inst._append_frame(_unpack_columns(out.Inner, shard))
+                continue
+            for elem in shard:
+                if not isinstance(elem, out.Inner):
+                    raise TypeError(
+                        f"{fn} returned a {type(elem).__name__}, not a {out.Inner.__name__}"
+                    )
+            inst.extend(shard)
+        return inst
+
+    def pfilter(self, fn: Callable[[_cls], bool], workers: Optional[int] = 1):
+        """A collection of the same type, with the crystals for which fn is true, in order."""
+        mask = np.concatenate(
+            _parallel("filter", _cls, self._data, fn, workers=workers)
+        )
+        frame = self._data.slice(0, len(self._data))
+        return _subset(
+            self, frame[mask].reset_index(drop=True), np.flatnonzero(mask), type(self)
+        )
+
+    def preduce(
+        self,
+        fn: Callable[[Any, _cls], Any],
+        initial: Any,
+        combine: Optional[Callable[[Any, Any], Any]] = None,
+        workers: Optional[int] = 1,
+    ):
+        """
+        fn applied cumulatively to the crystals, from `initial`, as functools.reduce does.
+        In parallel, each shard is reduced from `initial`, then shard results are combined in order with `combine`.
+        """
+        if combine is None:
+            if workers != 1:
+                raise ValueError(
+                    "A combine function is needed to reduce with several workers"
+                )
+            combine = fn
+        results = _parallel("reduce", _cls, self._data, fn, initial, workers=workers)
+        return functools.reduce(combine, results)
+
+    collection_attr["map"] = pmap
+    collection_attr["filter"] = pfilter
+    collection_attr["reduce"] = preduce
+
+    # queries, vectorized over columns (see _query)
+
+    def _subset(slf, frame: pd.DataFrame, positions: np.ndarray, into):
+        # a new collection of these rows (and, in a bag, of their counts)
+        inst = into()
+        inst._append_frame(frame)
+        if kind == "bag":
+            inst._counts = array("q", np.array(slf._counts)[positions].tobytes())
+        return inst
+
+    def where(self, *predicates, **values):
+        """
+        A collection of the same type, with the rows matching all predicates, and with these field values.
+        Predicates are expressions on fields (see column()), evaluated on whole columns at once,
+        a chunk at a time for a stored collection. A None value matches missing values, as column(n).isnull().
+        """
+        exprs = list(predicates) + [
+            column(n).isnull() if v is None else column(n) == v
+            for n, v in values.items()
+        ]
+        if not exprs:
+            raise ValueError("No predicate to select rows with")
+        for e in exprs:
+            if not isinstance(e, Expression):
+                raise TypeError(f"{e!r} is not an expression on fields, see column()")
+        expr = _checked(functools.reduce(operator.and_, exprs), _cls)
+
+        if isinstance(self._data, _MappedBuffer):
+            chunksize = QUERY_CHUNKSIZE
+        else:  # in memory, evaluated on the whole buffer at once
+            chunksize = max(len(self._data), 1)
+        frame, positions = _where(self._data, expr, chunksize)
+        return _subset(self, frame, positions, type(self))
+
+    def select(self, *names: str):
+        """
+        A collection of the projection of each row on these fields, as crystals with only these fields.
+        Columns are not copied. In a set (or a bag) rows that become equal are merged (and counted).
+        """
+        if not names:
+            raise ValueError("No field to select")
+        into = _collection_from_class(_projection(_cls, names), kind=kind)
+        df = self._df
+        if (
+            kind == "bag"
+        ):  # each row as many times as it is counted, to count projected rows
+            df = df.take(np.repeat(np.arange(len(df)), self._counts))
+        # Note : a dataframe built from series, pandas does not copy them
+        # Columns in the order of the projected fields (the ones without default come first)
+        frame = pd.DataFrame(
+            {n: df[n] for n in into.Inner.__crystal_fields__.names}, copy=False
+        )
+        inst = into()
+        inst._append_frame(_reindexed(frame))
+        return inst
+
+    def sort_by(self, *names: str, descending: bool = False):
+        """
+        A collection of the rows sorted by these fields (stable, None last).
+        Sorted otherwise than by its index, the collection has no index anymore.
+        """
+        unknown = set(names).difference(_names)
+        if unknown or not names:
+            raise ValueError(f"{unknown or 'No field'} to sort {_cls.__name__} by")
+        df = self._df
+        order = df.sort_values(
+            list(names), ascending=not descending, kind="stable", na_position="last"
+        ).index.to_numpy()
+
+        into = type(self)
+        if index is not None and (names[0] != index or descending):
+            into = _collection_from_class(_cls, **{**self._options, "index": None})
+        return _subset(self, df.take(order).reset_index(drop=True), order, into)
+
+    collection_attr["where"] = where
+    collection_attr["select"] = select
+    collection_attr["sort_by"] = sort_by
+
+    def join(
+        self,
+        other,
+        on: Union[str, Sequence[str]],
+        how: str = "inner",
+        by: Union[str, Sequence[str]] = (),
+    ):
+        """
+        A collection of combined crystals, with the fields of both crystal types, from matching rows.
+
+        how="inner" : each pair of rows with equal `on` fields (one name, or several).
+        how="left" : also rows of this collection without match, fields of the other one are None.
+        how="asof" : each row of this collection, with the last row of the other one not after it on the
+        (ordered) `on` field, among rows with equal `by` fields, if any.
+
+        Fields of other named as fields of this collection are suffixed with its crystal type name.
+        Equal keys are found by sort-merge (binary search) when the keys of other are sorted already,
+        or much fewer than ours, by hashing all keys otherwise.
+        """
+        on = (on,) if isinstance(on, str) else tuple(on)
+        by = (by,) if isinstance(by, str) else tuple(by)
+        # each row of a bag as many times as it is counted
+        lframe, rframe = (
+            (
+                c._df.take(np.repeat(np.arange(len(c._df)), c._counts))
+                if c._options["kind"] == "bag"
+                else c._df
+            )
+            for c in (self, other)
+        )
+        combined, frame = _join(_cls, other.Inner, lframe, rframe, on, how, by)
+        inst = _collection_from_class(combined)()
+        inst._append_frame(frame)
+        return inst
+
+    collection_attr["join"] = join
+
     def llen(self):
-        return len(self._df)
+        # no need to consolidate the dataframe here
+        return len(self._data)
 
     collection_attr["__len__"] = llen
 
     def _dir(slf) -> List[str]:
 
-        exposed = ["strategy", "Inner", "optimize"]
+        exposed = [
+            "strategy",
+            "Inner",
+            "optimize",
+            "render_lines",
+            "extend",
+            "open",
+            "durable",
+            "snapshot",
+            "flush",
+            "from_columns",
+            "from_records",
+            "to_arrow",
+            "from_arrow",
+            "to_bytes",
+            "from_bytes",
+            "rows",
+            "View",
+            "iter_batches",
+            "Batch",
+            "map",
+            "filter",
+            "reduce",
+            "where",
+            "select",
+            "sort_by",
+            "join",
+        ]
+        if key is not None:
+            exposed += ["key", "lookup"]
+        if asynchronous:
+            exposed += ["maxlag", "tail", "put"]
+        if index is not None:
+            exposed += ["index", "between", "asof", "last"]
+        if reducers is not None:
+            exposed += ["reducers", "aggregate", "resample", "rollup"]
+        if compact:
+            exposed += ["compact"]
+        if kind != "list":
+            exposed += ["kind"]
+        if kind == "bag":
+            exposed += ["count", "counts"]
 
         # and expose fields
-        inner_fields = [f.name for f in fields(slf.Inner)]
-
-        return exposed + inner_fields
+        return exposed + list(_names)
 
     collection_attr["__dir__"] = _dir
 
-    # However we may have more appropriate human display
-    try:
-        from tabulate import tabulate
+    # Human friendly display, only reading the rows shown
 
-        def strtab(slf):
-            optdf = slf.optimize()
+    def render_lines(self, head: Optional[int] = None, tail: Optional[int] = None):
+        """
+        Lines describing the collection (length, dtype and memory per field) then a table of its rows, lazily.
+        All rows by default, a chunk at a time, to stream a full dump to a file.
+        Otherwise, only the first `head` and last `tail` rows.
+        """
+        return _render_lines(self, _cls, head, tail)
 
-            # Human friendly display of dataclasses
-            typename = type(slf).__name__
-            lines = [f"{typename}", "-" * len(typename)]
+    collection_attr["render_lines"] = render_lines
 
-            tablines = tabulate(optdf, headers="keys", tablefmt="psql")
+    def strtab(slf):
+        # all rows of a small collection, only the first and last ones of a large one
+        if len(slf._data) <= display.max_rows:
+            return "\n".join(_render_lines(slf, _cls))
+        return "\n".join(_render_lines(slf, _cls, display.head, display.tail))
 
-            return "\n".join(lines) + "\n" + tablines
+    collection_attr["__str__"] = strtab
 
-        collection_attr["__str__"] = strtab
+    def call(self, elem: _cls):
+        # amortized O(1) : the dataframe is not copied on each call
+        _append_row(self, _checked_row(elem))
+        return self
 
-    except ImportError:
+    collection_attr["__call__"] = call
 
-        def strraw(slf):
-            optdf = slf.optimize()
+    # async interface, following the flow of time
 
-            # Human friendly display of dataclasses
-            typename = type(slf).__name__
-            lines = [f"{typename}", "-" * len(typename)]
+    async def _follow(self, start: int):
+        cursor = self._stream.follow(start)
+        try:
+            while True:
+                # everything appended since last wakeup, without consolidating the dataframe
+                while cursor.pos < len(self._data):
+                    row = self._data.row(cursor.pos)
+                    cursor.pos += 1
+                    self._stream.advanced(len(self._data))
+                    yield _cls._from_trusted(*row)
+                await self._stream.appended()
+        finally:
+            self._stream.forget(cursor, len(self._data))
 
-            for i in optdf:
-                lines.append(str(i))
-            return "\n".join(lines)
+    def aiter(self):
+        # from the first element, then waiting for the next ones
+        return _follow(self, 0)
 
-        collection_attr["__str__"] = strraw
+    def tail(self, last: int = 0):
+        """Asynchronously iterate from the `last` most recent elements, then on each new one."""
+        return _follow(self, max(len(self._data) - last, 0))
 
-    def call(self, elem: _cls):
-        self._df = self._df.append(asdict(elem))
+    async def put(self, elem: _cls):
+        """Append, then wait until the slowest consumer is at most `maxlag` elements behind."""
+        call(self, elem)
+        await self._stream.drained(len(self._data))
         return self
 
-    collection_attr["__call__"] = call
+    def _maxlag(slf) -> int:
+        return slf._stream.maxlag
+
+    def _set_maxlag(slf, maxlag: int):
+        slf._stream.maxlag = maxlag
+
+    if asynchronous:
+        collection_attr["maxlag"] = property(_maxlag, _set_maxlag)
+        collection_attr["__aiter__"] = aiter
+        collection_attr["tail"] = tail
+        collection_attr["put"] = put
 
     # Collection interface is respected, but we dont want to inherit from collection (inheritance hierarchy not needed)
-    Collec = type(_cls.__name__ + "Collection", (), collection_attr)
+    Collec = _CollectionType(_cls.__name__ + "Collection", (), collection_attr)
 
     return Collec
 
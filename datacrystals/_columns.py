@@ -0,0 +1,359 @@
+# Column-wise (vectorized) validation of data against datacrystal field types.
+# This avoids building (and validating) one crystal instance per row when data is already columnar.
+import operator
+from dataclasses import MISSING, fields
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+ColumnsLike = Union[pd.DataFrame, Mapping[str, Any], np.ndarray]
+
+
+class ColumnsValidationError(ValueError):
+    """
+    Raised when some values in columns do not validate against the datacrystal field types.
+    `rows` holds the (sorted) positions of invalid rows, `errors` the invalid positions per field.
+    """
+
+    def __init__(self, errors: Dict[str, np.ndarray]):
+        self.errors = errors
+        self.rows = np.unique(np.concatenate(list(errors.values())))
+        super().__init__(
+            "; ".join(
+                f"{name}: {len(pos)} invalid value(s) at rows {pos[:10].tolist()}"
+                for name, pos in errors.items()
+            )
+        )
+
+
+def _optional_of(tp: Any) -> Any:
+    # Optional[T] is Union[T, None], returns T, or None if tp is not Optional
+    # Note: typing.get_origin / get_args are not available in python 3.7
+    if getattr(tp, "__origin__", None) is Union:
+        args = [a for a in tp.__args__ if a is not type(None)]
+        if len(args) == 1 and len(args) < len(tp.__args__):
+            return args[0]
+    return None
+
+
+def _frame_of(
+    columns: Dict[str, Any], index: Optional[pd.Index] = None
+) -> pd.DataFrame:
+    # a dataframe of these columns, as they are : not copied, not converted
+    # Note : no columns argument, pandas would convert every column to objects first
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def _to_decimal(v: Any) -> Optional[Decimal]:
+    # same as pydantic : going through str avoids float representation artefacts
+    try:
+        return v if isinstance(v, Decimal) else Decimal(str(v))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _parsed(parse: Callable[[Any], Any], v: Any) -> Any:
+    # same as pydantic : ISO strings, epoch numbers (UTC), datetimes (as dates for date fields)
+    try:
+        return parse(v)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _nulls(tp: Any, col: pd.Series) -> np.ndarray:
+    """
+    Missing values of a column for a field type : None, or NaN / NaT where they are not values of the type.
+    A float NaN is a valid float (as in pydantic), only None is missing for floats.
+    Decimal('NaN') is a valid decimal, not a missing value.
+
+    >>> _nulls(float, pd.Series([1.0, float("nan"), None], dtype=object)).tolist()
+    [False, False, True]
+    >>> _nulls(int, pd.Series([1.0, float("nan")])).tolist()
+    [False, True]
+    """
+    tp = _optional_of(tp) or tp
+    if isinstance(tp, type) and issubclass(tp, float):
+        if col.dtype != object:
+            return np.zeros(len(col), dtype=bool)
+        return col.map(lambda v: v is None or v is pd.NA).to_numpy(dtype=bool)
+    nulls = col.isna().to_numpy()
+    if nulls.any() and col.dtype == object:
+        nulls &= ~col.map(lambda v: isinstance(v, Decimal)).to_numpy(dtype=bool)
+    return nulls
+
+
+# strings (and numbers) accepted as booleans, the same as pydantic
+_BOOLS = {
+    **dict.fromkeys(["0", "off", "f", "false", "n", "no"], False),
+    **dict.fromkeys(["1", "on", "t", "true", "y", "yes"], True),
+}
+
+
+def _to_bool(v: Any) -> Optional[bool]:
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, bytes):
+        v = v.decode(errors="replace")
+    if isinstance(v, str):
+        return _BOOLS.get(v.lower())
+    try:
+        return {0: False, 1: True}.get(v)
+    except TypeError:  # not hashable
+        return None
+
+
+def _decimal_places(d: Decimal) -> Tuple[int, int]:
+    # (digits, decimals) of a finite decimal, counted the same way as pydantic
+    _, digit_tuple, exponent = d.as_tuple()
+    if exponent >= 0:
+        return len(digit_tuple) + exponent, 0
+    decimals = -exponent
+    return max(len(digit_tuple), decimals), decimals
+
+
+def _int_column(col: pd.Series) -> pd.Series:
+    # int64 whenever possible, python ints otherwise (like pydantic, without overflow)
+    if not len(col) or (-(2 ** 63) <= col.min() and col.max() < 2 ** 63):
+        return col.astype("int64")
+    return col.map(int).astype(object)
+
+
+_BOUNDS = (
+    ("gt", operator.gt),
+    ("ge", operator.ge),
+    ("lt", operator.lt),
+    ("le", operator.le),
+)
+
+
+def _constraints(tp: Any, values: np.ndarray, invalid: np.ndarray) -> np.ndarray:
+    # vectorized checks of pydantic's constrained types (conint, confloat, condecimal, constr)
+    for attr, op in _BOUNDS:
+        bound = getattr(tp, attr, None)
+        if bound is not None:
+            invalid |= ~op(values, bound).astype(bool)
+
+    multiple_of = getattr(tp, "multiple_of", None)
+    if multiple_of is not None:
+        invalid |= (values % multiple_of != 0).astype(bool)
+
+    max_digits = getattr(tp, "max_digits", None)
+    decimal_places = getattr(tp, "decimal_places", None)
+    if max_digits is not None or decimal_places is not None:
+        places = np.array([_decimal_places(d) for d in values], dtype="int64")
+        digits, decimals = places.reshape(-1, 2).T
+        if max_digits is not None:
+            invalid |= digits > max_digits
+        if decimal_places is not None:
+            invalid |= decimals > decimal_places
+        if max_digits is not None and decimal_places is not None:
+            invalid |= digits - decimals > max_digits - decimal_places
+
+    return invalid
+
+
+def _coerce(tp: Any, col: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    """
+    Coerce a full column to the field type, in one pass.
+    Returns the coerced column and the mask of invalid values (the column is not coerced if any is invalid).
+
+    >>> col, invalid = _coerce(int, pd.Series([1.0, 2.0]))
+    >>> col.tolist(), invalid.tolist()
+    ([1, 2], [False, False])
+    >>> col, invalid = _coerce(int, pd.Series([1.5, 2, None]))
+    >>> invalid.tolist()
+    [True, False, True]
+    """
+
+    nulls = _nulls(tp, col)
+
+    inner = _optional_of(tp)
+    if inner is not None:
+        if nulls.any():
+            coerced, inner_invalid = _coerce(inner, col[~nulls])
+            invalid = np.zeros(len(col), dtype=bool)
+            invalid[~nulls] = inner_invalid
+
+            values = np.full(len(col), None, dtype=object)
+            values[~nulls] = coerced.to_numpy(dtype=object)
+            return pd.Series(values, index=col.index, dtype=object), invalid
+        tp = inner
+
+    if not isinstance(tp, type):  # no vectorized validation known for this type
+        return col, nulls
+
+    if issubclass(tp, bool):
+        if pd.api.types.is_bool_dtype(col):
+            coerced = col
+            invalid = nulls
+        elif pd.api.types.is_numeric_dtype(col):
+            invalid = ~col.isin([0, 1]).to_numpy()
+            coerced = col.where(~invalid, 0).astype(bool)
+        else:
+            # "yes", "off", ... as pydantic
+            values = col.map(_to_bool)
+            invalid = values.isna().to_numpy()
+            coerced = values.where(~invalid, False).astype(bool)
+
+    elif issubclass(tp, int):
+        if pd.api.types.is_integer_dtype(col) or pd.api.types.is_bool_dtype(col):
+            coerced = col if pd.api.types.is_integer_dtype(col) else col.astype("int64")
+            invalid = nulls.copy()
+        elif col.map(lambda v: type(v) is int).all():
+            # python ints, that might not fit in 64 bits
+            coerced = _int_column(col)
+            invalid = nulls.copy()
+        else:
+            num = pd.to_numeric(col, errors="coerce")
+            # strict : no silent truncation of non integral values
+            invalid = (num.isna() | (num != np.floor(num))).to_numpy()
+            coerced = _int_column(num.where(~invalid, 0))
+        invalid = _constraints(tp, coerced.to_numpy(), invalid)
+
+    elif issubclass(tp, float):
+        coerced = pd.to_numeric(col, errors="coerce").astype("float64")
+        # Note : NaN is a valid float, only values that are not numbers are invalid
+        invalid = coerced.isna().to_numpy() & ~col.isna().to_numpy()
+        invalid = _constraints(tp, coerced.to_numpy(), invalid)
+
+    elif issubclass(tp, Decimal):
+        values = np.array([_to_decimal(v) for v in col], dtype=object)
+        invalid = values == None  # noqa: E711 (elementwise)
+        if tp is not Decimal:  # constrained decimals must be finite
+            invalid |= ~np.array(
+                [v is not None and v.is_finite() for v in values], dtype=bool
+            )
+        invalid = _constraints(tp, np.where(invalid, Decimal(0), values), invalid)
+        coerced = pd.Series(values, index=col.index, dtype=object)
+
+    elif issubclass(tp, str):
+        # numbers are accepted and displayed as str, like pydantic does
+        is_str = col.map(type).eq(str).to_numpy()
+        invalid = ~(
+            is_str | col.map(lambda v: isinstance(v, (int, float, Decimal))).to_numpy()
+        )
+        invalid |= nulls
+        coerced = col if is_str.all() else col.where(is_str | invalid, col.astype(str))
+        coerced = coerced.astype(object)
+
+        lengths = coerced.where(~invalid, "").str.len().to_numpy()
+        min_length = getattr(tp, "min_length", None)
+        if min_length is not None:
+            invalid |= lengths < min_length
+        max_length = getattr(tp, "max_length", None)
+        if max_length is not None:
+            invalid |= lengths > max_length
+        regex = getattr(tp, "regex", None)
+        if regex is not None:
+            matching = coerced.where(~invalid, "").str.match(regex)
+            invalid |= ~matching.to_numpy(dtype=bool)
+
+    elif issubclass(tp, date):  # and datetime
+        if issubclass(tp, datetime) and pd.api.types.is_datetime64_any_dtype(col):
+            coerced = col
+            invalid = nulls.copy()
+        else:
+            # Note : pydantic is optional, only imported when parsing is needed
+            from pydantic.datetime_parse import parse_date, parse_datetime
+
+            parse = parse_datetime if issubclass(tp, datetime) else parse_date
+            values = [_parsed(parse, v) for v in col]
+            invalid = np.array([v is None for v in values], dtype=bool)
+            # datetime64 when possible, as for appended rows
+            coerced = pd.Series(
+                values, index=col.index, dtype=None if len(values) else object
+            )
+
+    else:
+        coerced = col
+        invalid = ~col.map(lambda v: isinstance(v, tp)).to_numpy()
+
+    return coerced, invalid | nulls
+
+
+def _as_frame(data: ColumnsLike) -> pd.DataFrame:
+    # dicts of arrays, record arrays or dataframes are all viewed as a dataframe
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, np.ndarray):
+        if data.dtype.names is None:
+            raise TypeError("Only structured (record) arrays can be used as columns")
+        return pd.DataFrame.from_records(data)
+    if isinstance(data, Mapping):
+        # lists with None are kept as python objects, pandas would turn ints into floats
+        return pd.DataFrame(
+            {
+                name: (
+                    pd.Series(values, dtype=object)
+                    if isinstance(values, list) and any(v is None for v in values)
+                    else values
+                )
+                for name, values in data.items()
+            },
+            copy=False,
+        )
+    raise TypeError(f"Cannot use {type(data).__name__} as columns")
+
+
+def _validate_columns(cls: Type[Any], data: ColumnsLike) -> pd.DataFrame:
+    """
+    Validate columns against the datacrystal field types, in one vectorized pass per field.
+    Returns a dataframe with exactly the columns of the datacrystal, coerced to the field types.
+    Extra columns are ignored, missing columns or values are filled with the field default.
+
+    Values are coerced as pydantic does for each instance, except for int fields, which are stricter :
+    non integral numbers (1.7, or "1.7") are invalid, instead of being truncated.
+
+    Raises ColumnsValidationError, holding invalid row positions, if any value is not valid.
+    """
+    df = _as_frame(data)
+    n = len(df)
+    index = pd.RangeIndex(n)
+
+    columns = {}
+    errors = {}
+    for f in fields(cls):
+        if f.name in df.columns:
+            col = df[f.name]
+            if f.default is not MISSING and _optional_of(f.type) is None:
+                # missing values (from records without that key) get the default
+                nulls = _nulls(f.type, col)
+                if nulls.any():
+                    col = col.astype(object).where(~nulls, f.default)
+        elif f.default is not MISSING:
+            col = pd.Series([f.default] * n, index=df.index, dtype=object)
+        elif f.default_factory is not MISSING:  # type: ignore
+            col = pd.Series(
+                [f.default_factory() for _ in range(n)],  # type: ignore
+                index=df.index,
+                dtype=object,
+            )
+        else:
+            col = pd.Series([None] * n, index=df.index, dtype=object)
+
+        coerced, invalid = _coerce(f.type, col)
+        if invalid.any():
+            errors[f.name] = np.flatnonzero(invalid)
+
+        # dropping the original index, but not copying the values
+        # Note : objects are kept as they are, pandas would infer datetimes (and NaT for None) from them
+        columns[f.name] = (
+            pd.Series(coerced.to_numpy(), index=index, dtype=object, copy=False)
+            if coerced.dtype == object
+            else coerced.to_numpy()
+        )
+
+    if errors:
+        raise ColumnsValidationError(errors)
+
+    # Note : no copy, not consolidating columns in blocks
+    return pd.DataFrame(columns, index=index, columns=list(columns), copy=False)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
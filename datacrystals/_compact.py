@@ -0,0 +1,160 @@
+# Compact storage of collection columns, by field type, with exact round-trip on access.
+from dataclasses import fields
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from ._columns import _optional_of
+
+_INT64_MAX = 2 ** 63 - 1
+
+
+class _Incompressible(Exception):
+    """Raised by a codec when some values cannot be stored compactly (the column is then kept as is)."""
+
+
+class _SmallInt:
+    """Integers in the smallest width holding all values of a chunk, read back as int64."""
+
+    def encode(
+        self, col: pd.Series, chunks: List[pd.DataFrame], name: str
+    ) -> pd.Series:
+        if not pd.api.types.is_integer_dtype(col):  # python ints beyond 64 bits
+            raise _Incompressible()
+        if col.dtype.kind == "u" and len(col) and col.max() > _INT64_MAX:
+            raise _Incompressible()  # would not be read back as int64
+        return pd.to_numeric(col, downcast="integer")
+
+    def decode(self, col: pd.Series) -> pd.Series:
+        return col.astype("int64")
+
+    def value(self, v: Any) -> Any:
+        return int(v)
+
+    def concat(self, cols: List[pd.Series]) -> pd.Series:
+        return pd.concat(cols, ignore_index=True)
+
+
+class _Category:
+    """Low-cardinality strings as a categorical (one small int code per row), read back as is."""
+
+    def encode(
+        self, col: pd.Series, chunks: List[pd.DataFrame], name: str
+    ) -> pd.Series:
+        # Note : on high cardinality, categories would cost more than they save
+        if col.nunique() * 2 > len(col):
+            return col
+        # pandas hashes strings up to their first NUL character : "a" and "a\x00" would be one category
+        if col.str.contains("\x00", regex=False).any():
+            raise _Incompressible()
+        return col.astype("category")
+
+    def decode(self, col: pd.Series) -> pd.Series:
+        # Note : None (of Optional fields) is NaN in a categorical
+        nulls = col.isna().to_numpy()
+        if not nulls.any():
+            return col
+        values = col.to_numpy(dtype=object)
+        values[nulls] = None
+        return pd.Series(values, index=col.index, dtype=object)
+
+    def value(self, v: Any) -> Any:
+        return None if v is None or v != v else v
+
+    def concat(self, cols: List[pd.Series]) -> pd.Series:
+        if all(isinstance(c.dtype, pd.CategoricalDtype) for c in cols):
+            return pd.Series(union_categoricals(cols, ignore_order=True))
+        return pd.concat([c.astype(object) for c in cols], ignore_index=True)
+
+
+class _FixedPoint:
+    """
+    Decimals as int64 multiples of 10**-scale.
+    The scale is declared (condecimal(decimal_places=...)) or the number of decimal places of the first chunk.
+    With a declared scale, decimals with fewer places are stored (and read back) with that many places, exactly :
+    Decimal("1.5") is read back as Decimal("1.50"). Otherwise decimals with another exponent are not stored compactly.
+
+    >>> fp = _FixedPoint()
+    >>> col = fp.encode(pd.Series([Decimal("1.50"), Decimal("-0.25")]), [], "price")
+    >>> col.tolist(), fp.scale
+    ([150, -25], 2)
+    >>> fp.decode(col).tolist()
+    [Decimal('1.50'), Decimal('-0.25')]
+    >>> fp = _FixedPoint(2)
+    >>> fp.decode(fp.encode(pd.Series([Decimal("1.5"), Decimal("3")]), [], "price")).tolist()
+    [Decimal('1.50'), Decimal('3.00')]
+    """
+
+    def __init__(self, scale: Optional[int] = None):
+        self.scale = scale
+        self.declared = scale is not None
+
+    def encode(
+        self, col: pd.Series, chunks: List[pd.DataFrame], name: str
+    ) -> pd.Series:
+        # Note : nothing is modified if this raises _Incompressible.
+        values = col.tolist()
+        places = set()
+        for v in values:
+            if not isinstance(v, Decimal) or not v.is_finite():  # None, NaN, Infinity
+                raise _Incompressible()
+            places.add(-v.as_tuple().exponent)
+        if self.declared:  # fewer places fit exactly, as the validated values have
+            if max(places, default=0) > self.scale:
+                raise _Incompressible()
+            scale = self.scale
+        else:  # exact round trip : all values with the same exponent, the one of the column
+            scale = places.pop() if len(places) == 1 else self.scale
+            if places or scale is None or self.scale not in (None, scale):
+                raise _Incompressible()
+
+        try:
+            ints = np.array([int(v.scaleb(scale)) for v in values], dtype="int64")
+        except OverflowError:
+            raise _Incompressible()
+
+        self.scale = scale
+        return pd.Series(ints, index=col.index)
+
+    def decode(self, col: pd.Series) -> pd.Series:
+        return pd.Series(
+            [self.value(v) for v in col.tolist()], index=col.index, dtype=object
+        )
+
+    def value(self, v: Any) -> Any:
+        return Decimal(int(v)).scaleb(-self.scale)
+
+    def concat(self, cols: List[pd.Series]) -> pd.Series:
+        return pd.concat(cols, ignore_index=True)
+
+
+def _codecs(_cls: Type[Any], exclude: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Compact codecs for the fields of a datacrystal type (new ones, as they hold per collection state).
+    Fields with no known compact representation, and the `exclude` field, are stored as is.
+    """
+    codecs: Dict[str, Any] = {}
+    for f in fields(_cls):
+        inner = _optional_of(f.type)
+        tp = f.type if inner is None else inner
+        if f.name == exclude or not isinstance(tp, type):
+            continue
+
+        if issubclass(tp, str):
+            codecs[f.name] = _Category()
+        elif inner is not None:  # other nullable values stay python objects
+            continue
+        elif issubclass(tp, int) and not issubclass(tp, bool):
+            codecs[f.name] = _SmallInt()
+        elif issubclass(tp, Decimal):
+            codecs[f.name] = _FixedPoint(getattr(tp, "decimal_places", None))
+    return codecs
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
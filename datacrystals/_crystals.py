@@ -1,55 +1,156 @@
 # frozen dataclass (pydantic for type check)
 # Basic record type. Non Empty set of attributes (order shouldn't matter, unicity enforced)
 import functools
+import inspect
 from collections.abc import Collection
 from dataclasses import asdict, fields
 from decimal import Decimal
+from enum import Enum
 from types import FunctionType
-from typing import Any, Callable, List, Optional, Tuple, Type, TypeVar, Union
-
-import hypothesis.strategies as st  # type: ignore
-from hypothesis import infer
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+import numpy as np
+
+from ._binary import _pack, _reduce, _unpack
+from ._columns import _optional_of, _validate_columns
+
+if TYPE_CHECKING:  # hypothesis is only imported when a strategy is used
+    import hypothesis.strategies as st  # type: ignore
 
 DataCrystalType = TypeVar("DataCrystalType")
 
 
+def _scalar(v: Any) -> Any:
+    # a python scalar from a numpy one, other values (and subclasses of python scalars) as they are
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _converter(tp: Any) -> Optional[Callable[[Any], Any]]:
+    # to python scalars, from the numpy scalars a typed column can hold (None when values are kept as is)
+    tp = _optional_of(tp) or tp
+    if isinstance(tp, type) and issubclass(tp, (bool, int, float)):
+        if issubclass(tp, Enum):  # IntEnum, ... stored as their value
+            return lambda v: v if isinstance(v, tp) else tp(_scalar(v))
+        return _scalar
+    return None
+
+
+class _Fields:
+    """
+    Field metadata of a datacrystal type, computed once when decorating it.
+
+    >>> from decimal import Decimal
+    >>> @datacrystal
+    ... class Sample:
+    ...     attr_int: int
+    ...     attr_dec: Decimal
+    ...
+    >>> Sample.__crystal_fields__.names
+    ('attr_int', 'attr_dec')
+    """
+
+    __slots__ = ("fields", "names", "types", "converters")
+
+    def __init__(self, cls: Type[Any]):
+        self.fields = fields(cls)
+        self.names = tuple(f.name for f in self.fields)
+        self.types = tuple(f.type for f in self.fields)
+        # only for fields that need it, by position
+        self.converters = tuple(
+            (i, c)
+            for i, c in enumerate(_converter(tp) for tp in self.types)
+            if c is not None
+        )
+
+
 def _str(slf: DataCrystalType) -> str:
     # Human friendly display of dataclasses
     typename = type(slf).__name__
     lines = [f"{typename}", "-" * len(typename)]
-    for f in fields(slf):
-        lines.append(f"{f.name}: {getattr(slf,f.name)}")
+    for n in slf.__crystal_fields__.names:
+        lines.append(f"{n}: {getattr(slf, n)}")
 
     return "\n".join(lines)
 
 
 def _dir(slf: DataCrystalType) -> List[str]:
     # only expose fields
-    return [f.name for f in fields(slf)]
+    return list(slf.__crystal_fields__.names)
 
 
-def _strategy(cls: Type[DataCrystalType]) -> st.SearchStrategy:
+def _strategy(cls: Type[DataCrystalType]) -> "st.SearchStrategy":
     # Strategie inferring attributes from type hints by default
+    import hypothesis.strategies as st  # type: ignore
+    from hypothesis import infer
 
     params = {}
 
-    for f in fields(cls):
-        if f.name:
-            params.update({f.name: infer})
+    for n in cls.__crystal_fields__.names:
+        if n:
+            params.update({n: infer})
 
     # calling the functional factory...
     return st.builds(cls, **params)
 
 
+def _slotted(cls: Type[Any], pydantic: bool) -> Type[Any]:
+    """
+    The same dataclass, with __slots__ instead of a per-instance __dict__.
+    Pydantic dataclasses validate into the instance __dict__ : the pydantic model validates values directly instead.
+    """
+    names = tuple(f.name for f in fields(cls))
+    ns = dict(cls.__dict__)
+    for n in names + ("__dict__", "__weakref__"):
+        ns.pop(
+            n, None
+        )  # default values are in the dataclass fields, and in __init__ already
+    ns["__slots__"] = names
+
+    if pydantic:
+        from pydantic import validate_model
+
+        model = cls.__pydantic_model__
+        signature = inspect.signature(cls)
+
+        @functools.wraps(cls.__init__)
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            # missing values are filled with defaults by the model
+            values = signature.bind(*args, **kwargs).arguments
+            validated, _, error = validate_model(model, values, cls=type(self))
+            if error:
+                raise error
+            for n in names:
+                object.__setattr__(self, n, validated[n])
+
+        ns["__init__"] = __init__
+
+    slotted = type(cls)(cls.__name__, cls.__bases__, ns)
+    slotted.__qualname__ = cls.__qualname__
+    return slotted
+
+
 # Attempting to make this functional, the easy way.
-@functools.lru_cache(typed=True)
+# Note : unbounded, a crystal type is never built twice (an evicted one would be a different type).
+@functools.lru_cache(maxsize=None, typed=True)
 def _make_dataclass(
     _cls: Type[Any],
     order: bool,
+    slots: bool = False,
 ) -> Type[DataCrystalType]:
     try:
         from pydantic.dataclasses import dataclass as pydantic_dataclass  # type: ignore
 
+        pydantic = True
         cls = pydantic_dataclass(
             _cls,
             init=True,
@@ -72,6 +173,8 @@ def _make_dataclass(
 
         from dataclasses import dataclass as python_dataclass
 
+        pydantic = False
+
         cls = python_dataclass(
             init=True,
             repr=True,
@@ -83,6 +186,39 @@ def _make_dataclass(
             _cls
         )  # calling it as a decorator to make mypy happy.
 
+    if slots:
+        cls = _slotted(cls, pydantic)
+
+    # field metadata, not to call dataclasses.fields() on every access
+    meta = _Fields(cls)
+    setattr(cls, "__crystal_fields__", meta)
+
+    # slot descriptors, bypassing the frozen __setattr__
+    setters = [cls.__dict__[n].__set__ for n in meta.names] if slots else []
+
+    def _from_trusted(cls, *values: Any) -> DataCrystalType:
+        """
+        An instance from field values (in field order) that were already validated, for internal use only.
+        Nothing is checked : numpy scalars are only converted back to python ones.
+        """
+        if meta.converters:
+            values = list(values)
+            for i, convert in meta.converters:
+                v = values[i]
+                if v is not None:
+                    values[i] = convert(v)
+        inst = object.__new__(cls)
+        if slots:
+            for set_value, v in zip(setters, values):
+                set_value(inst, v)
+        else:
+            inst.__dict__.update(zip(meta.names, values))
+            if pydantic:
+                inst.__dict__["__pydantic_initialised__"] = True
+        return inst
+
+    setattr(cls, "_from_trusted", classmethod(_from_trusted))
+
     # extras for cleaner 'record' class
     setattr(cls, "__str__", _str)
     setattr(cls, "__dir__", _dir)
@@ -90,6 +226,14 @@ def _make_dataclass(
     # to generate elements pseudo-randomly
     setattr(cls, "strategy", classmethod(_strategy))
 
+    # to validate many elements at once, column per column
+    setattr(cls, "validate_columns", classmethod(_validate_columns))
+
+    # compact binary format, also used for pickling
+    setattr(cls, "to_bytes", _pack)
+    setattr(cls, "from_bytes", classmethod(_unpack))
+    setattr(cls, "__reduce__", _reduce)
+
     # TODO : somewhere else ?? (to keep this minimal, and testing independent enough...)
     # # to build collection type from the element description
     # setattr(cls, "Collection", _collection_from_class(cls))  # collection type registered as part of this type.
@@ -102,6 +246,7 @@ def datacrystal(
     _cls: Optional[Type[Any]] = None,
     *,
     order: bool = False,
+    slots: bool = False,
 ) -> Union[
     Callable[[Type[DataCrystalType]], Type[DataCrystalType]], Type[DataCrystalType]
 ]:
@@ -144,10 +289,34 @@ def datacrystal(
     False
     >>> sdc1 == sdc2
     True
+
+    Many elements can also be validated at once, from columns (dict of arrays, record array or dataframe):
+    >>> SampleDataCrystal.validate_columns({"attr_int": [1, 2], "attr_dec": ["0.1", 2]})
+       attr_int attr_dec
+    0         1      0.1
+    1         2        2
+
+    In that case, the positions of invalid rows are reported at once:
+    >>> try:
+    ...     SampleDataCrystal.validate_columns({"attr_int": [1.5, 2, 3], "attr_dec": [1, None, 3]})
+    ... except ValueError as ve:
+    ...     print(ve.rows)
+    [0 1]
+
+    With slots=True, instances have no __dict__, and hold in much less memory:
+    >>> @datacrystal(slots=True)
+    ... class SlottedDataCrystal:
+    ...      attr_int: int
+    ...      attr_dec: decimal.Decimal = decimal.Decimal(0)
+    ...
+    >>> SlottedDataCrystal(attr_int="42")
+    SlottedDataCrystal(attr_int=42, attr_dec=Decimal('0'))
+    >>> hasattr(SlottedDataCrystal(attr_int=42), "__dict__")
+    False
     """
 
     def wrap(cls: Type[Any]) -> Type[DataCrystalType]:
-        return _make_dataclass(cls, order=order)
+        return _make_dataclass(cls, order=order, slots=slots)
 
     if _cls is None:
         return wrap
@@ -0,0 +1,120 @@
+# Rendering collections for humans : only the rows shown are read, never the whole data at once.
+from dataclasses import fields
+from typing import Any, Iterator, List, Optional, Sequence, Type
+
+import pandas as pd
+
+from ._buffer import _optimized
+
+
+class DisplayOptions:
+    """
+    How many rows str() shows : all of them up to `max_rows`, otherwise only the first `head` and last `tail` ones.
+    Full dumps with render_lines() are rendered `chunksize` rows at a time.
+    """
+
+    __slots__ = ("max_rows", "head", "tail", "chunksize")
+
+    def __init__(
+        self, max_rows: int = 20, head: int = 5, tail: int = 5, chunksize: int = 1000
+    ):
+        self.max_rows = max_rows
+        self.head = head
+        self.tail = tail
+        self.chunksize = chunksize
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(max_rows={self.max_rows}, head={self.head}, "
+            f"tail={self.tail}, chunksize={self.chunksize})"
+        )
+
+
+# shared by all collections, to change as `datacrystals.display.max_rows = 100`
+display = DisplayOptions()
+
+
+def _size(nbytes: int) -> str:
+    """
+    >>> _size(512), _size(3 * 1024**2)
+    ('512 B', '3.0 MB')
+    """
+    if nbytes < 1024:
+        return f"{nbytes} B"
+    for unit in ("kB", "MB", "GB"):
+        nbytes /= 1024
+        if nbytes < 1024:
+            break
+    return f"{nbytes:.1f} {unit}"
+
+
+def _typename(tp: Any) -> str:
+    return tp.__name__ if isinstance(tp, type) else str(tp).replace("typing.", "")
+
+
+def _table(
+    frame: pd.DataFrame, positions: Sequence[int], skipped: Optional[int] = None
+) -> List[str]:
+    # lines of a table, rows numbered by their position in the collection, and "..." after the first `skipped` rows
+    frame = _optimized(frame, frozenset())
+    frame.index = pd.Index(positions)
+    try:  # only imported when a table is rendered
+        from tabulate import tabulate
+    except ImportError:
+        lines = frame.to_string().splitlines()
+        if skipped is not None:
+            lines.insert(1 + skipped, "...")
+        return lines
+
+    lines = tabulate(frame, headers="keys", tablefmt="psql").splitlines()
+    if skipped is not None and lines:  # Note : no lines without any column
+        # a "..." under each column, between the borders "+----+------+"
+        lines.insert(
+            3 + skipped,
+            "|".join(
+                "...".center(len(s))[: len(s)] if s else "" for s in lines[0].split("+")
+            ),
+        )
+    return lines
+
+
+def _render_lines(
+    slf: Any,
+    _cls: Type[Any],
+    head: Optional[int] = None,
+    tail: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Lines of a collection : its type, length, the dtype and memory used by each field, then a table of its rows.
+    All rows, `display.chunksize` at a time (one table per chunk), or only the first `head` and last `tail` ones.
+    """
+    data = slf._data
+    length = len(data)
+
+    typename = type(slf).__name__
+    yield typename
+    yield "-" * len(typename)
+
+    nbytes = data.nbytes()
+    dtypes = data.slice(0, 1).dtypes
+    yield f"{length} rows, {_size(sum(nbytes.values()))}"
+    for f in fields(_cls):
+        yield f"  {f.name}: {_typename(f.type)} as {dtypes[f.name]}, {_size(nbytes[f.name])}"
+
+    if head is None and tail is None:
+        step = max(display.chunksize, 1)
+        for start in range(0, max(length, 1), step):
+            yield from _table(
+                data.slice(start, start + step), range(start, min(start + step, length))
+            )
+        return
+
+    head, tail = head or 0, tail or 0
+    if head + tail >= length:
+        yield from _table(data.slice(0, length), range(length))
+        return
+
+    windows = [data.slice(0, head), data.slice(length - tail, length)]
+    frame = pd.concat([w for w in windows if len(w)] or windows, ignore_index=True)
+    positions = list(range(head)) + list(range(length - tail, length))
+    yield from _table(frame, positions, skipped=head)
@@ -0,0 +1,106 @@
+# Hash index on (a subset of) datacrystal fields, maintained along with the append-only buffer.
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+
+class _HashIndex:
+    """
+    Maps the tuple of key field values to the positions of matching rows.
+
+    Maintained incrementally: each append only adds one entry.
+    A single position is stored as an int, a list is only allocated on repetition.
+
+    >>> idx = _HashIndex(("answer",))
+    >>> idx.add((42,), 0)
+    >>> idx.add((51,), 1)
+    >>> idx.add((42,), 2)
+    >>> idx.get((42,))
+    [0, 2]
+    >>> (51,) in idx, (33,) in idx
+    (True, False)
+    """
+
+    __slots__ = ("key", "_positions")
+
+    def __init__(self, key: Sequence[str]):
+        self.key = tuple(key)
+        self._positions: Dict[Hashable, Union[int, List[int]]] = {}
+
+    def __len__(self) -> int:
+        # number of distinct keys
+        return len(self._positions)
+
+    def __contains__(self, key: Tuple[Any, ...]) -> bool:
+        return key in self._positions
+
+    def add(self, key: Tuple[Any, ...], position: int) -> None:
+        found = self._positions.get(key)
+        if found is None:
+            self._positions[key] = position
+        elif isinstance(found, list):
+            found.append(position)
+        else:
+            self._positions[key] = [found, position]
+
+    def extend(self, frame: pd.DataFrame, start: int) -> None:
+        # python objects (not numpy scalars) to hash the same way as the crystal attributes
+        keys = zip(*(frame[k].tolist() for k in self.key)) if self.key else None
+        for pos in range(start, start + len(frame)):
+            self.add(next(keys) if keys is not None else (), pos)
+
+    def get(self, key: Tuple[Any, ...]) -> List[int]:
+        found = self._positions.get(key, [])
+        return list(found) if isinstance(found, list) else [found]
+
+
+class _RowSet:
+    """
+    Finds the position of a row among distinct rows, in O(1).
+
+    Only the hash of each row is kept, not the row itself : candidates are compared with the stored rows,
+    read back with `row(position)`. A single position is stored as an int, a list only on hash collision.
+
+    >>> rows = [(42, "a"), (51, "b")]
+    >>> rs = _RowSet()
+    >>> rs.add(rows[0], 0); rs.add(rows[1], 1)
+    >>> rs.find((51, "b"), rows.__getitem__), rs.find((51, "c"), rows.__getitem__)
+    (1, None)
+    """
+
+    __slots__ = ("_positions",)
+
+    def __init__(self):
+        self._positions: Dict[int, Union[int, List[int]]] = {}
+
+    def __len__(self) -> int:
+        return sum(
+            len(p) if isinstance(p, list) else 1 for p in self._positions.values()
+        )
+
+    def add(self, row: Tuple[Any, ...], position: int) -> None:
+        h = hash(row)
+        found = self._positions.get(h)
+        if found is None:
+            self._positions[h] = position
+        elif isinstance(found, list):
+            found.append(position)
+        else:
+            self._positions[h] = [found, position]
+
+    def find(
+        self, row: Tuple[Any, ...], stored: Callable[[int], Tuple[Any, ...]]
+    ) -> Optional[int]:
+        found = self._positions.get(hash(row))
+        if found is None:
+            return None
+        for p in found if isinstance(found, list) else (found,):
+            if stored(p) == row:
+                return p
+        return None
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
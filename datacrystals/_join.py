@@ -0,0 +1,295 @@
+# Joins between collections of (possibly) different crystal types, into collections of a combined crystal type.
+# Only row positions are computed by the join itself, columns are then gathered once, column per column.
+import functools
+from dataclasses import field as dataclass_field
+from dataclasses import fields, make_dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from ._columns import _frame_of
+from ._crystals import datacrystal
+
+HOWS = ("inner", "left", "asof")
+
+# Positions of joined rows : in the left frame, and in the right frame (-1 where there is no match)
+_Positions = Tuple[np.ndarray, np.ndarray]
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _combined(
+    left: Type[Any], right: Type[Any], shared: Tuple[str, ...], optional: bool
+) -> Tuple[Type[Any], Tuple[Tuple[str, str], ...]]:
+    """
+    The crystal type of joined rows, and the names its right fields have in it.
+    All fields of left, then those of right except `shared` ones (equal to left ones).
+    Right fields named as left ones are suffixed with the right type name.
+    When rows may have no match (optional), right fields are Optional, None by default.
+
+    >>> from datetime import datetime
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Trade:
+    ...     ts: datetime
+    ...     price: float
+    ...
+    >>> @datacrystal
+    ... class Candle:
+    ...     ts: datetime
+    ...     price: float
+    ...
+    >>> TradeCandle, renamed = _combined(Trade, Candle, (), True)
+    >>> [f.name for f in fields(TradeCandle)]
+    ['ts', 'price', 'ts_candle', 'price_candle']
+    >>> TradeCandle(ts=datetime(2021, 1, 1), price=42.)
+    TradeCandle(ts=datetime.datetime(2021, 1, 1, 0, 0), price=42.0, ts_candle=None, price_candle=None)
+    """
+    names = [f.name for f in fields(left)]
+    # Note : no default, right fields without default could not follow
+    declared: list = [(f.name, f.type) for f in fields(left)]
+    renamed = []
+    for f in fields(right):
+        if f.name in shared:
+            continue
+        name = f.name if f.name not in names else f"{f.name}_{right.__name__.lower()}"
+        if name in names:
+            raise ValueError(f"{name} is both a field of {left.__name__} and joined")
+        names.append(name)
+        renamed.append((f.name, name))
+        if optional:
+            declared.append((name, Optional[f.type], dataclass_field(default=None)))
+        else:
+            declared.append((name, f.type))
+
+    cls = datacrystal(
+        make_dataclass(
+            left.__name__ + right.__name__,
+            declared,
+            namespace={"__module__": left.__module__},
+        )
+    )
+    return cls, tuple(renamed)
+
+
+def _codes(left: pd.DataFrame, right: pd.DataFrame, on: Sequence[str]) -> _Positions:
+    """
+    One integer code per row, equal for rows with equal `on` values, on both sides (hashing the values).
+    Rows with a null value have the code -1.
+
+    >>> _codes(pd.DataFrame({"a": [1, 2, None]}), pd.DataFrame({"a": [2, 3]}), ["a"])
+    (array([ 0,  1, -1]), array([1, 2]))
+    """
+    combined: Optional[np.ndarray] = None
+    for n in on:
+        # Note : arrays, pandas would infer another index type from object series
+        values = np.concatenate([left[n].to_numpy(), right[n].to_numpy()])
+        codes, uniques = pd.factorize(values, sort=False)
+        codes = codes.astype("int64")
+        if uniques.dtype == object and len(uniques):
+            # pandas hashes strings only up to their first NUL : "a" and "a\x00" could share a code
+            valid = codes >= 0
+            if not (np.asarray(uniques)[codes[valid]] == values[valid]).all():
+                codes = _factorized(values)
+        if combined is None:
+            combined = codes
+        else:
+            nulls = (combined < 0) | (codes < 0)
+            combined, _ = pd.factorize(
+                combined * (int(codes.max(initial=-1)) + 1) + codes
+            )
+            combined[nulls] = -1
+    assert combined is not None
+    return combined[: len(left)], combined[len(left) :]
+
+
+def _factorized(values: np.ndarray) -> np.ndarray:
+    # codes by python hashing (and equality), exact for any values, -1 for nulls
+    nulls = pd.isna(values)
+    index: Dict[Any, int] = {}
+    return np.array(
+        [
+            -1 if null else index.setdefault(v, len(index))
+            for v, null in zip(values, nulls)
+        ],
+        dtype="int64",
+    )
+
+
+def _expand(lo: np.ndarray, counts: np.ndarray, keep: bool) -> _Positions:
+    """
+    Positions of joined rows, from the first match (in some order of right rows) of each left row, and the number
+    of matches. Left rows without match are kept once (at -1) if `keep`.
+
+    >>> _expand(np.array([0, 2, 0]), np.array([2, 1, 0]), keep=True)
+    (array([0, 0, 1, 2]), array([ 0,  1,  2, -1]))
+    """
+    missing = counts == 0
+    if keep:
+        counts = np.where(missing, 1, counts)
+    total = int(counts.sum())
+    lpos = np.repeat(np.arange(len(counts)), counts)
+    # offset of each joined row among the matches of its left row
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    rpos = np.repeat(lo, counts) + offsets
+    if keep:
+        rpos[np.repeat(missing, counts)] = -1
+    return lpos, rpos
+
+
+def _merge(lkeys: np.ndarray, rkeys: np.ndarray, keep: bool) -> _Positions:
+    # sort-merge, by binary search of each left key in the sorted (non null) right keys
+    lnulls = pd.isna(lkeys)
+    lo = np.zeros(len(lkeys), dtype="int64")
+    hi = np.zeros(len(lkeys), dtype="int64")
+    lo[~lnulls] = np.searchsorted(rkeys, lkeys[~lnulls], side="left")
+    hi[~lnulls] = np.searchsorted(rkeys, lkeys[~lnulls], side="right")
+    return _expand(lo, hi - lo, keep)
+
+
+def _sorted(keys: np.ndarray) -> Optional[np.ndarray]:
+    # the order of (non null) keys, or None if they cannot be compared
+    valid = np.flatnonzero(~pd.isna(keys))
+    try:
+        return valid[np.argsort(keys[valid], kind="stable")]
+    except TypeError:
+        return None
+
+
+def _equi(
+    left: pd.DataFrame, right: pd.DataFrame, on: Sequence[str], keep: bool
+) -> _Positions:
+    """
+    Positions of rows with equal `on` values, in left order (then right order).
+    A sort-merge when right keys are sorted already (or few enough to be sorted), a hash join otherwise.
+    """
+    if len(on) == 1:
+        lkeys, rkeys = left[on[0]].to_numpy(), right[on[0]].to_numpy()
+        sortable = not pd.isna(rkeys).any()
+        if sortable and right[on[0]].is_monotonic_increasing:
+            return _merge(lkeys, rkeys, keep)
+        # sorting right costs less than hashing all keys
+        if len(rkeys) * max(np.log2(len(rkeys) or 1), 1) < len(lkeys):
+            order = _sorted(rkeys)
+            if order is not None:
+                try:
+                    lpos, rpos = _merge(lkeys, rkeys[order], keep)
+                except TypeError:  # left keys cannot be compared with right ones
+                    pass
+                else:
+                    return lpos, np.where(rpos < 0, -1, order[np.maximum(rpos, 0)])
+
+    # hash join : right rows grouped by code (counting sort), then looked up from each left code
+    lcodes, rcodes = _codes(left, right, on)
+    valid = rcodes >= 0
+    order = np.flatnonzero(valid)[np.argsort(rcodes[valid], kind="stable")]
+    ncodes = int(max(lcodes.max(initial=-1), rcodes.max(initial=-1))) + 1
+    counts = np.bincount(rcodes[valid], minlength=ncodes)
+    starts = np.cumsum(counts) - counts
+    matched = lcodes >= 0
+    lo = np.where(matched, starts[np.maximum(lcodes, 0)] if ncodes else 0, 0)
+    n = np.where(matched, counts[np.maximum(lcodes, 0)] if ncodes else 0, 0)
+    lpos, rpos = _expand(lo, n, keep)
+    return lpos, np.where(
+        rpos < 0, -1, order[np.maximum(rpos, 0)] if len(order) else -1
+    )
+
+
+def _asof(
+    left: pd.DataFrame, right: pd.DataFrame, on: str, by: Sequence[str]
+) -> _Positions:
+    """
+    For each left row, the last right row (with equal `by` values) with an `on` value not after the left one.
+
+    >>> left = pd.DataFrame({"t": [1, 5, 7, 0]})
+    >>> right = pd.DataFrame({"t": [2, 4, 6]})
+    >>> _asof(left, right, "t", ())
+    (array([0, 1, 2, 3]), array([-1,  1,  2, -1]))
+    """
+    if by:
+        lcodes, rcodes = _codes(left, right, by)
+    else:
+        lcodes = np.zeros(len(left), dtype="int64")
+        rcodes = np.zeros(len(right), dtype="int64")
+
+    lkeys, rkeys = left[on].to_numpy(), right[on].to_numpy()
+    lrows = np.flatnonzero((lcodes >= 0) & ~pd.isna(lkeys))
+    rrows = np.flatnonzero((rcodes >= 0) & ~pd.isna(rkeys))
+    try:
+        values, ranks = np.unique(
+            np.concatenate([lkeys[lrows], rkeys[rrows]]), return_inverse=True
+        )
+    except TypeError:
+        raise TypeError(f"{on} values cannot be ordered") from None
+
+    # one sorted key over (`by` group, `on` rank) : a single binary search for all groups
+    width = len(values) + 1
+    lsort = lcodes[lrows] * width + ranks[: len(lrows)]
+    rsort = rcodes[rrows] * width + ranks[len(lrows) :]
+    sort = np.argsort(rsort, kind="stable")
+    found = np.searchsorted(rsort[sort], lsort, side="right") - 1
+    # the last one not after, if in the same group
+    hit = found >= 0
+    matched = rrows[sort[found[hit]]]
+    hit[hit] = rcodes[matched] == lcodes[lrows[hit]]
+    rpos = np.full(len(left), -1, dtype="int64")
+    rpos[lrows[hit]] = rrows[sort[found[hit]]]
+    return np.arange(len(left)), rpos
+
+
+def _gathered(frame: pd.DataFrame, positions: np.ndarray, name: str) -> pd.Series:
+    # a column at these positions, None where the position is -1
+    col = frame[name]
+    missing = positions < 0
+    if not missing.any():
+        return col.take(positions).reset_index(drop=True)
+    if not len(col):
+        return pd.Series([None] * len(positions), dtype=object)
+    taken = col.take(np.where(missing, 0, positions)).reset_index(drop=True)
+    return taken.astype(object).where(~missing, None)
+
+
+def _join(
+    left: Type[Any],
+    right: Type[Any],
+    lframe: pd.DataFrame,
+    rframe: pd.DataFrame,
+    on: Sequence[str],
+    how: str,
+    by: Sequence[str] = (),
+) -> Tuple[Type[Any], pd.DataFrame]:
+    """
+    The combined crystal type of joined rows, and their columns.
+    Columns are gathered once from the join positions : memory holds the inputs, the output and its positions.
+    """
+    for n in list(on) + list(by):
+        for cls in (left, right):
+            if n not in cls.__crystal_fields__.names:
+                raise ValueError(f"{n} is not a field of {cls.__name__}")
+    if how not in HOWS:
+        raise ValueError(f"{how} is not a kind of join: {HOWS}")
+    if how == "asof":
+        if len(on) != 1:
+            raise ValueError("An asof join is on one (ordered) field")
+        lpos, rpos = _asof(lframe, rframe, on[0], by)
+        shared = tuple(by)
+    else:
+        if by:
+            raise ValueError("Only asof joins have `by` fields, as well as `on`")
+        lpos, rpos = _equi(lframe, rframe, on, keep=how == "left")
+        shared = tuple(on)
+
+    combined, renamed = _combined(left, right, shared, how != "inner")
+    columns: Dict[str, pd.Series] = {
+        n: lframe[n].take(lpos).reset_index(drop=True)
+        for n in left.__crystal_fields__.names
+    }
+    for n, name in renamed:
+        columns[name] = _gathered(rframe, rpos, n)
+    return combined, _frame_of(columns, pd.RangeIndex(len(lpos)))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
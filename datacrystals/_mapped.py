@@ -0,0 +1,445 @@
+# On-disk, memory-mapped storage backing collections larger than memory.
+# Same interface as the in-memory _ColumnBuffer : one file (or two) per column, only what is read is paged in.
+import json
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from dataclasses import fields
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from ._columns import _frame_of, _optional_of
+
+DEFAULT_CHUNKSIZE = 4096
+
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+META = "meta.json"
+VERSION = 1
+
+# fixed width kinds, by field type (checked in order : bool is an int)
+_FIXED = (
+    (bool, "bool"),
+    (int, "int64"),
+    (float, "float64"),
+    (datetime, "datetime64[ns]"),
+)
+
+
+def _objects(values: List[Any]) -> np.ndarray:
+    # an object array, without numpy inspecting each value (as np.array does, much slower)
+    try:
+        return np.fromiter(values, dtype=object, count=len(values))
+    except ValueError:  # numpy < 1.23
+        return np.array(values, dtype=object)
+
+
+def _kind(tp: Any) -> Optional[str]:
+    # numpy dtype, or "str" / "decimal" (variable width), None if there is no known fixed representation
+    tp = _optional_of(tp) or tp
+    if not isinstance(tp, type):
+        return None
+    for base, dtype in _FIXED:
+        if issubclass(tp, base):
+            return dtype
+    if issubclass(tp, str):
+        return "str"
+    if issubclass(tp, Decimal):
+        return "decimal"
+    return None
+
+
+def _kinds(_cls: Type[Any]) -> Dict[str, str]:
+    """
+    How each field of a datacrystal type is stored on disk : a numpy dtype, or "str" / "decimal" (variable width).
+
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Tick:
+    ...     ts: datetime
+    ...     price: Decimal
+    ...     venue: str = "XNYS"
+    ...
+    >>> _kinds(Tick)
+    {'ts': 'datetime64[ns]', 'price': 'decimal', 'venue': 'str'}
+    """
+    kinds = {}
+    for f in fields(_cls):
+        kind = _kind(f.type)
+        if kind is None:
+            raise TypeError(f"{f.name}: {f.type} cannot be stored on disk")
+        kinds[f.name] = kind
+    return kinds
+
+
+def _map(path: str, dtype: str, length: int) -> np.ndarray:
+    # Note : mmap cannot map an empty file
+    if not length:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+def _truncate(path: str, size: int) -> None:
+    # creating the file if needed
+    with open(path, "ab") as f:
+        f.truncate(size)
+
+
+class _Column:
+    """
+    One column on disk, memory-mapped.
+    Fixed width values are in `<name>.bin`.
+    Variable width values are utf-8 encoded in `<name>.data`, with their end offsets in `<name>.bin`.
+    Optional fields also have a `<name>.null` mask.
+
+    Without a root directory, the same column is loaded from (and encoded to) buffers in memory.
+    """
+
+    __slots__ = ("name", "kind", "nullable", "_paths", "_values", "_data", "_nulls")
+
+    def __init__(self, root: Optional[str], name: str, kind: str, nullable: bool):
+        self.name = name
+        self.kind = kind
+        self.nullable = nullable
+        self._paths = (
+            {}
+            if root is None
+            else {
+                ext: os.path.join(root, f"{name}.{ext}")
+                for ext in ("bin", "data", "null")
+            }
+        )
+        self._values = self._data = self._nulls = np.empty(0)
+
+    @property
+    def dtype(self) -> str:
+        return "int64" if self.kind in ("str", "decimal") else self.kind
+
+    @property
+    def variable(self) -> bool:
+        return self.kind in ("str", "decimal")
+
+    @property
+    def nbytes(self) -> int:
+        return self._values.nbytes + self._data.nbytes + self._nulls.nbytes
+
+    def truncate(self, length: int) -> None:
+        # dropping anything written after the last complete append (if it was interrupted)
+        _truncate(self._paths["bin"], length * np.dtype(self.dtype).itemsize)
+        if self.nullable:
+            _truncate(self._paths["null"], length)
+        if self.variable:
+            end = int(_map(self._paths["bin"], "int64", length)[-1]) if length else 0
+            _truncate(self._paths["data"], end)
+
+    def remap(self, length: int) -> None:
+        self._values = _map(self._paths["bin"], self.dtype, length)
+        if self.nullable:
+            self._nulls = _map(self._paths["null"], "bool", length)
+        if self.variable:
+            end = int(self._values[-1]) if length else 0
+            self._data = _map(self._paths["data"], "uint8", end)
+
+    def load(self, buffers: Dict[str, Any], length: int) -> None:
+        # views on the buffers (as encoded), nothing is copied
+        self._values = np.frombuffer(buffers["bin"], dtype=self.dtype, count=length)
+        if self.nullable:
+            self._nulls = np.frombuffer(buffers["null"], dtype="bool", count=length)
+        if self.variable:
+            self._data = np.frombuffer(buffers["data"], dtype="uint8")
+
+    def encode(self, values: Sequence[Any]) -> Dict[str, bytes]:
+        """Bytes to append to each file of this column, raising before anything is written."""
+        if (
+            not self.variable
+            and isinstance(values, np.ndarray)
+            and values.dtype == self.dtype
+        ):
+            # already in this representation, without null
+            encoded = {"null": bytes(len(values))} if self.nullable else {}
+            encoded["bin"] = values.tobytes()
+            return encoded
+
+        nulls = np.array([v is None for v in values], dtype=bool)
+        if nulls.any() and not self.nullable:
+            raise ValueError(f"{self.name} cannot be None")
+        encoded = {"null": nulls.tobytes()} if self.nullable else {}
+
+        if self.variable:
+            data = [b"" if v is None else str(v).encode() for v in values]
+            start = int(self._values[-1]) if len(self._values) else 0
+            ends = start + np.cumsum([len(d) for d in data], dtype="int64")
+            encoded["data"] = b"".join(data)
+            encoded["bin"] = ends.tobytes()
+        else:
+            if self.kind == "datetime64[ns]" and any(
+                getattr(v, "tzinfo", None) is not None for v in values
+            ):
+                # numpy would convert them to naive UTC, losing their time zone
+                raise ValueError(f"{self.name} values must be naive datetimes")
+            zero = np.zeros(1, dtype=self.dtype)[0]
+            try:
+                fixed = np.array(
+                    [zero if v is None else v for v in values], dtype=self.dtype
+                )
+            except OverflowError:
+                raise ValueError(f"{self.name} values do not fit in {self.dtype}")
+            encoded["bin"] = fixed.tobytes()
+        return encoded
+
+    def write(self, encoded: Dict[str, bytes]) -> None:
+        for ext, raw in encoded.items():
+            with open(self._paths[ext], "ab") as f:
+                f.write(raw)
+
+    def get(self, pos: int) -> Any:
+        if self.nullable and self._nulls[pos]:
+            return None
+        if self.variable:
+            start = int(self._values[pos - 1]) if pos else 0
+            raw = self._data[start : int(self._values[pos])].tobytes()
+            return Decimal(raw.decode()) if self.kind == "decimal" else raw.decode()
+        v = self._values[pos]
+        return pd.Timestamp(v) if self.kind == "datetime64[ns]" else v.item()
+
+    def series(self, start: int, stop: int) -> pd.Series:
+        if self.variable:
+            ends = self._values[start:stop]
+            first = int(self._values[start - 1]) if start else 0
+            raw = self._data[first : int(ends[-1]) if len(ends) else first].tobytes()
+            bounds = np.concatenate([[0], ends - first]).tolist()
+            decode = Decimal if self.kind == "decimal" else str
+            values = _objects(
+                [decode(raw[a:b].decode()) for a, b in zip(bounds[:-1], bounds[1:])]
+            )
+            col = pd.Series(values, dtype=object, copy=False)
+        else:
+            # a view on the mapped file, nothing is read yet
+            col = pd.Series(self._values[start:stop], copy=False)
+        if self.nullable:
+            nulls = self._nulls[start:stop]
+            if nulls.any():
+                col = col.astype(object).where(~nulls, None)
+        return col
+
+
+class _MappedBuffer:
+    """
+    Append-only columnar storage in a directory, memory-mapped.
+
+    Rows are kept in memory, and written to the column files every `chunksize` appends or on flush().
+    Opening only reads the meta file, and maps columns : data is paged in when (and where) it is read.
+
+    >>> import tempfile
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...     question: str = "What is the answer ?"
+    ...
+    >>> root = tempfile.mkdtemp()
+    >>> buf = _MappedBuffer(root, Shard, chunksize=2)
+    >>> for a in range(5):
+    ...     buf.append((a, "What is it ?"))
+    >>> buf.flush()
+    >>> buf = _MappedBuffer(root, Shard)
+    >>> len(buf), buf.row(2)
+    (5, (2, 'What is it ?'))
+    >>> buf.slice(1, 4).answer.tolist()
+    [1, 2, 3]
+    """
+
+    __slots__ = (
+        "root",
+        "columns",
+        "chunksize",
+        "codecs",
+        "_columns",
+        "_sealed",
+        "_open",
+        "_pending",
+    )
+
+    def __init__(self, root: str, _cls: Type[Any], chunksize: int = DEFAULT_CHUNKSIZE):
+        self.root = root
+        self.chunksize = chunksize
+        self.codecs: Dict[str, Any] = {}  # stored as is
+        kinds = _kinds(_cls)
+        self.columns = tuple(kinds)
+
+        os.makedirs(root, exist_ok=True)
+        meta_path = os.path.join(root, META)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["columns"] != kinds:
+                raise ValueError(
+                    f"{root} stores {meta['columns']}, not {_cls.__name__} {kinds}"
+                )
+            length = meta["length"]
+        else:
+            length = 0
+
+        self._columns = {
+            f.name: _Column(
+                root, f.name, kinds[f.name], _optional_of(f.type) is not None
+            )
+            for f in fields(_cls)
+        }
+        for col in self._columns.values():
+            col.truncate(length)
+            col.remap(length)
+        self._sealed = length
+        if not length:
+            self._write_meta()
+
+        self._open: Tuple[List[Any], ...] = tuple([] for _ in self.columns)
+        self._pending = 0
+
+    def _write_meta(self) -> None:
+        # written last, and atomically : the length only counts complete appends
+        tmp = os.path.join(self.root, META + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "version": VERSION,
+                    "columns": {n: c.kind for n, c in self._columns.items()},
+                    "length": self._sealed,
+                },
+                f,
+            )
+        os.replace(tmp, os.path.join(self.root, META))
+
+    def __len__(self) -> int:
+        return self._sealed + self._pending
+
+    def append(self, row: Tuple[Any, ...]) -> None:
+        # checked now, a row that cannot be written must not stay pending
+        for n, v in zip(self.columns, row):
+            if v is None:
+                continue
+            kind = self._columns[n].kind
+            if kind == "int64" and not _INT64_MIN <= v <= _INT64_MAX:
+                raise ValueError(f"{n} values do not fit in int64")
+            if kind == "datetime64[ns]" and v.tzinfo is not None:
+                raise ValueError(f"{n} values must be naive datetimes")
+        for col, v in zip(self._open, row):
+            col.append(v)
+        self._pending += 1
+
+        if self._pending >= self.chunksize:
+            self._seal()
+
+    def extend(self, frame: pd.DataFrame) -> None:
+        if len(frame):
+            self._seal()
+            self._write({n: frame[n].tolist() for n in self.columns}, len(frame))
+
+    def _write(self, values: Dict[str, List[Any]], length: int) -> None:
+        encoded = [(col, col.encode(values[n])) for n, col in self._columns.items()]
+        for col, raw in encoded:
+            col.write(raw)
+        self._sealed += length
+        self._write_meta()
+        for col in self._columns.values():
+            col.remap(self._sealed)
+
+    def _seal(self) -> None:
+        if self._pending:
+            self._write(dict(zip(self.columns, self._open)), self._pending)
+            self._open = tuple([] for _ in self.columns)
+            self._pending = 0
+
+    def flush(self) -> None:
+        """Write pending rows to disk."""
+        self._seal()
+
+    def nbytes(self) -> Dict[str, int]:
+        """Size of each column : mapped (paged in only where read), and pending rows (shallow)."""
+        return {
+            n: self._columns[n].nbytes + sys.getsizeof(col)
+            for n, col in zip(self.columns, self._open)
+        }
+
+    def row(self, position: int) -> Tuple[Any, ...]:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+
+        if position >= self._sealed:
+            return tuple(col[position - self._sealed] for col in self._open)
+        return tuple(self._columns[n].get(position) for n in self.columns)
+
+    def searchsorted(self, name: str, value: Any, side: str = "left") -> int:
+        """Binary search of value in a column sorted in ascending order, only paging in what is compared."""
+        col = self._columns[name]
+        if not col.variable and not col.nullable:
+            pos = int(
+                np.searchsorted(col._values, np.asarray(value, dtype=col.dtype), side)
+            )
+        else:
+            lo, hi = 0, self._sealed
+            while lo < hi:
+                mid = (lo + hi) // 2
+                v = col.get(mid)
+                if v < value or (side == "right" and v == value):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            pos = lo
+
+        if pos < self._sealed:
+            return pos
+        pending = self._open[self.columns.index(name)]
+        bisect = bisect_right if side == "right" else bisect_left
+        return self._sealed + bisect(pending, value)
+
+    def slice(self, start: int, stop: int) -> pd.DataFrame:
+        """Rows from start to stop. Fixed width columns are views on the mapped files."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+
+        pieces = []
+        a, b = min(start, self._sealed), min(stop, self._sealed)
+        if a < b:
+            pieces.append(
+                _frame_of({n: self._columns[n].series(a, b) for n in self.columns})
+            )
+        if stop > self._sealed:
+            a, b = max(start - self._sealed, 0), stop - self._sealed
+            pieces.append(
+                pd.DataFrame(
+                    {
+                        n: (
+                            pd.Series(col[a:b], dtype=self._columns[n].dtype)
+                            if not (
+                                self._columns[n].variable or self._columns[n].nullable
+                            )
+                            else pd.Series(col[a:b], dtype=object)
+                        )
+                        for n, col in zip(self.columns, self._open)
+                    },
+                    columns=list(self.columns),
+                )
+            )
+
+        if not pieces:
+            return pd.DataFrame(columns=list(self.columns))
+        if len(pieces) == 1:
+            return pieces[0]
+        return pd.concat(pieces, ignore_index=True)
+
+    def frame(self) -> pd.DataFrame:
+        """All rows. Fixed width columns are views on the mapped files, variable width ones are read."""
+        return self.slice(0, len(self))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
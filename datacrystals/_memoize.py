@@ -0,0 +1,355 @@
+# Memoization of python functions, with the cache contents recorded as a collection of call crystals.
+import functools
+import inspect
+import os
+import pickle
+import sys
+import types
+from collections import OrderedDict, namedtuple
+from dataclasses import make_dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, get_type_hints
+
+from ._binary import MAGIC
+from ._collection import _collection_from_class
+from ._crystals import datacrystal
+
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+# evicted rows are dropped from the recorded calls once they outnumber live ones (and at least this many)
+_COMPACT_MIN = 1024
+
+# the clock used to record calls (replaceable, for tests)
+_now = datetime.now
+
+
+class _LRU:
+    """Least recently used first."""
+
+    __slots__ = ("_order",)
+
+    def __init__(self):
+        self._order: Dict[Hashable, None] = OrderedDict()
+
+    def add(self, key: Hashable) -> None:
+        self._order[key] = None
+
+    def hit(self, key: Hashable) -> None:
+        self._order.move_to_end(key)
+
+    def remove(self, key: Hashable) -> None:
+        del self._order[key]
+
+    def victim(self) -> Hashable:
+        return next(iter(self._order))
+
+
+class _LFU:
+    """
+    Least frequently used first (then least recently added), in O(1) : keys are bucketed by hit count.
+
+    >>> lfu = _LFU()
+    >>> for k in "abc":
+    ...     lfu.add(k)
+    >>> lfu.hit("a"); lfu.hit("b"); lfu.hit("a")
+    >>> lfu.victim()
+    'c'
+    >>> lfu.remove("c")
+    >>> lfu.victim()
+    'b'
+    """
+
+    __slots__ = ("_counts", "_buckets", "_least")
+
+    def __init__(self):
+        self._counts: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        self._least = 0
+
+    def _take(self, key: Hashable) -> int:
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+        return count
+
+    def add(self, key: Hashable) -> None:
+        self._counts[key] = 1
+        self._buckets.setdefault(1, {})[key] = None
+        self._least = 1
+
+    def hit(self, key: Hashable) -> None:
+        count = self._take(key) + 1
+        self._counts[key] = count
+        self._buckets.setdefault(count, {})[key] = None
+
+    def remove(self, key: Hashable) -> None:
+        self._take(key)
+
+    def victim(self) -> Hashable:
+        if self._least not in self._buckets:
+            self._least = min(self._buckets)
+        return next(iter(self._buckets[self._least]))
+
+
+_POLICIES = {"lru": _LRU, "lfu": _LFU}
+
+
+class _Entry:
+    """A live cache entry : the result, and where its call is recorded."""
+
+    __slots__ = ("result", "position", "at", "size")
+
+    def __init__(self, result: Any, position: int, at: datetime, size: int):
+        self.result = result
+        self.position = position
+        self.at = at
+        self.size = size
+
+
+def _camel(name: str) -> str:
+    return "".join(p[:1].upper() + p[1:] for p in name.split("_"))
+
+
+class _Memoized:
+    """
+    A function, memoized. Each computed call is recorded as a `Call` crystal (arguments, result, time),
+    in `calls`, a collection hash-indexed on the arguments.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        maxsize: Optional[int],
+        policy: str,
+        ttl: Optional[timedelta],
+        maxbytes: Optional[int],
+    ):
+        if policy not in _POLICIES:
+            raise ValueError(f"Unknown policy {policy}, not one of {set(_POLICIES)}")
+        if maxsize is not None and maxsize < 1:
+            raise ValueError(f"maxsize must be positive, not {maxsize}")
+
+        self._signature = inspect.signature(fn)
+        params = list(self._signature.parameters.values())
+        if any(p.kind in (p.VAR_POSITIONAL, p.VAR_KEYWORD) for p in params):
+            raise TypeError(f"Cannot memoize {fn.__name__}, with variadic arguments")
+        names = [p.name for p in params]
+        if {"result", "at"}.intersection(names):
+            raise TypeError(
+                f"Cannot memoize {fn.__name__}, with a result or at argument"
+            )
+
+        hints = get_type_hints(fn)
+        fields = [(n, hints.get(n, Any)) for n in names]
+        self.Args = datacrystal(
+            make_dataclass(
+                _camel(fn.__name__) + "Args",
+                fields,
+                namespace={"__module__": fn.__module__},
+            )
+        )
+        self.Call = datacrystal(
+            make_dataclass(
+                _camel(fn.__name__) + "Call",
+                fields + [("result", hints.get("return", Any)), ("at", datetime)],
+                namespace={"__module__": fn.__module__},
+            )
+        )
+        self._Calls = _collection_from_class(self.Call, key=names or None)
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._fn = fn
+        self._nparams = len(names)
+        self.cache_clear()
+        functools.update_wrapper(self, fn)
+
+    def cache_clear(self) -> None:
+        """Drop all entries, and statistics."""
+        self._calls = self._Calls()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._policy = _POLICIES[self.policy]()
+        self._nbytes = 0
+        self._hits = self._misses = self._evictions = 0
+
+    def cache_info(self) -> CacheInfo:
+        """Hit and miss statistics, as functools.lru_cache does, with evictions."""
+        return CacheInfo(
+            self._hits, self._misses, self._evictions, self.maxsize, len(self._entries)
+        )
+
+    def _key(self, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[Any, ...]:
+        if not kwargs and len(args) == self._nparams:
+            return args
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple(bound.arguments.values())
+
+    def _expired(self, at: datetime) -> bool:
+        return self.ttl is not None and _now() - at > self.ttl
+
+    def _evict(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._policy.remove(key)
+        self._nbytes -= entry.size
+        self._evictions += 1
+
+    def _record(self, key: Tuple[Any, ...], result: Any, at: datetime) -> Any:
+        # returns the result as validated : the one cached, and recorded
+        # Note : positional, a method has a `self` argument
+        call = self.Call(*key, result, at)
+        self._calls(call)
+        size = sum(sys.getsizeof(v) for v in key) + sys.getsizeof(call.result)
+        self._entries[key] = _Entry(call.result, len(self._calls) - 1, at, size)
+        self._policy.add(key)
+        self._nbytes += size
+
+        while self._entries and (
+            (self.maxsize is not None and len(self._entries) > self.maxsize)
+            or (self.maxbytes is not None and self._nbytes > self.maxbytes)
+        ):
+            self._evict(self._policy.victim())
+        dead = len(self._calls) - len(self._entries)
+        if dead > max(len(self._entries), _COMPACT_MIN):
+            self._compact()
+        return call.result
+
+    def _compact(self) -> None:
+        # a new collection with only the live calls, in the order they were recorded
+        live = sorted(self._entries.items(), key=lambda kv: kv[1].position)
+        frame = self._calls._data.slice(0, len(self._calls))
+        calls = self._Calls()
+        calls._append_frame(
+            frame.iloc[[e.position for _, e in live]].reset_index(drop=True)
+        )
+        for position, (_, entry) in enumerate(live):
+            entry.position = position
+        self._calls = calls
+
+    def __call__(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry.at):
+                self._hits += 1
+                self._policy.hit(key)
+                return entry.result
+            self._evict(key)
+
+        self._misses += 1
+        return self._record(key, self._fn(*args, **kwargs), _now())
+
+    def __get__(self, obj: Any, objtype: Optional[type] = None):
+        # a method : bound to the instance, which is an argument like any other (all instances share the cache)
+        if obj is None:
+            return self
+        return types.MethodType(self, obj)
+
+    @property
+    def calls(self):
+        """
+        The live cache entries, as a collection of Call crystals, in the order they were computed.
+        This collection is shared : appending to it does not add entries to the cache.
+        """
+        if len(self._calls) > len(self._entries):
+            self._compact()
+        return self._calls
+
+    def save(self, path: str) -> None:
+        """
+        Write the live entries to a file, replaced atomically, to warm-start another cache with load().
+        When some arguments or results have no column representation (like parameters without type hint),
+        entries are pickled instead.
+        """
+        try:
+            raw = self.calls.to_bytes()
+        except (TypeError, ValueError):
+            names = self.Call.__crystal_fields__.names
+            raw = pickle.dumps(
+                [tuple(getattr(c, n) for n in names) for c in self.calls],
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path: str, allow_pickle: bool = False) -> None:
+        """
+        Add the entries saved in a file, except expired ones, in the order they were computed.
+        Pickled entries (see save()) can run arbitrary code when loaded : they are only loaded with
+        allow_pickle=True, from a file you trust.
+        """
+        with open(path, "rb") as f:
+            raw = f.read()
+        if raw.startswith(MAGIC):
+            saved = self._Calls.from_bytes(raw)
+        elif allow_pickle:
+            saved = [self.Call._from_trusted(*row) for row in pickle.loads(raw)]
+        else:
+            raise ValueError(
+                f"{path} holds pickled entries, only loaded with allow_pickle=True"
+            )
+        for call in saved:
+            key = tuple(getattr(call, n) for n in self._signature.parameters)
+            if self._expired(call.at):
+                continue
+            if key in self._entries:
+                self._evict(key)
+            self._record(key, call.result, call.at)
+
+
+def memoize(
+    fn: Optional[Callable] = None,
+    *,
+    maxsize: Optional[int] = 128,
+    policy: str = "lru",
+    ttl: Optional[timedelta] = None,
+    maxbytes: Optional[int] = None,
+):
+    """
+    Decorator memoizing a function, as functools.lru_cache does, recording its calls in a collection.
+
+    The argument crystal (`Args`) and the call crystal (`Call`: arguments, result and time) are derived from
+    the function type hints. Arguments and results are validated against these hints : the memoized function returns
+    its result as validated (and raises ValidationError if it is not valid), the same as cached and recorded.
+    Entries are evicted beyond `maxsize` entries, or beyond `maxbytes` (estimated from the
+    shallow sizes of arguments and results), least recently used first (policy="lru"), or least frequently used first
+    (policy="lfu"). Entries older than `ttl` are computed again.
+
+    >>> @memoize(maxsize=2)
+    ... def square(x: int) -> int:
+    ...     return x * x
+    >>> square(2), square(3), square(2), square(4)
+    (4, 9, 4, 16)
+    >>> square.cache_info()
+    CacheInfo(hits=1, misses=3, evictions=1, maxsize=2, currsize=2)
+
+    Cached calls are a collection, to query, save, and load in another cache:
+    >>> [(c.x, c.result) for c in square.calls]
+    [(2, 4), (4, 16)]
+    >>> square.calls.lookup(4)
+    [1]
+    """
+
+    def wrap(fn: Callable) -> _Memoized:
+        return _Memoized(fn, maxsize=maxsize, policy=policy, ttl=ttl, maxbytes=maxbytes)
+
+    if fn is None:
+        return wrap
+
+    return wrap(fn)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,162 @@
+# Parallel map / filter / reduce over collections : column shards are shipped to worker processes in shared memory.
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from ._binary import _pack_columns, _unpack_columns
+from ._mapped import _objects
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8 : shards are pickled to the workers instead
+    shared_memory = None  # type: ignore
+
+# a shard : the name and size of a shared memory block with its packed columns, or the columns themselves
+_Shard = Union[Tuple[str, int], pd.DataFrame]
+
+# shards per worker, to balance the load when some shards take longer
+_SHARDS_PER_WORKER = 4
+
+
+def _workers(workers: Optional[int]) -> int:
+    # all cores by default
+    workers = os.cpu_count() or 1 if workers is None else workers
+    if workers < 1:
+        raise ValueError(f"Workers must be positive, not {workers}")
+    return workers
+
+
+def _crystals(_cls: Type[Any], frame: pd.DataFrame) -> Iterator[Any]:
+    # rows were validated on the way in, the crystals are not validated again
+    for _, *row in frame.itertuples(index=True, name=None):
+        yield _cls._from_trusted(*row)
+
+
+def _packed(into: Type[Any], results: List[Any]) -> Union[bytes, List[Any]]:
+    # mapped crystals, sent back as packed columns : much cheaper than pickling each crystal
+    if not all(isinstance(r, into) for r in results):
+        return results  # for the caller to report
+    frame = pd.DataFrame(
+        {
+            n: _objects([getattr(r, n) for r in results])
+            for n in into.__crystal_fields__.names
+        },
+        index=pd.RangeIndex(len(results)),
+        copy=False,
+    )
+    try:
+        return _pack_columns(into, frame)
+    except (TypeError, ValueError):  # not representable in columns
+        return results
+
+
+def _apply(task: str, _cls: Type[Any], frame: pd.DataFrame, fn: Callable, *args) -> Any:
+    """
+    Run a task on the crystals of a frame : a list of mapped crystals, a boolean mask, or a reduced value.
+
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...
+    >>> frame = pd.DataFrame({"answer": [42, 51]})
+    >>> _apply("filter", Shard, frame, lambda s: s.answer > 50)
+    array([False,  True])
+    >>> _apply("reduce", Shard, frame, lambda acc, s: acc + s.answer, 0)
+    93
+    """
+    crystals = _crystals(_cls, frame)
+    if task == "map":
+        return [fn(c) for c in crystals]
+    if task == "filter":
+        return np.fromiter(
+            (bool(fn(c)) for c in crystals), dtype=bool, count=len(frame)
+        )
+    if task == "reduce":
+        return functools.reduce(fn, crystals, *args)
+    raise ValueError(f"Unknown task {task}")
+
+
+def _run(task: str, _cls: Type[Any], shard: _Shard, fn: Callable, *args) -> Any:
+    # in a worker process
+    if isinstance(
+        shard, pd.DataFrame
+    ):  # not representable in columns : neither are the results, likely
+        return _apply(task, _cls, shard, fn, *args)
+
+    name, size = shard
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        frame = _unpack_columns(_cls, shm.buf[:size])
+        result = _apply(task, _cls, frame, fn, *args)
+        if task == "map":
+            result = _packed(args[0], result)
+        # Note : no view on the shared memory can remain, for it to be closed
+        del frame
+        return result
+    finally:
+        try:
+            shm.close()
+        except (
+            BufferError
+        ):  # views still referenced by an exception from fn, closed when collected
+            pass
+
+
+def _parallel(
+    task: str,
+    _cls: Type[Any],
+    data: Any,
+    fn: Callable,
+    *args,
+    workers: Optional[int] = 1,
+) -> List[Any]:
+    """
+    Results of a task, per shard of the collection data (in order).
+    Mapped crystals come back as packed columns when possible, else as a list.
+    With one worker, or with little data, everything runs in this process, on the whole data.
+    Otherwise `fn` must be picklable (a module level function, not a lambda).
+    """
+    workers = _workers(workers)
+    length = len(data)
+    nshards = min(length, workers * _SHARDS_PER_WORKER)
+    if workers == 1 or nshards < 2:
+        return [_apply(task, _cls, data.slice(0, length), fn, *args)]
+
+    bounds = np.linspace(0, length, nshards + 1, dtype=int)
+    blocks = []
+    try:
+        shards: List[_Shard] = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            frame = data.slice(int(start), int(stop))
+            raw = None
+            if shared_memory is not None:
+                try:
+                    raw = _pack_columns(_cls, frame)
+                except (TypeError, ValueError):  # not representable in columns
+                    pass
+            if raw is None:
+                shards.append(frame.reset_index(drop=True))
+                continue
+            shm = shared_memory.SharedMemory(create=True, size=max(len(raw), 1))
+            blocks.append(shm)
+            shm.buf[: len(raw)] = raw
+            shards.append((shm.name, len(raw)))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run, task, _cls, s, fn, *args) for s in shards]
+            return [f.result() for f in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
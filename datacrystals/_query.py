@@ -0,0 +1,232 @@
+# Vectorized queries on collections : expressions over crystal field names, evaluated column per column.
+import functools
+import operator
+from dataclasses import MISSING
+from dataclasses import field as dataclass_field
+from dataclasses import fields, make_dataclass
+from typing import Any, Callable, FrozenSet, Iterable, List, Mapping, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from ._buffer import _reindexed
+from ._crystals import datacrystal
+
+# rows of stored data evaluated at once, so that it is only paged in chunk by chunk
+QUERY_CHUNKSIZE = 1 << 16
+
+
+def _frame(columns: Any) -> pd.DataFrame:
+    # a dataframe, a batch (its frame), or a mapping of arrays (without copy)
+    columns = getattr(columns, "frame", columns)
+    if isinstance(columns, pd.DataFrame):
+        return columns
+    if isinstance(columns, Mapping):
+        return pd.DataFrame(dict(columns), copy=False)
+    raise TypeError(f"Cannot evaluate an expression on {type(columns).__name__}")
+
+
+def _nulls(v: Any) -> Any:
+    # Note : Decimal('NaN') is a null here, it cannot be ordered either
+    return v.isna() if isinstance(v, pd.Series) else v is None
+
+
+def _ordering(op: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    # nulls are never ordered with anything (as in SQL) : false, instead of raising on object columns
+    def compare(a: Any, b: Any) -> Any:
+        nulls = _nulls(a) | _nulls(b)
+        if not np.any(nulls):
+            return op(a, b)
+        index = a.index if isinstance(a, pd.Series) else b.index
+        result = pd.Series(False, index=index)
+        keep = ~nulls
+        if np.any(keep):
+            result[keep] = op(
+                a[keep] if isinstance(a, pd.Series) else a,
+                b[keep] if isinstance(b, pd.Series) else b,
+            )
+        return result
+
+    return compare
+
+
+class Expression:
+    """
+    An expression over the fields of a crystal, evaluated on columns at once (vectorized).
+    Built from column(name), with comparisons, & | ~ and isin(). Calling it on columns
+    (a dataframe, a batch, or a mapping of arrays) gives a boolean mask.
+
+    >>> e = (column("answer") > 40) & column("question").isin(["Why ?"])
+    >>> e
+    ((answer > 40) & question.isin(['Why ?']))
+    >>> e({"answer": [42, 51, 33], "question": ["Why ?", "What ?", "Why ?"]})
+    array([ True, False, False])
+    """
+
+    __slots__ = ("_evaluate", "_text", "fields")
+
+    def __init__(
+        self, evaluate: Callable[[pd.DataFrame], Any], text: str, names: FrozenSet[str]
+    ):
+        self._evaluate = evaluate
+        self._text = text
+        self.fields = names  # referenced
+
+    def __repr__(self) -> str:
+        return self._text
+
+    def __call__(self, columns: Any) -> np.ndarray:
+        frame = _frame(columns)
+        mask = self._evaluate(frame)
+        if isinstance(mask, pd.Series):
+            mask = mask.to_numpy()
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (len(frame),))
+
+    def __bool__(self):
+        raise TypeError(
+            f"{self} has no truth value : use & | ~ instead of and, or, not (nor chained comparisons)"
+        )
+
+    def _binary(self, other: Any, op: Callable[[Any, Any], Any], symbol: str):
+        if isinstance(other, Expression):
+            evaluate = other._evaluate
+            text, names = repr(other), other.fields
+        else:
+            evaluate = lambda frame: other  # noqa: E731
+            text, names = repr(other), frozenset()
+        return Expression(
+            lambda frame: op(self._evaluate(frame), evaluate(frame)),
+            f"({self} {symbol} {text})",
+            self.fields | names,
+        )
+
+    def __eq__(self, other: Any) -> "Expression":  # type: ignore
+        return self._binary(other, operator.eq, "==")
+
+    def __ne__(self, other: Any) -> "Expression":  # type: ignore
+        return self._binary(other, operator.ne, "!=")
+
+    def __lt__(self, other: Any) -> "Expression":
+        return self._binary(other, _ordering(operator.lt), "<")
+
+    def __le__(self, other: Any) -> "Expression":
+        return self._binary(other, _ordering(operator.le), "<=")
+
+    def __gt__(self, other: Any) -> "Expression":
+        return self._binary(other, _ordering(operator.gt), ">")
+
+    def __ge__(self, other: Any) -> "Expression":
+        return self._binary(other, _ordering(operator.ge), ">=")
+
+    def __and__(self, other: Any) -> "Expression":
+        return self._binary(other, operator.and_, "&")
+
+    def __or__(self, other: Any) -> "Expression":
+        return self._binary(other, operator.or_, "|")
+
+    def __invert__(self) -> "Expression":
+        return Expression(lambda frame: ~self._evaluate(frame), f"~{self}", self.fields)
+
+    # comparisons build expressions, they are not hashable
+    __hash__ = None  # type: ignore
+
+    def isin(self, values: Iterable[Any]) -> "Expression":
+        """Whether values are among `values`."""
+        values = list(values)
+        return Expression(
+            lambda frame: self._evaluate(frame).isin(values),
+            f"{self}.isin({values!r})",
+            self.fields,
+        )
+
+    def isnull(self) -> "Expression":
+        """Whether values are None (or NaN)."""
+        return Expression(
+            lambda frame: self._evaluate(frame).isna(), f"{self}.isnull()", self.fields
+        )
+
+
+def column(name: str) -> Expression:
+    """The values of a field, to build expressions on. Fields are checked when the expression is used."""
+    return Expression(lambda frame: frame[name], name, frozenset([name]))
+
+
+def _checked(expr: Expression, _cls: Type[Any]) -> Expression:
+    unknown = set(expr.fields.difference(_cls.__crystal_fields__.names))
+    if unknown:
+        raise ValueError(f"{unknown} are not fields of {_cls.__name__}")
+    return expr
+
+
+def _where(
+    data: Any, expr: Expression, chunksize: int
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Rows of the data (a column buffer) matching the expression, and their positions.
+    Evaluated `chunksize` rows at a time, only matching rows are kept from each chunk.
+    The rows are a view, not a copy, when all rows of a chunk match.
+    """
+    pieces: List[pd.DataFrame] = []
+    positions: List[np.ndarray] = []
+    for start in range(0, len(data), chunksize):
+        frame = data.slice(start, start + chunksize)
+        mask = expr(frame)
+        if mask.all():
+            pieces.append(frame)
+        elif mask.any():
+            pieces.append(frame[mask])
+        positions.append(np.flatnonzero(mask) + start)
+
+    found = np.concatenate(positions) if positions else np.zeros(0, dtype=int)
+    if not pieces:
+        return data.slice(0, 0), found
+    if len(pieces) == 1:
+        return _reindexed(pieces[0]), found
+    return pd.concat(pieces, ignore_index=True), found
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _projection(_cls: Type[Any], names: Tuple[str, ...]) -> Type[Any]:
+    """
+    The crystal type with only some fields of another, with the same types and defaults.
+    Fields are in the order given, except that fields without default come first, as dataclasses require.
+
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...     question: str = "What is the answer ?"
+    ...
+    >>> _projection(Shard, ("question",))()
+    ShardQuestion(question='What is the answer ?')
+    """
+    declared = {f.name: f for f in fields(_cls)}
+    unknown = set(names).difference(declared)
+    if unknown:
+        raise ValueError(f"{unknown} are not fields of {_cls.__name__}")
+
+    projected = []
+    for n in names:
+        f = declared[n]
+        if f.default is not MISSING:
+            projected.append((n, f.type, dataclass_field(default=f.default)))
+        elif f.default_factory is not MISSING:  # type: ignore
+            projected.append(
+                (n, f.type, dataclass_field(default_factory=f.default_factory))  # type: ignore
+            )
+        else:
+            projected.append((n, f.type))
+    projected.sort(key=lambda p: len(p) == 3)
+
+    name = _cls.__name__ + "".join(
+        p[:1].upper() + p[1:] for n in names for p in n.split("_")
+    )
+    return datacrystal(
+        make_dataclass(name, projected, namespace={"__module__": _cls.__module__})
+    )
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,86 @@
+# Asyncio machinery to follow the flow of time : consumers wait for appends, producers for consumers.
+import asyncio
+from typing import Optional, Set
+
+
+class _Cursor:
+    """Position of one async consumer in the collection."""
+
+    __slots__ = ("pos",)
+
+    def __init__(self, pos: int):
+        self.pos = pos
+
+
+class _Stream:
+    """
+    Wakes up pending async consumers when rows are appended, without polling.
+
+    All consumers wait on the same future, and all appends happening before the loop gets control again
+    are coalesced in one wakeup.
+    Producers can wait for the slowest consumer to be less than `maxlag` rows behind (backpressure).
+    """
+
+    __slots__ = ("maxlag", "_cursors", "_appended", "_drained", "_scheduled")
+
+    def __init__(self, maxlag: int):
+        self.maxlag = maxlag
+        self._cursors: Set[_Cursor] = set()
+        # consumers waiting for rows, and producers waiting for consumers
+        self._appended: Optional[asyncio.Future] = None
+        self._drained: Optional[asyncio.Future] = None
+        self._scheduled = False
+
+    # consumers side
+
+    def follow(self, pos: int) -> _Cursor:
+        cursor = _Cursor(pos)
+        self._cursors.add(cursor)
+        return cursor
+
+    def forget(self, cursor: _Cursor, length: int) -> None:
+        self._cursors.discard(cursor)
+        if not self._cursors:
+            # nobody waits anymore, and that future may belong to a loop already closed
+            self._appended = None
+        self.advanced(length)
+
+    async def appended(self) -> None:
+        if self._appended is None:
+            self._appended = asyncio.get_event_loop().create_future()
+        # shielded : a cancelled consumer must not cancel the wakeup of others
+        await asyncio.shield(self._appended)
+
+    def advanced(self, length: int) -> None:
+        # called by consumers when they moved forward, only costs something if a producer is waiting
+        if self._drained is not None and self.lag(length) <= self.maxlag:
+            drained, self._drained = self._drained, None
+            if not drained.done():
+                drained.set_result(None)
+
+    # producers side
+
+    def notify(self) -> None:
+        if self._appended is not None and self._appended.get_loop().is_closed():
+            # its consumers are gone with their loop
+            self._appended, self._scheduled = None, False
+        if self._appended is not None and not self._scheduled:
+            self._scheduled = True
+            # threadsafe, in case the producer is not running in the loop thread
+            self._appended.get_loop().call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        self._scheduled = False
+        appended, self._appended = self._appended, None
+        if appended is not None and not appended.done():
+            appended.set_result(None)
+
+    def lag(self, length: int) -> int:
+        # number of rows the slowest consumer has not seen yet
+        return length - min((c.pos for c in self._cursors), default=length)
+
+    async def drained(self, length: int) -> None:
+        while self.lag(length) > self.maxlag:
+            if self._drained is None:
+                self._drained = asyncio.get_event_loop().create_future()
+            await asyncio.shield(self._drained)
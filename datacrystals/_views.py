@@ -0,0 +1,172 @@
+# Lightweight views on collection data, to avoid building (and validating) crystals when reading.
+import functools
+from dataclasses import fields
+from typing import Any, Dict, Iterator, List, Sequence, Type
+
+import numpy as np
+import pandas as pd
+
+
+def _field_getter(i: int):
+    # straight to the column array, no dict, no validation
+    def get(slf):
+        return slf._columns[i][slf._pos]
+
+    return get
+
+
+def _view_repr(slf) -> str:
+    attrs = ", ".join(f"{n}={getattr(slf, n)!r}" for n in slf._names)
+    return f"{type(slf).__name__}({attrs})"
+
+
+def _view_dir(slf) -> List[str]:
+    return list(slf._names) + ["materialize"]
+
+
+def _view_columns(frame: pd.DataFrame, names: Sequence[str]) -> tuple:
+    # numpy arrays viewing the columns, except times : read as Timestamp (datetime) objects, as rows are
+    return tuple(
+        frame[n].to_numpy(dtype=object)
+        if frame[n].dtype.kind in "mM"
+        else frame[n].to_numpy()
+        for n in names
+    )
+
+
+def _view_init(slf, columns: Sequence[np.ndarray], pos: int):
+    slf._columns = columns
+    slf._pos = pos
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _row_view_class(_cls: Type[Any]) -> Type[Any]:
+    """
+    Build the read-only row view type for a datacrystal type.
+    The data was validated on the way in, so no validation happens here, nor when materialize() builds the instance.
+
+    >>> import numpy as np
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...     question: str = "What is the answer ?"
+    ...
+    >>> ShardView = _row_view_class(Shard)
+    >>> v = ShardView((np.array([42, 51]), np.array(["Why ?", "What ?"], dtype=object)), 1)
+    >>> v.question
+    'What ?'
+    >>> v.materialize()
+    Shard(answer=51, question='What ?')
+    """
+
+    names = tuple(f.name for f in fields(_cls))
+
+    def materialize(slf) -> Any:
+        """Build the actual crystal instance from the viewed row."""
+        return _cls._from_trusted(*(col[slf._pos] for col in slf._columns))
+
+    view_attr = {
+        "__slots__": ("_columns", "_pos"),
+        "__init__": _view_init,
+        "__repr__": _view_repr,
+        "__dir__": _view_dir,
+        "_names": names,
+        "Inner": _cls,
+        "materialize": materialize,
+    }
+    for i, n in enumerate(names):
+        # properties without setter : views are read-only
+        view_attr[n] = property(_field_getter(i))
+
+    return type(_cls.__name__ + "View", (), view_attr)
+
+
+def _batch_column(col: pd.Series) -> np.ndarray:
+    # numpy view on the column slice, no copy, with the numpy dtype of a nullable column when no value is null
+    numpy_dtype = getattr(col.dtype, "numpy_dtype", None)
+    if numpy_dtype is not None and not col.hasnans:
+        return col.to_numpy(dtype=numpy_dtype)
+    return col.to_numpy()
+
+
+def _column_getter(name: str):
+    def get(slf) -> np.ndarray:
+        return _batch_column(slf.frame[name])
+
+    return get
+
+
+def _batch_init(slf, frame: pd.DataFrame, start: int):
+    slf.frame = frame
+    slf.start = start
+
+
+def _batch_len(slf) -> int:
+    return len(slf.frame)
+
+
+def _batch_repr(slf) -> str:
+    return f"{type(slf).__name__}(start={slf.start}, len={len(slf.frame)})"
+
+
+def _batch_dir(slf) -> List[str]:
+    return list(slf._names) + ["Inner", "frame", "start", "columns", "rows"]
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _batch_class(_cls: Type[Any]) -> Type[Any]:
+    """
+    Build the batch type for a datacrystal type.
+    A batch is a slice of a collection, exposing each field as a numpy array (a view, not a copy),
+    and keeping track of the crystal type it contains.
+
+    >>> import pandas as pd
+    >>> from datacrystals import datacrystal
+    >>> @datacrystal
+    ... class Shard:
+    ...     answer: int
+    ...     question: str = "What is the answer ?"
+    ...
+    >>> ShardBatch = _batch_class(Shard)
+    >>> b = ShardBatch(pd.DataFrame({"answer": [42, 51], "question": ["Why ?", "What ?"]}), 0)
+    >>> b.answer.sum()
+    93
+    >>> b.Inner is Shard
+    True
+    """
+
+    names = tuple(f.name for f in fields(_cls))
+    View = _row_view_class(_cls)
+
+    def columns(slf) -> Dict[str, np.ndarray]:
+        """All fields as numpy arrays."""
+        return {n: _batch_column(slf.frame[n]) for n in names}
+
+    def rows(slf) -> Iterator[Any]:
+        """Read-only views on each row of the batch."""
+        cols = _view_columns(slf.frame, names)
+        for pos in range(len(slf.frame)):
+            yield View(cols, pos)
+
+    batch_attr = {
+        "__slots__": ("frame", "start"),
+        "__init__": _batch_init,
+        "__len__": _batch_len,
+        "__repr__": _batch_repr,
+        "__dir__": _batch_dir,
+        "_names": names,
+        "Inner": _cls,
+        "columns": columns,
+        "rows": rows,
+    }
+    for n in names:
+        batch_attr[n] = property(_column_getter(n))
+
+    return type(_cls.__name__ + "Batch", (), batch_attr)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,242 @@
+# Durable collections : an append-only log of every accepted append, and columnar snapshots bounding its replay.
+# In the directory, snapshot-<seq>.dcc holds all rows logged before the segment log-<seq>.wal, later segments follow.
+import atexit
+import json
+import os
+import struct
+import threading
+import weakref
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+FSYNCS = ("always", "group", "never")
+
+# kinds of records : one packed row, or packed columns
+ROW, FRAME = 0, 1
+
+MAGIC = b"DCW\x01"
+_HEADER = struct.Struct("<4sI")  # magic, and json header size
+_RECORD = struct.Struct("<BII")  # kind, payload size, crc32 of the payload
+
+_SNAPSHOT = "snapshot-{:08d}.dcc"
+_SEGMENT = "log-{:08d}.wal"
+
+# open logs, their pending group is committed when the interpreter exits (the timer thread is a daemon)
+_LOGS: "weakref.WeakSet[_Log]" = weakref.WeakSet()
+
+
+@atexit.register
+def _commit_all() -> None:
+    for log in list(_LOGS):
+        log.commit()
+
+
+def _sequences(root: str, prefix: str, ext: str) -> List[int]:
+    found = []
+    for name in os.listdir(root):
+        stem, e = os.path.splitext(name)
+        if e == ext and stem.startswith(prefix) and stem[len(prefix) :].isdigit():
+            found.append(int(stem[len(prefix) :]))
+    return sorted(found)
+
+
+def _sync_dir(root: str) -> None:
+    # a created (or renamed) file is only durable once its directory is
+    fd = os.open(root, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _records(raw: bytes) -> Iterator[Tuple[int, bytes]]:
+    """
+    The records of a log segment (after its header), up to the first incomplete or corrupted one :
+    the tail of a segment may be torn by a crash, it was never committed.
+
+    >>> payload = b"answer"
+    >>> record = _RECORD.pack(ROW, len(payload), zlib.crc32(payload)) + payload
+    >>> list(_records(record + record[:-1]))
+    [(0, b'answer')]
+    """
+    pos = 0
+    view = memoryview(raw)
+    while pos + _RECORD.size <= len(raw):
+        kind, size, crc = _RECORD.unpack_from(raw, pos)
+        start = pos + _RECORD.size
+        payload = view[start : start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            return
+        yield kind, bytes(payload)
+        pos = start + size
+
+
+def _replay(
+    root: str,
+    header: Dict[str, str],
+    snapshot: Callable[[bytes], None],
+    record: Callable[[int, bytes], None],
+) -> int:
+    """
+    Loads the last snapshot, then replays the log segments after it, in order.
+    Returns the sequence of the next segment.
+    """
+    os.makedirs(root, exist_ok=True)
+    snapshots = _sequences(root, "snapshot-", ".dcc")
+    start = snapshots[-1] if snapshots else 0
+    if snapshots:
+        with open(os.path.join(root, _SNAPSHOT.format(start)), "rb") as f:
+            snapshot(f.read())
+
+    segments = [s for s in _sequences(root, "log-", ".wal") if s >= start]
+    for seq in segments:
+        with open(os.path.join(root, _SEGMENT.format(seq)), "rb") as f:
+            raw = f.read()
+        if len(raw) < _HEADER.size:  # created, but not even its header was written
+            continue
+        magic, size = _HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{_SEGMENT.format(seq)} is not a log segment")
+        stored = json.loads(raw[_HEADER.size : _HEADER.size + size])
+        if stored != header:
+            raise ValueError(f"{root} logs {stored}, not {header}")
+        for kind, payload in _records(raw[_HEADER.size + size :]):
+            record(kind, payload)
+    return max(segments + [start - 1]) + 1
+
+
+class _Log:
+    """
+    The append-only log of a durable collection, in segments.
+    Records are committed by groups : written (and synced, with fsync="group") every `group` records,
+    and at most `interval` seconds after the first record of a group was buffered (by a timer thread, even if
+    appends pause), on commit(), and when the interpreter exits. Only committed records survive a crash.
+    With fsync="always" each record is committed on its own, with fsync="never" committed records are not synced
+    (they survive the process, not the machine).
+    """
+
+    __slots__ = (
+        "root",
+        "fsync",
+        "group",
+        "interval",
+        "snapshot_every",
+        "_header",
+        "_seq",
+        "_buffer",
+        "_pending",
+        "_logged",
+        "_lock",
+        "_timer",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        root: str,
+        seq: int,
+        header: Dict[str, str],
+        fsync: str = "group",
+        group: int = 1024,
+        interval: float = 0.01,
+        snapshot_every: Optional[int] = 1 << 20,
+    ):
+        if fsync not in FSYNCS:
+            raise ValueError(f"{fsync} is not an fsync policy: {FSYNCS}")
+        self.root = root
+        self.fsync = fsync
+        self.group = 1 if fsync == "always" else group
+        self.interval = interval
+        # rows logged between snapshots, None for never
+        self.snapshot_every = snapshot_every
+        head = json.dumps(header).encode()
+        self._header = _HEADER.pack(MAGIC, len(head)) + head
+        self._buffer = bytearray()
+        self._pending = 0  # records in the buffer
+        self._logged = 0  # rows since the last snapshot
+        # the timer commits from its own thread
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._start(seq)
+        _LOGS.add(self)
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.root, _SEGMENT.format(seq))
+
+    def _start(self, seq: int) -> None:
+        # a new segment, starting with its header : never appending after a torn tail
+        self._seq = seq
+        self._buffer += self._header
+        self.commit()
+        if self.fsync != "never":
+            _sync_dir(self.root)
+
+    def write(self, kind: int, payload: bytes, rows: int) -> None:
+        record = _RECORD.pack(kind, len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._buffer += record
+            self._pending += 1
+            self._logged += rows
+            if self._pending >= self.group:
+                self.commit()
+            elif self._timer is None:  # the first record of a group
+                self._timer = threading.Timer(self.interval, self.commit)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def commit(self) -> None:
+        """Write buffered records to the current segment, and sync it (unless fsync="never")."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._buffer:
+                with open(self._path(self._seq), "ab") as f:
+                    f.write(self._buffer)
+                    f.flush()
+                    if self.fsync != "never":
+                        os.fsync(f.fileno())
+                self._buffer.clear()
+                self._pending = 0
+
+    @property
+    def due(self) -> bool:
+        """Whether enough rows were logged since the last snapshot to take another one."""
+        return self.snapshot_every is not None and self._logged >= self.snapshot_every
+
+    def snapshot(self, raw: bytes) -> None:
+        """
+        Stores all rows (as packed columns), then drops the log before them.
+        The snapshot is written aside and renamed, a crash meanwhile leaves the previous one and the log.
+        """
+        with self._lock:
+            self._snapshot(raw)
+
+    def _snapshot(self, raw: bytes) -> None:
+        self.commit()
+        seq = self._seq + 1
+        path = os.path.join(self.root, _SNAPSHOT.format(seq))
+        with open(path + ".tmp", "wb") as f:
+            f.write(raw)
+            f.flush()
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+        # the segment first : rows logged after this snapshot are in it
+        self._start(seq)
+        os.replace(path + ".tmp", path)
+        if self.fsync != "never":
+            _sync_dir(self.root)
+        self._logged = 0
+
+        for old in _sequences(self.root, "snapshot-", ".dcc"):
+            if old < seq:
+                os.remove(os.path.join(self.root, _SNAPSHOT.format(old)))
+        for old in _sequences(self.root, "log-", ".wal"):
+            if old < seq:
+                os.remove(self._path(old))
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
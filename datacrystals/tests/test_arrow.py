@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+import hypothesis.strategies as st
+import numpy as np
+from hypothesis import given
+from pydantic import condecimal
+
+from datacrystals._collection import _collection_from_class
+from datacrystals._crystals import datacrystal
+from datacrystals.tests.test_collection import Shard, Tick
+from datacrystals.tests.test_crystals import Sample, assert_same
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+
+@datacrystal
+class Quote:
+    price: condecimal(max_digits=10, decimal_places=2)  # type: ignore
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestArrow(unittest.TestCase):
+    @given(data=st.data())
+    def test_roundtrip(self, data):
+        Collec = _collection_from_class(Sample)
+        elems = data.draw(
+            st.lists(
+                Sample.strategy().filter(
+                    lambda e: abs(e.attr_int) < 2 ** 63
+                    and abs(e.attr_opt or 0) < 2 ** 63
+                ),
+                max_size=10,
+            )
+        )
+        table = Collec(*elems).to_arrow()
+
+        assert table.schema.field("attr_int").type == pa.int64()
+        assert not table.schema.field("attr_int").nullable
+        assert table.schema.field("attr_opt").nullable
+        assert table.schema.metadata[b"datacrystal"] == b"Sample"
+
+        assert_same(Collec.from_arrow(table), elems)
+
+    def test_float_nan(self):
+        @datacrystal
+        class Measure:
+            value: float
+            note: Optional[float] = None
+
+        Collec = _collection_from_class(Measure)
+        cinst = Collec(
+            Measure(value=float("nan")), Measure(value=1.0, note=float("nan"))
+        )
+        # NaN and None are both kept, and different
+        assert_same(Collec.from_arrow(cinst.to_arrow()), cinst)
+
+    def test_time_zone(self):
+        Collec = _collection_from_class(Tick)
+        at = datetime(2021, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        cinst = Collec(Tick(ts=at, price=Decimal(1)), Tick(ts=at, price=Decimal(2)))
+        # kept in the arrow type, not converted to naive UTC
+        table = cinst.to_arrow()
+        assert table.column("ts").type == pa.timestamp("ns", tz="+02:00")
+        back = Collec.from_arrow(table)
+        assert list(back) == list(cinst)
+        assert back[0].ts.utcoffset() == timedelta(hours=2)
+
+        # an arrow column has only one time zone
+        with self.assertRaises(ValueError):
+            Collec(
+                Tick(ts=at, price=Decimal(1)),
+                Tick(ts=datetime(2021, 1, 2), price=Decimal(1)),
+            ).to_arrow()
+
+    def test_zero_copy(self):
+        Collec = _collection_from_class(Tick)
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec.from_columns(
+            {
+                "ts": [t0 + timedelta(seconds=s) for s in range(10)],
+                "price": [Decimal(s) / 4 for s in range(10)],
+            }
+        )
+
+        table = cinst.to_arrow()
+        assert np.shares_memory(
+            table.column("ts").chunk(0).to_numpy(), cinst._df.ts.to_numpy()
+        )
+        assert table.column("price").type == pa.string()  # exact, without a scale
+
+        back = Collec.from_arrow(table)
+        assert np.shares_memory(
+            table.column("ts").chunk(0).to_numpy(), back._df.ts.to_numpy()
+        )
+        assert list(back) == list(cinst)
+
+    def test_decimal(self):
+        Collec = _collection_from_class(Quote)
+        prices = [Decimal("1.5"), Decimal("-0.25"), Decimal("12345678.99")]
+        table = Collec.from_columns({"price": prices}).to_arrow()
+
+        assert table.column("price").type == pa.decimal128(10, 2)
+        assert [q.price for q in Collec.from_arrow(table)] == prices
+
+    def test_record_batch(self):
+        Collec = _collection_from_class(Shard)
+        batch = pa.RecordBatch.from_pydict({"answer": [42, 51]})
+        assert list(Collec.from_arrow(batch)) == [Shard(answer=42), Shard(answer=51)]
+
+        with self.assertRaises(TypeError):
+            Collec.from_arrow({"answer": [42]})
+
+
+if __name__ == "__main__":
+    unittest.main()
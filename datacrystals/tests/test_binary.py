@@ -0,0 +1,84 @@
+import pickle
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import hypothesis.strategies as st
+from hypothesis import given, settings
+
+from datacrystals._collection import _collection_from_class
+from datacrystals.tests.test_collection import Shard, Tick
+from datacrystals.tests.test_crystals import Sample, assert_same
+
+
+class TestBinary(unittest.TestCase):
+    @given(elem=Sample.strategy())
+    def test_crystal(self, elem):
+        assert_same(
+            [
+                Sample.from_bytes(elem.to_bytes(), allow_pickle=True),
+                pickle.loads(pickle.dumps(elem)),
+            ],
+            [elem, elem],
+        )
+
+    def test_crystal_fallback(self):
+        # out of the packed representation, but still exact
+        for elem in [
+            Sample(attr_int=2 ** 70, attr_dec=Decimal(1), attr_str="big"),
+            Tick(ts=datetime(2021, 1, 1, tzinfo=timezone.utc), price=Decimal(1)),
+        ]:
+            # pickled : only unpacked when trusted
+            with self.assertRaises(ValueError):
+                type(elem).from_bytes(elem.to_bytes())
+            assert type(elem).from_bytes(elem.to_bytes(), allow_pickle=True) == elem
+            assert pickle.loads(pickle.dumps(elem)) == elem
+
+    @given(elems=st.lists(Sample.strategy(), max_size=20))
+    @settings(deadline=None)
+    def test_collection(self, elems):
+        Collec = _collection_from_class(Sample)
+        cinst = Collec(*elems)
+        restored = pickle.loads(pickle.dumps(cinst))
+        assert type(restored) is Collec
+        assert_same(restored, elems)
+
+    def test_collection_bytes(self):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec(
+            *[
+                Tick(ts=t0 + timedelta(seconds=s), price=Decimal(s) / 4)
+                for s in range(10)
+            ]
+        )
+        raw = cinst.to_bytes()
+        restored = Collec.from_bytes(raw)
+        assert list(restored) == list(cinst)
+        # the index is rebuilt, and fixed width columns are views on the bytes
+        assert restored.asof(t0 + timedelta(seconds=2.5)).price == Decimal("0.5")
+        assert not restored._df.ts.to_numpy().flags.owndata
+
+        with self.assertRaises(ValueError):
+            _collection_from_class(Shard).from_bytes(raw)
+
+    def test_collection_aware(self):
+        # a time zone has no column representation, it is not silently dropped
+        Collec = _collection_from_class(Tick)
+        at = datetime(2021, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        cinst = Collec(Tick(ts=at, price=Decimal(1)))
+        with self.assertRaises(ValueError):
+            cinst.to_bytes()
+        restored = pickle.loads(pickle.dumps(cinst))
+        assert restored[0].ts == at and restored[0].ts.utcoffset() == timedelta(hours=2)
+
+    def test_collection_type(self):
+        for Collec in [
+            _collection_from_class(Shard),
+            _collection_from_class(Tick, key="ts", index="ts"),
+            _collection_from_class(
+                Tick, reducers={"ts": "first", "price": "sum"}, compact=True
+            ),
+        ]:
+            # generated types are pickled by their crystal type and options
+            assert pickle.loads(pickle.dumps(Collec)) is Collec
@@ -1,14 +1,38 @@
+import pickle
 import unittest
-from dataclasses import fields
+from dataclasses import fields, make_dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from enum import IntEnum
+from typing import Optional
+from unittest import mock
 
 import hypothesis.strategies as st
+import numpy as np
+import pandas as pd
 from hypothesis import Verbosity, given, settings
 
 # strategy to build dataclasses dynamically
 from hypothesis.strategies import SearchStrategy
+from pydantic import condecimal
 
 from datacrystals._collection import _collection_from_class
-from datacrystals.tests.test_crystals import st_dcls
+from datacrystals._crystals import datacrystal
+from datacrystals._display import display
+from datacrystals._query import column
+from datacrystals.tests.test_crystals import Sample, assert_same, st_dcls
+
+
+@datacrystal
+class Shard:
+    answer: int
+    question: str = "What is the answer ?"
+
+
+@datacrystal
+class Memo:
+    answer: int
+    note: Optional[str] = None
 
 
 @st.composite
@@ -24,6 +48,12 @@ def st_collec(draw, elems_type: SearchStrategy = st_dcls(), max_size=5):
     return Collec
 
 
+@datacrystal
+class Tick:
+    ts: datetime
+    price: Decimal
+
+
 class TestCollection(unittest.TestCase):
 
     # Same behavior as crystals
@@ -54,12 +84,88 @@ class TestCollection(unittest.TestCase):
             for f in fields(r):
                 assert f"{getattr(r, f'{f.name}')}" in dcstr
 
+    def test_str_truncated(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec.from_columns(
+            {"answer": list(range(1000)), "question": ["Why ?"] * 1000}
+        )
+
+        lines = str(cinst).splitlines()
+        assert lines[2].startswith("1000 rows, ")
+        assert lines[3].startswith("  answer: int as int64, ")
+        assert lines[4].startswith("  question: str as object, ")
+        # only the first and last rows, in one table
+        rows = [l.split("|")[1].strip() for l in lines[8:-1]]
+        assert rows == [str(i) for i in range(5)] + ["..."] + [
+            str(i) for i in range(995, 1000)
+        ]
+        # the optimized frame is not computed
+        assert not cinst.__cache__
+
+        head = list(cinst.render_lines(head=2, tail=0))
+        assert [l.split("|")[1].strip() for l in head[8:-1]] == ["0", "1", "..."]
+
+        # a full dump, streamed one chunk (table) at a time
+        dump = cinst.render_lines()
+        assert next(dump) == "ShardCollection"
+        borders = [l for l in dump if l.startswith("+")]  # top and bottom
+        assert len(borders) == 2 * 1000 // display.chunksize
+
+    def test_str_options(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec.from_columns({"answer": list(range(30))})
+        assert "| 15 |" not in str(cinst)
+
+        max_rows, head, chunksize = display.max_rows, display.head, display.chunksize
+        try:
+            display.max_rows = 30
+            assert "| 15 |" in str(cinst)
+            display.max_rows, display.head = 10, 20
+            assert "| 15 |" in str(cinst)
+            display.chunksize = 7
+            headers = [l for l in cinst.render_lines() if "answer |" in l]
+            assert len(headers) == 5
+        finally:
+            display.max_rows, display.head, display.chunksize = (
+                max_rows,
+                head,
+                chunksize,
+            )
+
     @given(collec=st_collec(), data=st.data())
     def test_dir(self, collec, data):
         dcinst = data.draw(collec.strategy())
 
         inner_fields = {f for f in fields(dcinst.Inner)}
-        expected = {"Inner", "strategy", "optimize", *inner_fields}
+        expected = {
+            "Inner",
+            "strategy",
+            "optimize",
+            "render_lines",
+            "extend",
+            "open",
+            "durable",
+            "snapshot",
+            "flush",
+            "from_columns",
+            "from_records",
+            "to_arrow",
+            "from_arrow",
+            "to_bytes",
+            "from_bytes",
+            "map",
+            "filter",
+            "reduce",
+            "where",
+            "select",
+            "sort_by",
+            "join",
+            "rows",
+            "View",
+            "iter_batches",
+            "Batch",
+            *inner_fields,
+        }
 
         dcdir = dir(dcinst)
 
@@ -98,10 +204,918 @@ class TestCollection(unittest.TestCase):
             if f.type == "":
                 assert ""
 
+        assert len(copt) == len(cinst)
+        assert list(copt.columns) == [f.name for f in fields(cinst.Inner)]
+
+    @given(data=st.data())
+    def test_getitem(self, data):
+        Collec = _collection_from_class(Shard)
+        elems = data.draw(st.lists(Shard.strategy(), max_size=10))
+        cinst = Collec(*elems)
+        cinst._data.chunksize = 3
+
+        at = data.draw(st.integers(min_value=-len(elems) - 2, max_value=len(elems) + 2))
+        if -len(elems) <= at < len(elems):
+            assert cinst[at] == elems[at]
+        else:
+            with self.assertRaises(IndexError):
+                cinst[at]
+
+        sl = slice(
+            *data.draw(
+                st.tuples(
+                    st.none() | st.integers(-12, 12),
+                    st.none() | st.integers(-12, 12),
+                    st.none() | st.integers(1, 3) | st.integers(-3, -1),
+                )
+            )
+        )
+        sliced = cinst[sl]
+        assert type(sliced) is Collec
+        assert list(sliced) == elems[sl]
+
+    def test_optimize_cached(self):
+        Collec = _collection_from_class(Tick)
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec(Tick(ts=t0, price=Decimal("1.5")))
+
+        copt = cinst.optimize()
+        assert copt.price.tolist() == [Decimal("1.5")]  # not lossy by default
+        # computed once, then shared
+        assert np.shares_memory(cinst.optimize().ts.to_numpy(), copt.ts.to_numpy())
+        # ... and read-only
+        with self.assertRaises(ValueError):
+            copt.loc[0, "ts"] = t0
+        assert not np.shares_memory(copt.ts.to_numpy(), cinst._df.ts.to_numpy())
+
+        # only new rows are optimized on appends
+        cinst(Tick(ts=t0, price=Decimal("2.25")))
+        assert cinst.optimize().price.tolist() == [Decimal("1.5"), Decimal("2.25")]
+        assert len(copt) == 1  # previously returned frames are not modified
+
+        # lossy, only if explicitly asked for
+        floats = cinst.optimize(floats=["price"])
+        assert floats.price.dtype == "float64"
+        assert floats.price.tolist() == [1.5, 2.25]
+        with self.assertRaises(ValueError):
+            cinst.optimize(floats=["ts"])
+
+        # one cache per collection
+        assert not Collec().__cache__
+
     # TODO : maybe separate it ? growable collection can be separated...
-    # @given(collec=st_collec(), data=st.data())
-    # def test_call(self, collec, data):
-    #     raise NotImplementedError
+    @given(collec=st_collec(), data=st.data())
+    def test_call(self, collec, data):
+        cinst = data.draw(collec.strategy())
+        count = len(cinst)
+
+        elems = data.draw(st.lists(cinst.Inner.strategy(), max_size=5))
+        for e in elems:
+            assert cinst(e) is cinst  # __call__ returns the (growing) collection
+            assert e in cinst
+
+        assert len(cinst) == count + len(elems)
+        assert len(cinst._df) == len(cinst)
+
+    def test_call_chunked(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec()
+        cinst._data.chunksize = 8  # forcing sealing chunks
+
+        for a in range(50):
+            cinst(Shard(answer=a))
+            assert len(cinst) == a + 1
+
+        assert cinst._df.answer.tolist() == list(range(50))
+        # consolidated only once
+        assert cinst._df is cinst._df
+        assert [s.answer for s in cinst] == list(range(50))
+
+    def test_from_columns(self):
+        Collec = _collection_from_class(Shard)
+
+        columns = {"answer": np.arange(5, dtype="float64"), "extra": np.zeros(5)}
+        cinst = Collec.from_columns(columns)
+
+        assert len(cinst) == 5
+        assert cinst._df.answer.dtype == "int64"  # validated as int, once
+        assert list(cinst) == [Shard(answer=a) for a in range(5)]  # with default
+
+        # same from a dataframe
+        assert list(Collec.from_columns(pd.DataFrame(columns))) == list(cinst)
+
+        # columns are copied, rows cannot be changed through them
+        answers = np.arange(5)
+        cinst = Collec.from_columns({"answer": answers})
+        answers[0] = 42
+        assert cinst[0] == Shard(answer=0)
+
+        with self.assertRaises(ValueError):
+            Collec.from_columns({"answer": [0.5]})
+        with self.assertRaises(ValueError):
+            Collec.from_columns({"question": ["no answer"]})
+
+    def test_from_records(self):
+        Collec = _collection_from_class(Shard)
+        expected = [Shard(answer=42, question="Why?"), Shard(answer=51)]
+
+        recarray = np.rec.fromrecords(
+            [(42, "Why?"), (51, "What is the answer ?")], names="answer,question"
+        )
+        assert list(Collec.from_records(recarray)) == expected
+        assert (
+            list(Collec.from_records([(42, "Why?"), (51, "What is the answer ?")]))
+            == expected
+        )
+        assert (
+            list(
+                Collec.from_records(
+                    [{"answer": 42, "question": "Why?"}, {"answer": 51}]
+                )
+            )
+            == expected
+        )
+
+        @datacrystal
+        class Count:
+            count: Optional[int]
+            label: int = 0
+
+        # ints with None are not turned into floats
+        big = [Count(count=2 ** 60 + 1, label=1), Count(count=None, label=2)]
+        CountCollec = _collection_from_class(Count)
+        assert list(CountCollec.from_records([(2 ** 60 + 1, 1), (None, 2)])) == big
+        assert (
+            list(
+                CountCollec.from_records(
+                    [{"count": 2 ** 60 + 1, "label": 1}, {"label": 2}]
+                )
+            )
+            == big
+        )
+        with self.assertRaises(ValueError):
+            CountCollec.from_records([(1,)])
+
+    def test_extend(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec(Shard(answer=1))
+
+        assert cinst.extend({"answer": [2, 3]}) is cinst
+        cinst.extend([Shard(answer=4)])
+        cinst(Shard(answer=5))
+
+        assert [s.answer for s in cinst] == [1, 2, 3, 4, 5]
+
+        # only crystals of the collection type, nothing else is appended
+        with self.assertRaises(TypeError):
+            cinst(object())
+        with self.assertRaises(TypeError):
+            cinst.extend([Shard(answer=6), Memo(answer=6)])
+        with self.assertRaises(TypeError):
+            Collec(object())
+        assert [s.answer for s in cinst] == [1, 2, 3, 4, 5, 6]
+
+    def test_contains(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec(Shard(answer=42), Shard(answer=51, question="Why?"))
+
+        assert Shard(answer=42) in cinst
+        # all fields need to match on the same row
+        assert Shard(answer=42, question="Why?") not in cinst
+        assert Shard(answer=51, question="Why?") in cinst
+        assert 42 not in cinst
+
+        @datacrystal
+        class Note:
+            answer: int
+            note: Optional[str] = None
+            at: Optional[datetime] = None
+
+        notes = _collection_from_class(Note)(
+            Note(answer=1), Note(answer=2, note="a", at=datetime(2021, 1, 1))
+        )
+        # None fields match None values only
+        assert Note(answer=1) in notes
+        assert Note(answer=2, note="a", at=datetime(2021, 1, 1)) in notes
+        assert Note(answer=2) not in notes
+        assert Note(answer=1, note="a") not in notes
+
+    @given(data=st.data(), key=st.sampled_from([True, "answer", ("question",)]))
+    def test_key(self, data, key):
+        Collec = _collection_from_class(Shard, key=key)
+        assert Collec is _collection_from_class(Shard, key=key)
+        assert Collec is not _collection_from_class(Shard)
+
+        elems = data.draw(st.lists(Shard.strategy(), max_size=10))
+        cinst = Collec(*elems[:5]).extend(
+            {
+                "answer": [e.answer for e in elems[5:]],
+                "question": [e.question for e in elems[5:]],
+            }
+        )
+
+        for p, e in enumerate(elems):
+            assert e in cinst
+            assert p in cinst.lookup(*(getattr(e, k) for k in Collec.key))
+
+        other = data.draw(Shard.strategy())
+        assert (other in cinst) == (other in elems)
+
+        cinst(other)
+        assert other in cinst
+        assert len(cinst) - 1 in cinst.lookup(*(getattr(other, k) for k in Collec.key))
+
+    def test_key_invalid(self):
+        with self.assertRaises(ValueError):
+            _collection_from_class(Shard, key="nope")
+        with self.assertRaises(AttributeError):
+            _collection_from_class(Shard)().lookup(42)
+
+    @given(collec=st_collec(), data=st.data())
+    def test_rows(self, collec, data):
+        cinst = data.draw(collec.strategy())
+
+        views = list(cinst.rows())
+        assert len(views) == len(cinst)
+
+        for v, e in zip(views, cinst):
+            assert isinstance(v, cinst.View)
+            assert v.materialize() == e
+            assert v in cinst
+
+    def test_rows_readonly(self):
+        cinst = _collection_from_class(Shard)(Shard(answer=42))
+        v = next(cinst.rows())
+
+        assert v.answer == 42
+        assert v.question == "What is the answer ?"
+        with self.assertRaises(AttributeError):
+            v.answer = 51
+        with self.assertRaises(AttributeError):
+            v.other = 51  # no __dict__
+
+    def test_rows_datetime(self):
+        # times are read as datetimes, not as numpy datetime64
+        ticks = [Tick(ts=datetime(2021, 1, 1, s), price=Decimal(s)) for s in range(3)]
+        cinst = _collection_from_class(Tick)(*ticks)
+        assert [v.ts for v in cinst.rows()] == [t.ts for t in ticks]
+        assert [v.materialize() for v in cinst.rows()] == ticks
+        batch = next(cinst.iter_batches(2))
+        assert [v.materialize() for v in batch.rows()] == ticks[:2]
+        assert batch.ts.dtype.kind == "M"
+
+    @given(data=st.data(), size=st.integers(min_value=1, max_value=7))
+    def test_iter_batches(self, data, size):
+        Collec = _collection_from_class(Shard)
+        elems = data.draw(st.lists(Shard.strategy(), max_size=20))
+        cinst = Collec(*elems)
+
+        batches = list(cinst.iter_batches(size))
+        assert sum(len(b) for b in batches) == len(cinst)
+
+        for b in batches:
+            assert isinstance(b, Collec.Batch) and b.Inner is Shard
+            assert 0 < len(b) <= size
+            assert b.answer.tolist() == [
+                e.answer for e in elems[b.start : b.start + len(b)]
+            ]
+            assert [v.materialize() for v in b.rows()] == elems[
+                b.start : b.start + len(b)
+            ]
+
+    def test_iter_batches_zero_copy(self):
+        cinst = _collection_from_class(Shard).from_columns({"answer": np.arange(10)})
+
+        b = next(cinst.iter_batches(4))
+        assert np.shares_memory(b.answer, cinst._df.answer.to_numpy())
+
+        with self.assertRaises(ValueError):
+            next(cinst.iter_batches(0))
+
+    def test_iter_batches_optimized(self):
+        Collec = _collection_from_class(Sample)
+        cinst = Collec(
+            Sample(attr_int=1, attr_dec=Decimal(1), attr_str="a"),
+            Sample(attr_int=2, attr_dec=Decimal(2), attr_str="b", attr_opt=3),
+            Sample(attr_int=3, attr_dec=Decimal(3), attr_str="c", attr_opt=4),
+        )
+        first, second = cinst.iter_batches(2, optimized=True)
+        # numpy dtypes, where there is no null to mask
+        assert first.attr_int.dtype == "int64"
+        assert second.attr_opt.dtype == "int64"
+        assert second.attr_opt.tolist() == [4]
+        assert first.attr_opt.dtype == object
+        assert second.attr_str.tolist() == ["c"]
+
+    @given(
+        data=st.data(),
+        steps=st.lists(st.integers(min_value=0, max_value=3), max_size=30),
+        chunksize=st.integers(min_value=1, max_value=8),
+    )
+    def test_index(self, data, steps, chunksize):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+
+        ticks, t = [], t0
+        for s in steps:  # ordered, with repetitions
+            t += timedelta(seconds=s)
+            ticks.append(Tick(ts=t, price=Decimal(s)))
+
+        cinst = Collec()
+        cinst._data.chunksize = chunksize
+        split = data.draw(st.integers(min_value=0, max_value=len(ticks)))
+        for e in ticks[:split]:
+            cinst(e)
+        cinst.extend(
+            {
+                "ts": [e.ts for e in ticks[split:]],
+                "price": [e.price for e in ticks[split:]],
+            }
+        )
+
+        a = t0 + timedelta(seconds=data.draw(st.integers(min_value=0, max_value=100)))
+        b = a + timedelta(seconds=data.draw(st.integers(min_value=0, max_value=50)))
+
+        assert list(cinst.between(a, b)) == [e for e in ticks if a <= e.ts <= b]
+        assert cinst.asof(a) == ([e for e in ticks if e.ts <= a] or [None])[-1]
+
+        n = data.draw(st.integers(min_value=0, max_value=10))
+        assert list(cinst.last(n)) == ticks[max(len(ticks) - n, 0) :]
+
+    def test_index_ordered(self):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec(Tick(ts=t0, price=Decimal(1)))
+
+        with self.assertRaises(ValueError):
+            cinst(Tick(ts=t0 - timedelta(seconds=1), price=Decimal(1)))
+        with self.assertRaises(ValueError):
+            cinst.extend(
+                {
+                    "ts": [t0 + timedelta(seconds=2), t0 + timedelta(seconds=1)],
+                    "price": [1, 2],
+                }
+            )
+        assert len(cinst) == 1
+
+        with self.assertRaises(ValueError):
+            _collection_from_class(Tick, index="nope")
+
+    def test_index_zero_copy(self):
+        Collec = _collection_from_class(Shard, index="answer")
+        cinst = Collec.from_columns({"answer": np.arange(100)})
+
+        sl = cinst.between(10, 19)
+        assert len(sl) == 10
+        assert np.shares_memory(sl._df.answer.to_numpy(), cinst._df.answer.to_numpy())
+
+    @given(
+        data=st.data(),
+        steps=st.lists(st.integers(min_value=0, max_value=40), max_size=30),
+    )
+    def test_aggregate(self, data, steps):
+        Collec = _collection_from_class(
+            Tick, index="ts", reducers={"ts": "first", "price": "max"}
+        )
+        t0 = datetime(2021, 1, 1)
+        every = timedelta(minutes=1)
+
+        ticks, t = [], t0
+        for s in steps:
+            t += timedelta(seconds=s)
+            ticks.append(Tick(ts=t, price=Decimal(s) / 10))
+
+        split = data.draw(st.integers(min_value=0, max_value=len(ticks)))
+        cinst = Collec(*ticks[:split])
+        live = cinst.rollup(every)
+        for e in ticks[split:]:
+            cinst(e)
+
+        # whole collection
+        if ticks:
+            assert cinst.aggregate() == Tick(
+                ts=ticks[0].ts, price=max(e.price for e in ticks)
+            )
+        else:
+            assert cinst.aggregate() is None
+
+        # in buckets, vectorized
+        expected = {}
+        for e in ticks:
+            bucket = e.ts.replace(second=0)
+            expected[bucket] = max(expected.get(bucket, e.price), e.price)
+        expected = [Tick(ts=b, price=p) for b, p in expected.items()]
+        assert list(cinst.resample(every)) == expected
+
+        # in buckets, incrementally
+        assert list(live.done) + ([live.current] if live.current else []) == expected
+
+    def test_aggregate_frames(self):
+        Collec = _collection_from_class(
+            Shard, index="answer", reducers={"answer": "sum"}
+        )
+        cinst = Collec.from_columns({"answer": [1, 2, 11, 12]})
+        live = cinst.rollup(10)
+        cinst.extend({"answer": [13, 21, 35]})
+        cinst(Shard(answer=36))
+
+        assert cinst.aggregate() == Shard(answer=131)
+        assert [s.answer for s in live.done] == [0, 10, 20]
+        assert live.current == Shard(answer=30)
+
+    def test_reducers_invalid(self):
+        with self.assertRaises(ValueError):
+            _collection_from_class(Shard, reducers={"nope": "sum"})
+        with self.assertRaises(ValueError):
+            _collection_from_class(Shard, reducers={"answer": "nope"})
+        with self.assertRaises(ValueError):  # no default for price
+            _collection_from_class(Tick, reducers={"ts": "first"})
+        with self.assertRaises(ValueError):  # no index to bucket on
+            _collection_from_class(Shard, reducers={"answer": "sum"})().resample(10)
+        with self.assertRaises(ValueError):  # None has no maximum
+            _collection_from_class(Memo, reducers={"answer": "sum", "note": "max"})
+        # ... but can be the first one
+        Collec = _collection_from_class(
+            Memo, index="answer", reducers={"answer": "sum", "note": "first"}
+        )
+        assert Collec(Memo(answer=1), Memo(answer=2)).aggregate() == Memo(answer=3)
+
+        # only appends on the index are checked in order, before anything is appended
+        cinst = _collection_from_class(
+            Tick, index="ts", reducers={"ts": "first", "price": "max"}
+        )()
+        with self.assertRaises(ValueError):
+            cinst.rollup(10, on="price")
+        assert not cinst._rollups
+
+    @given(
+        data=st.data(),
+        chunksize=st.integers(min_value=1, max_value=8),
+        dcls=st.sampled_from([Sample, Memo]),
+    )
+    def test_compact(self, data, chunksize, dcls):
+        Collec = _collection_from_class(dcls, compact=True)
+        elems = data.draw(st.lists(dcls.strategy(), max_size=20))
+        split = data.draw(st.integers(min_value=0, max_value=len(elems)))
+
+        cinst = Collec()
+        cinst._data.chunksize = chunksize  # forcing sealing (and encoding) chunks
+        for e in elems[:split]:
+            cinst(e)
+        cinst.extend(elems[split:])
+
+        # exact round trip, whatever the storage was
+        assert list(cinst) == elems
+        assert [repr(c) for c in cinst] == [repr(e) for e in elems]
+        assert [v.materialize() for v in cinst.rows()] == elems
+        assert [cinst._data.row(p) for p in range(len(elems))] == [
+            tuple(getattr(e, n) for n in cinst._data.columns) for e in elems
+        ]
+
+    def test_compact_memory(self):
+        n = 10000
+        columns = {
+            "ts": pd.date_range("2021-01-01", periods=n, freq="s"),
+            "price": [Decimal(p).scaleb(-2) for p in range(100000, 100000 + n)],
+        }
+        plain = _collection_from_class(Tick, index="ts").from_columns(columns)
+        compact = _collection_from_class(Tick, index="ts", compact=True).from_columns(
+            columns
+        )
+
+        def nbytes(c):
+            return sum(ch.memory_usage(deep=True).sum() for ch in c._data._chunks)
+
+        assert compact._data.codecs["price"].scale == 2
+        # selecting rows does not consolidate (nor decode) the whole collection
+        with mock.patch.object(type(compact._data), "frame") as frame:
+            found = compact.where(column("price") < Decimal(1001))
+        frame.assert_not_called()
+        assert len(found) == 100
+        assert compact._df.price.tolist() == columns["price"]
+        assert nbytes(compact) * 5 < nbytes(plain)
+
+    def test_compact_fallback(self):
+        Collec = _collection_from_class(Tick, compact=True)
+        cinst = Collec()
+        cinst._data.chunksize = 2
+
+        prices = [Decimal("1.50"), Decimal("2.00"), Decimal("0.25"), Decimal("7.00")]
+        for p in prices:
+            cinst(Tick(ts=datetime(2021, 1, 1), price=p))
+        assert cinst._data.codecs["price"].scale == 2
+        assert cinst._df.price.dtype == object
+        assert cinst._data._chunks[0].price.dtype == "int64"
+
+        # another exponent : stored as is from now on, read back exactly
+        cinst(Tick(ts=datetime(2021, 1, 1), price=Decimal("1.5")))(
+            Tick(ts=datetime(2021, 1, 1), price=Decimal("2.125"))
+        )
+        prices += [Decimal("1.5"), Decimal("2.125")]
+        assert "price" not in cinst._data.codecs
+        assert [str(t.price) for t in cinst] == [str(p) for p in prices]
+
+        # not a finite decimal : stored as is
+        cinst = Collec()
+        cinst._data.chunksize = 2
+        prices = [Decimal("1.5"), Decimal("NaN"), Decimal(2 ** 70)]
+        cinst.extend({"ts": [datetime(2021, 1, 1)] * 3, "price": prices})
+        assert "price" not in cinst._data.codecs
+        assert cinst._df.price.iat[0] == prices[0]
+        assert cinst._df.price.iat[-1] == Decimal(2 ** 70)
+
+        # with declared decimal places, fewer places are stored compactly at that scale
+        @datacrystal
+        class Quote:
+            price: condecimal(decimal_places=2)
+
+        quotes = _collection_from_class(Quote, compact=True)()
+        quotes._data.chunksize = 2
+        quotes.extend({"price": [Decimal("1.5"), Decimal("2.25"), Decimal(3)]})
+        quotes(Quote(price=Decimal("0.1")))
+        assert quotes._data.codecs["price"].scale == 2
+        assert quotes._data._chunks[0].price.dtype == "int64"
+        assert [str(p) for p in quotes._df.price] == ["1.50", "2.25", "3.00", "0.10"]
+
+        # strings with NUL characters, that pandas cannot tell apart in categories
+        memos = _collection_from_class(Memo, compact=True)()
+        memos._data.chunksize = 4
+        notes = ["", "\x00", "", "a", "a\x00"]
+        memos.extend({"answer": range(5), "note": notes})
+        assert "note" not in memos._data.codecs
+        assert [m.note for m in memos] == notes
+
+    @given(
+        elems=st.lists(
+            st.builds(
+                Shard,
+                answer=st.integers(min_value=0, max_value=3),
+                question=st.sampled_from(["Why ?", "What ?"]),
+            ),
+            max_size=30,
+        ),
+        data=st.data(),
+        chunksize=st.integers(min_value=1, max_value=8),
+    )
+    def test_set_bag(self, elems, data, chunksize):
+        split = data.draw(st.integers(min_value=0, max_value=len(elems)))
+        expected = list(dict.fromkeys(elems))  # distinct, in order of first appearance
+
+        for kind in ("set", "bag"):
+            cinst = _collection_from_class(Shard, kind=kind)()
+            cinst._data.chunksize = chunksize
+            for e in elems[:split]:
+                cinst(e)
+            cinst.extend(
+                {
+                    "answer": [e.answer for e in elems[split:]],
+                    "question": [e.question for e in elems[split:]],
+                }
+            )
+            assert list(cinst) == expected
+            assert all(e in cinst for e in elems)
+            assert Shard(answer=4) not in cinst
+
+        # cinst is the bag
+        assert cinst.counts.tolist() == [elems.count(e) for e in expected]
+        assert cinst.count(Shard(answer=4)) == 0
+
+    def test_set_bag_index(self):
+        Collec = _collection_from_class(Tick, kind="set", index="ts", key="ts")
+        t0 = datetime(2021, 1, 1)
+        ticks = [Tick(ts=t0 + timedelta(seconds=s), price=Decimal(s)) for s in range(3)]
+        cinst = Collec(*ticks)
+        # a repeated crystal is ignored, even out of order
+        cinst(ticks[0])
+        assert len(cinst) == 3 and cinst.lookup(t0) == [0]
+        with self.assertRaises(ValueError):
+            cinst(Tick(ts=t0, price=Decimal(42)))
+
+        Bag = _collection_from_class(Tick, kind="bag")
+        bag = pickle.loads(pickle.dumps(Bag(*ticks, ticks[1])))
+        assert bag.counts.tolist() == [1, 2, 1]
+
+        # counts are kept in subsets of a bag, and in its bytes
+        assert bag[1:].counts.tolist() == [2, 1]
+        assert bag[::2].counts.tolist() == [1, 1]
+        assert bag[1::-1].counts.tolist() == [2, 1]
+        assert Bag.from_bytes(bag.to_bytes()).counts.tolist() == [1, 2, 1]
+        assert list(_collection_from_class(Tick).from_bytes(bag.to_bytes())) == ticks
+        Indexed = _collection_from_class(Tick, kind="bag", index="ts")
+        indexed = Indexed(ticks[0], *ticks, ticks[1], ticks[2])
+        assert indexed.counts.tolist() == [2, 2, 2]
+        indexed(ticks[2])
+        assert indexed.between(
+            ticks[1].ts, t0 + timedelta(hours=1)
+        ).counts.tolist() == [2, 3]
+        assert indexed.last(1).counts.tolist() == [3]
+
+        with self.assertRaises(ValueError):
+            _collection_from_class(Tick, kind="tuple")
+
+    def test_enum_fields(self):
+        class Level(IntEnum):
+            LOW = 1
+            HIGH = 2
+
+        @datacrystal
+        class Alert:
+            level: Level
+            previous: Optional[Level] = None
+
+        alerts = [Alert(level=Level.HIGH), Alert(level=Level.LOW, previous=Level.HIGH)]
+        cinst = _collection_from_class(Alert)(*alerts)
+        # stored as ints, read back as members, the same as validated ones
+        for read in (
+            list(cinst),
+            [cinst[0], cinst[1]],
+            [v.materialize() for v in cinst.rows()],
+        ):
+            assert read == alerts
+            assert [type(a.level) for a in read] == [Level, Level]
+            assert type(read[1].previous) is Level
+
+    def test_types_cached(self):
+        # more types than an lru_cache keeps by default : each one is still built only once
+        declared = [
+            datacrystal(make_dataclass(f"Many{i}", [("answer", int)]))
+            for i in range(200)
+        ]
+        types = [_collection_from_class(d) for d in declared]
+        assert all(_collection_from_class(d) is t for d, t in zip(declared, types))
+        assert all(
+            _collection_from_class(d, kind="set") is not t
+            for d, t in zip(declared, types)
+        )
+
+    @given(
+        elems=st.lists(Sample.strategy(), max_size=20),
+        pivot=st.integers(min_value=-10, max_value=10),
+    )
+    def test_where(self, elems, pivot):
+        cinst = _collection_from_class(Sample)(*elems)
+        found = cinst.where(
+            (column("attr_opt") > pivot) | ~column("attr_int").isin([pivot])
+        )
+        assert type(found) is type(cinst)
+        assert_same(
+            found,
+            [
+                e
+                for e in elems
+                if (e.attr_opt is not None and e.attr_opt > pivot)
+                or e.attr_int != pivot
+            ],
+        )
+        # the same predicate, on batches
+        mask = np.concatenate(
+            [np.zeros(0, dtype=bool)]
+            + [(column("attr_int") == pivot)(b) for b in cinst.iter_batches(3)]
+        )
+        assert mask.tolist() == [e.attr_int == pivot for e in elems]
+
+    def test_where_tick(self):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec.from_columns(
+            {
+                "ts": [t0 + timedelta(seconds=s) for s in range(10)],
+                "price": [Decimal(s % 4) / 4 for s in range(10)],
+            }
+        )
+
+        found = cinst.where(
+            column("price") >= Decimal("0.5"), ts=t0 + timedelta(seconds=3)
+        )
+        assert type(found) is Collec and found.index == "ts"
+        assert list(found) == [cinst[3]]
+        # all rows : no copy
+        everything = cinst.where(column("ts") >= t0)
+        assert np.shares_memory(everything._df.ts.to_numpy(), cinst._df.ts.to_numpy())
+        assert len(cinst.where(column("ts") < t0)) == 0
+
+        with self.assertRaises(ValueError):
+            cinst.where(column("answer") == 42)
+        with self.assertRaises(ValueError):
+            cinst.where()
+        with self.assertRaises(TypeError):
+            cinst.where(lambda t: t.price > 0)
+        with self.assertRaises(
+            TypeError
+        ):  # chained comparisons would silently drop one
+            cinst.where(t0 < column("ts") < t0 + timedelta(seconds=2))
+
+        # None values match missing values, not nothing
+        memos = _collection_from_class(Memo)(
+            Memo(answer=1), Memo(answer=2, note="a"), Memo(answer=3)
+        )
+        assert [m.answer for m in memos.where(note=None)] == [1, 3]
+        assert [m.answer for m in memos.where(note="a")] == [2]
+
+    def test_select(self):
+        cinst = _collection_from_class(Shard)(
+            Shard(answer=42), Shard(answer=51), Shard(answer=42, question="Why ?")
+        )
+        projected = cinst.select("question")
+        assert type(projected).Inner.__name__ == "ShardQuestion"
+        assert [p.question for p in projected] == [
+            "What is the answer ?",
+            "What is the answer ?",
+            "Why ?",
+        ]
+        # columns are not copied
+        assert np.shares_memory(
+            cinst.select("answer")._df.answer.to_numpy(), cinst._df.answer.to_numpy()
+        )
+
+        # equal projections are merged in a set, and counted in a bag
+        Bag = _collection_from_class(Shard, kind="bag")
+        bag = Bag(*cinst, Shard(answer=51))
+        assert [
+            (p.question, c)
+            for p, c in zip(bag.select("question"), bag.select("question").counts)
+        ] == [
+            ("What is the answer ?", 3),
+            ("Why ?", 1),
+        ]
+        assert (
+            len(_collection_from_class(Shard, kind="set")(*cinst).select("answer")) == 2
+        )
+
+        # fields with a default come last in the projection, their values too
+        swapped = cinst.select("question", "answer")
+        assert [(p.answer, p.question) for p in swapped] == [
+            (42, "What is the answer ?"),
+            (51, "What is the answer ?"),
+            (42, "Why ?"),
+        ]
+        assert list(swapped) == [swapped[i] for i in range(len(swapped))]
+
+        with self.assertRaises(ValueError):
+            cinst.select("answer", "when")
+
+    def test_sort_by(self):
+        Collec = _collection_from_class(Tick, index="ts", kind="bag")
+        t0 = datetime(2021, 1, 1)
+        ticks = [
+            Tick(ts=t0 + timedelta(seconds=s), price=Decimal(p))
+            for s, p in enumerate([3, 1, 2, 1])
+        ]
+        cinst = Collec(*ticks, ticks[2])
+
+        by_price = cinst.sort_by("price")
+        # stable, and no index anymore
+        assert list(by_price) == [ticks[1], ticks[3], ticks[2], ticks[0]]
+        assert by_price.index is None and by_price.kind == "bag"
+        assert by_price.counts.tolist() == [1, 1, 2, 1]
+
+        assert list(cinst.sort_by("price", "ts", descending=True))[0] == ticks[0]
+        assert type(cinst.sort_by("ts")) is Collec
+
+        with self.assertRaises(ValueError):
+            cinst.sort_by()
+        with self.assertRaises(ValueError):
+            cinst.sort_by("answer")
+
+    def test_join(self):
+        @datacrystal
+        class Question:
+            answer: Optional[int]
+            question: str
+
+        @datacrystal
+        class Order:
+            answer: Optional[int]
+            quantity: int
+
+        shards = _collection_from_class(Question)(
+            Question(answer=1, question="a"),
+            Question(answer=2, question="b"),
+            Question(answer=None, question="c"),
+            Question(answer=1, question="d"),
+        )
+        orders = _collection_from_class(Order)(
+            Order(answer=1, quantity=10),
+            Order(answer=3, quantity=30),
+            Order(answer=1, quantity=11),
+            Order(answer=None, quantity=0),
+        )
+
+        inner = shards.join(orders, on="answer")
+        assert type(inner).Inner.__name__ == "QuestionOrder"
+        # in left order, then right order, null keys never match
+        assert [(r.question, r.quantity) for r in inner] == [
+            ("a", 10),
+            ("a", 11),
+            ("d", 10),
+            ("d", 11),
+        ]
+        left = shards.join(orders, on=["answer"], how="left")
+        assert [(r.question, r.quantity) for r in left] == [
+            ("a", 10),
+            ("a", 11),
+            ("b", None),
+            ("c", None),
+            ("d", 10),
+            ("d", 11),
+        ]
+
+        # clashing names are suffixed
+        both = shards.join(shards, on="answer")
+        assert [(r.question, r.question_question) for r in both][:2] == [
+            ("a", "a"),
+            ("a", "d"),
+        ]
+
+        # keys that pandas hashes alike (up to their first NUL)
+        memos = _collection_from_class(Memo)(
+            *(Memo(answer=a, note=n) for a, n in enumerate(["a", "zz", "a\x00"] * 20))
+        )
+        found = _collection_from_class(Memo)(Memo(answer=0, note="a")).join(
+            memos, on="note"
+        )
+        assert len(found) == 20 and {m.answer_memo for m in found} == set(
+            range(0, 60, 3)
+        )
+
+        with self.assertRaises(ValueError):
+            shards.join(orders, on="quantity")
+        with self.assertRaises(ValueError):
+            shards.join(orders, on="answer", how="outer")
+        with self.assertRaises(ValueError):
+            shards.join(orders, on="answer", by="answer")
+
+    @given(
+        left=st.lists(st.tuples(st.integers(0, 5), st.integers(0, 2)), max_size=30),
+        right=st.lists(st.tuples(st.integers(0, 5), st.integers(0, 2)), max_size=30),
+        how=st.sampled_from(["inner", "left"]),
+    )
+    @settings(deadline=None)
+    def test_join_strategies(self, left, right, how):
+        @datacrystal
+        class Pair:
+            a: int
+            b: int
+
+        Collec = _collection_from_class(Pair)
+        lc = Collec(*(Pair(a=a, b=b) for a, b in left))
+        # sort-merge on sorted keys, after sorting them, and hash joins
+        for rows in (sorted(right), right, right * 10):
+            rc = Collec(*(Pair(a=a, b=b) for a, b in rows))
+            found = [(r.a, r.b, r.b_pair) for r in lc.join(rc, on="a", how=how)]
+            exp = [
+                (la, lb, rb)
+                for la, lb in left
+                for rb in [rb for ra, rb in rows if ra == la]
+                or ([None] * (how == "left"))
+            ]
+            assert found == exp
+        # on several fields, always a hash join
+        found = lc.join(Collec(*(Pair(a=a, b=b) for a, b in right)), on=("a", "b"))
+        assert [(r.a, r.b) for r in found] == [
+            (la, lb) for la, lb in left for e in right if e == (la, lb)
+        ]
+
+    def test_join_asof(self):
+        @datacrystal
+        class Quote:
+            ts: datetime
+            bid: Decimal
+            venue: str
+
+        t0 = datetime(2021, 1, 1)
+        trades = _collection_from_class(Tick)(
+            *(
+                Tick(ts=t0 + timedelta(seconds=s), price=Decimal(s))
+                for s in (0, 2, 5, 9)
+            )
+        )
+        quotes = _collection_from_class(Quote)(
+            Quote(ts=t0 + timedelta(seconds=4), bid=Decimal(4), venue="x"),
+            Quote(ts=t0 + timedelta(seconds=1), bid=Decimal(1), venue="x"),
+            Quote(ts=t0 + timedelta(seconds=2), bid=Decimal(2), venue="y"),
+        )
+        joined = trades.join(quotes, on="ts", how="asof")
+        assert [r.bid for r in joined] == [None, Decimal(2), Decimal(4), Decimal(4)]
+        assert [r.ts_quote for r in joined][1] == t0 + timedelta(seconds=2)
+
+        @datacrystal
+        class Fill:
+            ts: datetime
+            venue: str
+
+        fills = _collection_from_class(Fill)(
+            Fill(ts=t0 + timedelta(seconds=3), venue="x"),
+            Fill(ts=t0 + timedelta(seconds=3), venue="y"),
+            Fill(ts=t0 + timedelta(seconds=3), venue="z"),
+        )
+        # by venue, which is not repeated
+        joined = fills.join(quotes, on="ts", how="asof", by="venue")
+        assert [r.bid for r in joined] == [Decimal(1), Decimal(2), None]
+        assert "venue_quote" not in type(joined).Inner.__crystal_fields__.names
+
+        with self.assertRaises(ValueError):
+            fills.join(quotes, on=("ts", "venue"), how="asof")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,27 @@
+import math
+import pickle
+import subprocess
+import sys
 import unittest
-from dataclasses import asdict, fields
+from dataclasses import FrozenInstanceError, asdict, dataclass, fields
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
 
 import hypothesis.strategies as st
+import numpy as np
+import pandas as pd
 from hypothesis import Verbosity, given, settings
+from pydantic import condecimal, conint
 
 # strategy to build dataclasses dynamically
-from datacrystals._crystals import datacrystal
+from datacrystals._columns import ColumnsValidationError
+from datacrystals._crystals import _slotted, datacrystal
+
+
+def assert_same(crystals, expected):
+    # Note : comparing repr, as Decimal('NaN') (or a float one) is never equal to another one
+    assert [repr(c) for c in crystals] == [repr(e) for e in expected]
 
 
 @st.composite
@@ -20,7 +36,8 @@ def st_dcls(
 
     attrs = draw(
         st.dictionaries(
-            keys=st.text(),
+            # dunder names would override the class machinery itself (__annotations__, __init__, etc.)
+            keys=st.text().filter(lambda k: not k.startswith("__")),
             values=st.one_of(  # default values
                 st.integers(),
                 st.floats(),
@@ -36,6 +53,22 @@ def st_dcls(
     return dcls
 
 
+@datacrystal
+class Sample:
+    attr_int: int
+    attr_dec: Decimal
+    attr_str: str
+    attr_opt: Optional[int] = None
+
+
+@datacrystal(slots=True)
+class SlottedSample:
+    attr_int: int
+    attr_dec: Decimal
+    attr_str: str
+    attr_opt: Optional[int] = None
+
+
 class TestDataCrystal(unittest.TestCase):
     @given(dcls=st_dcls(), data=st.data())
     # @settings(verbosity=Verbosity.verbose)
@@ -91,6 +124,163 @@ class TestDataCrystal(unittest.TestCase):
         # always different, even if values are same (types are not) !
         assert dcA1inst != dcB1inst
 
+    @given(dcinst=Sample.strategy())
+    def test_from_trusted(self, dcinst):
+        values = [getattr(dcinst, n) for n in Sample.__crystal_fields__.names]
+        trusted = Sample._from_trusted(*values)
+        assert type(trusted) is Sample
+        assert_same([trusted], [dcinst])
+
+        # numpy scalars, from typed columns, are converted back to python ones
+        if abs(dcinst.attr_int) < 2 ** 63:
+            values[0] = np.int64(dcinst.attr_int)
+            assert type(Sample._from_trusted(*values).attr_int) is int
+
+    @given(dcinst=Sample.strategy())
+    def test_slots(self, dcinst):
+        values = asdict(dcinst)
+        slotted = SlottedSample(**values)
+        assert not hasattr(slotted, "__dict__")
+        assert repr(slotted) == "Slotted" + repr(dcinst)
+        assert str(slotted).splitlines()[2:] == str(dcinst).splitlines()[2:]
+        assert dir(slotted) == dir(dcinst)
+        assert_same(
+            [
+                pickle.loads(pickle.dumps(slotted)),
+                SlottedSample._from_trusted(*values.values()),
+            ],
+            [slotted, slotted],
+        )
+        with self.assertRaises(FrozenInstanceError):
+            slotted.attr_int = 0
+
+    def test_slots_memory(self):
+        dcinst = Sample(attr_int=42, attr_dec=Decimal("3.14"), attr_str="pi")
+        slotted = SlottedSample(attr_int=42, attr_dec=Decimal("3.14"), attr_str="pi")
+        # less than half the memory per instance
+        assert sys.getsizeof(slotted) * 2 < sys.getsizeof(dcinst) + sys.getsizeof(
+            dcinst.__dict__
+        )
+
+        with self.assertRaises(ValueError):  # still validated
+            SlottedSample(attr_int="nope", attr_dec=1, attr_str="")
+        with self.assertRaises(TypeError):
+            SlottedSample(1, 2, "3", 4, 5)
+
+        # without pydantic, the stdlib dataclass is slotted the same way
+        Plain = _slotted(
+            dataclass(frozen=True)(
+                type("Plain", (), {"__annotations__": {"a": int}, "a": 1})
+            ),
+            pydantic=False,
+        )
+        assert Plain().a == 1 and not hasattr(Plain(2), "__dict__")
+
+    def test_lazy_imports(self):
+        # hypothesis (for strategies) and tabulate (for str) are only imported when used
+        code = "import sys, datacrystals; print(sorted({'hypothesis', 'tabulate'} & set(sys.modules)))"
+        out = subprocess.run(
+            [sys.executable, "-c", code], check=True, capture_output=True, text=True
+        ).stdout
+        assert out.strip() == "[]"
+
+        # without pydantic, datacrystals are stdlib dataclasses
+        code = "import sys; sys.modules['pydantic'] = None; import datacrystals"
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+
+    @given(data=st.data())
+    def test_validate_columns(self, data):
+        dcinsts = data.draw(st.lists(Sample.strategy(), max_size=5))
+
+        columns = {
+            f.name: [getattr(dci, f.name) for dci in dcinsts] for f in fields(Sample)
+        }
+        df = Sample.validate_columns(columns)
+
+        assert list(df.columns) == [f.name for f in fields(Sample)]
+        # same values as validated one instance at a time
+        assert [Sample(**r) for r in df.to_dict("records")] == dcinsts
+
+    def test_validate_columns_invalid(self):
+        @datacrystal
+        class Order:
+            qty: conint(gt=0)
+            price: condecimal(max_digits=6, decimal_places=2)
+            note: Optional[str] = None
+
+        df = Order.validate_columns(
+            {"qty": [1, 2], "price": ["1.5", 3], "note": [None, "first"]}
+        )
+        assert df.qty.tolist() == [1, 2]
+        assert df.price.tolist() == [Decimal("1.5"), Decimal("3")]
+        assert df.note.tolist() == [None, "first"]
+
+        with self.assertRaises(ColumnsValidationError) as cm:
+            Order.validate_columns(
+                {
+                    "qty": [1, 0, 2, 3, 4.5],
+                    "price": ["1.5", "3", "1.234", "12345.6", "nope"],
+                }
+            )
+        assert cm.exception.rows.tolist() == [1, 2, 3, 4]
+        assert cm.exception.errors["qty"].tolist() == [1, 4]
+        assert cm.exception.errors["price"].tolist() == [2, 3, 4]
+
+    def test_validate_columns_as_pydantic(self):
+        @datacrystal
+        class Measure:
+            value: float
+            valid: bool = True
+            note: Optional[float] = None
+
+        # NaN is a float, only None is missing
+        df = Measure.validate_columns(
+            {"value": [float("nan"), 1.0], "note": [float("nan"), None]}
+        )
+        assert math.isnan(df.value[0]) and math.isnan(df.note[0])
+        assert df.note[1] is None
+        with self.assertRaises(ColumnsValidationError):
+            Measure.validate_columns({"value": [None, "nope"]})
+
+        # booleans from the same strings as pydantic
+        words = ["yes", "Off", "t", "0", 1, False]
+        df = Measure.validate_columns({"value": [0.0] * 6, "valid": words})
+        assert df.valid.tolist() == [Measure(value=0, valid=w).valid for w in words]
+        with self.assertRaises(ColumnsValidationError):
+            Measure.validate_columns({"value": [0.0], "valid": ["maybe"]})
+
+        @datacrystal
+        class Event:
+            at: datetime
+            day: Optional[date] = None
+
+        # datetimes and dates from strings and epoch numbers, as each instance would be (csv files)
+        ats = [
+            "2021-01-01T12:00:00",
+            "2021-01-01 12:00+02:00",
+            1609459200,
+            datetime(2021, 1, 1),
+        ]
+        days = ["2021-01-02", None, datetime(2021, 1, 2, 3), 1609459200]
+        df = Event.validate_columns({"at": ats, "day": days})
+        assert df["at"].tolist() == [Event(at=a).at for a in ats]
+        assert df.day.tolist() == [Event(at=ats[0], day=d).day for d in days]
+        # naive datetimes are stored as datetime64, as appended rows are, None stays None
+        df = Event.validate_columns({"at": ats[:1] + ats[3:], "day": [None, days[0]]})
+        assert pd.api.types.is_datetime64_any_dtype(df["at"])
+        assert df.day.tolist() == [None, date(2021, 1, 2)]
+        with self.assertRaises(ColumnsValidationError) as raised:
+            Event.validate_columns({"at": ["2021-01-01T00:00", "tomorrow", None]})
+        assert raised.exception.rows.tolist() == [1, 2]
+        with self.assertRaises(ColumnsValidationError):
+            Event.validate_columns({"at": ats[:1], "day": ["2021-01-02T00:00:00"]})
+
+        # ints are stricter than pydantic : no truncation
+        with self.assertRaises(ColumnsValidationError):
+            Sample.validate_columns(
+                {"attr_int": [1.7], "attr_dec": [1], "attr_str": ["a"]}
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
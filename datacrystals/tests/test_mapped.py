@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
+
+import hypothesis.strategies as st
+import numpy as np
+from hypothesis import given, settings
+
+from datacrystals._collection import _collection_from_class
+from datacrystals._crystals import datacrystal
+from datacrystals._query import column
+from datacrystals.tests.test_collection import Shard, Tick
+from datacrystals.tests.test_crystals import Sample, assert_same
+
+
+class TestMapped(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    @given(data=st.data(), chunksize=st.integers(min_value=1, max_value=8))
+    @settings(deadline=None)
+    def test_reopen(self, data, chunksize):
+        path = tempfile.mkdtemp(dir=self.root)
+        Collec = _collection_from_class(Sample)
+        elems = data.draw(
+            st.lists(
+                Sample.strategy().filter(
+                    lambda e: abs(e.attr_int) < 2 ** 63
+                    and abs(e.attr_opt or 0) < 2 ** 63
+                ),
+                max_size=20,
+            )
+        )
+        split = data.draw(st.integers(min_value=0, max_value=len(elems)))
+
+        cinst = Collec.open(path)
+        cinst._data.chunksize = chunksize
+        for e in elems[:split]:
+            cinst(e)
+        cinst.extend(elems[split:])
+        assert_same(cinst, elems)
+        cinst.flush()
+
+        reopened = Collec.open(path)
+        assert len(reopened) == len(elems)
+        assert_same(reopened, elems)
+        assert_same([reopened[p] for p in range(len(elems))], elems)
+
+    def test_mapped(self):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+        cinst = Collec.open(self.root)
+        cinst.extend(
+            {
+                "ts": [t0 + timedelta(seconds=s) for s in range(100)],
+                "price": [Decimal(s) / 4 for s in range(100)],
+            }
+        )
+        cinst(Tick(ts=t0 + timedelta(seconds=100), price=Decimal("25.125")))
+        cinst.flush()
+
+        reopened = Collec.open(self.root)
+        # fixed width columns are views on the mapped files
+        assert isinstance(reopened._data._columns["ts"]._values, np.memmap)
+        assert np.shares_memory(
+            reopened._df.ts.to_numpy(), reopened._data._columns["ts"]._values
+        )
+
+        assert reopened.asof(
+            t0 + timedelta(seconds=10, milliseconds=5)
+        ).price == Decimal("2.5")
+        assert [t.price for t in reopened.between(t0, t0 + timedelta(seconds=2))] == [
+            Decimal(0),
+            Decimal("0.25"),
+            Decimal("0.5"),
+        ]
+        assert reopened[-1].price == Decimal("25.125")
+        assert len(reopened[10:20]) == 10
+        # fixed width columns are not loaded by optimize(), nor cached
+        opt = reopened.optimize(floats=["price"])
+        assert len(opt) == 101 and opt.price.dtype == "float64"
+        assert np.shares_memory(
+            opt.ts.to_numpy(), reopened._data._columns["ts"]._values
+        )
+        assert not reopened.__cache__
+        # the size on disk, only the first and last rows are read
+        lines = str(reopened).splitlines()
+        assert lines[2].startswith("101 rows, ")
+        assert lines[3].startswith("  ts: datetime as datetime64[ns], ")
+        assert "25.125" in lines[-2]
+
+        # queried chunk by chunk
+        with mock.patch("datacrystals._collection.QUERY_CHUNKSIZE", 7):
+            found = reopened.where(column("price") > Decimal(24))
+        assert [t.price for t in found] == [
+            Decimal("24.25"),
+            Decimal("24.5"),
+            Decimal("24.75"),
+            Decimal("25.125"),
+        ]
+        assert found._data is not reopened._data  # in memory
+
+        # the index is still ascending, on the stored data too
+        with self.assertRaises(ValueError):
+            reopened(Tick(ts=t0, price=Decimal(0)))
+
+    def test_interrupted(self):
+        Collec = _collection_from_class(Shard)
+        Collec.open(self.root).extend({"answer": [1, 2], "question": ["a", "b"]})
+
+        # an append interrupted before the meta file was updated
+        with open(os.path.join(self.root, "answer.bin"), "ab") as f:
+            f.write(np.arange(3).tobytes())
+        with open(os.path.join(self.root, "question.data"), "ab") as f:
+            f.write(b"garbage")
+
+        cinst = Collec.open(self.root)
+        assert [s.answer for s in cinst] == [1, 2]
+        cinst(Shard(answer=3, question="c")).flush()
+        assert [s.question for s in Collec.open(self.root)] == ["a", "b", "c"]
+
+    def test_int64(self):
+        cinst = _collection_from_class(Shard).open(self.root)
+        with self.assertRaises(ValueError):
+            cinst(Shard(answer=2 ** 63))
+        with self.assertRaises(ValueError):
+            cinst.extend({"answer": [1, 2 ** 64]})
+        assert len(cinst.flush()) == 0
+
+    def test_aware(self):
+        # a time zone would be lost on disk : rejected, before anything changes
+        Collec = _collection_from_class(Tick, index="ts")
+        cinst = Collec.open(self.root)
+        t0 = datetime(2021, 1, 1)
+        aware = datetime(2021, 1, 2, tzinfo=timezone(timedelta(hours=2)))
+        with self.assertRaises(ValueError):
+            cinst(Tick(ts=aware, price=Decimal(1)))
+        with self.assertRaises(ValueError):
+            cinst.extend({"ts": [aware], "price": [1]})
+        cinst(Tick(ts=t0, price=Decimal(1))).flush()
+        assert [t.ts for t in Collec.open(self.root)] == [t0]
+
+    def test_mismatch(self):
+        _collection_from_class(Shard).open(self.root)
+        with self.assertRaises(ValueError):
+            _collection_from_class(Tick).open(self.root)
+
+        @datacrystal
+        class Delay:
+            delay: timedelta
+
+        with self.assertRaises(TypeError):  # no known on-disk representation
+            _collection_from_class(Delay).open(self.root)
+
+    def test_set(self):
+        Collec = _collection_from_class(Shard, kind="set")
+        Collec.open(self.root)(Shard(answer=1))(Shard(answer=2)).flush()
+
+        # distinct rows are found again after reopening
+        cinst = Collec.open(self.root)
+        cinst(Shard(answer=1))(Shard(answer=3))
+        assert [s.answer for s in cinst] == [1, 2, 3]
+
+        with self.assertRaises(TypeError):
+            _collection_from_class(Shard, kind="bag").open(self.root)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from datacrystals import crystalize, memoize
+
+
+class TestMemoize(unittest.TestCase):
+    def test_lru(self):
+        computed = []
+
+        @memoize(maxsize=2)
+        def price(qty: int, unit: Decimal = Decimal("1.5")) -> Decimal:
+            computed.append(qty)
+            return qty * unit
+
+        assert price(2) == price(qty=2) == price(2, Decimal("1.5")) == Decimal(3)
+        price(3)
+        price(2)
+        price(4)  # evicts 3, the least recently used
+        price(3)
+        assert computed == [2, 3, 4, 3]
+        assert price.cache_info() == (3, 4, 2, 2, 2)
+
+        assert type(price.calls).Inner is price.Call
+        assert [(c.qty, c.result) for c in price.calls] == [
+            (4, Decimal(6)),
+            (3, Decimal("4.5")),
+        ]
+
+        price.cache_clear()
+        assert price.cache_info() == (0, 0, 0, 2, 0)
+        assert len(price.calls) == 0
+
+    def test_lfu(self):
+        @memoize(maxsize=2, policy="lfu")
+        def double(x: int) -> int:
+            return 2 * x
+
+        double(1), double(1), double(2), double(3)  # evicts 2, used once
+        assert [c.x for c in double.calls] == [1, 3]
+
+        with self.assertRaises(ValueError):
+            memoize(double, policy="fifo")
+
+    def test_ttl(self):
+        t0 = datetime(2021, 1, 1)
+
+        @memoize(ttl=timedelta(seconds=10))
+        def ident(x: str) -> str:
+            return x
+
+        with mock.patch("datacrystals._memoize._now", return_value=t0):
+            ident("a")
+        with mock.patch(
+            "datacrystals._memoize._now", return_value=t0 + timedelta(seconds=5)
+        ):
+            ident("a")
+        with mock.patch(
+            "datacrystals._memoize._now", return_value=t0 + timedelta(seconds=11)
+        ):
+            ident("a")
+        assert ident.cache_info().hits == 1
+        assert ident.cache_info().misses == 2
+        assert [c.at for c in ident.calls] == [t0 + timedelta(seconds=11)]
+
+    def test_maxbytes(self):
+        @memoize(maxsize=None, maxbytes=1000)
+        def text(n: int) -> str:
+            return "x" * n
+
+        for n in range(10):
+            text(n * 100)
+        assert text._nbytes <= 1000
+        assert text.cache_info().currsize < 10
+        # the latest entries are kept
+        assert text.calls[len(text.calls) - 1].n == 900
+
+    def test_compact(self):
+        @memoize(maxsize=3)
+        def square(x: int) -> int:
+            return x * x
+
+        with mock.patch("datacrystals._memoize._COMPACT_MIN", 4):
+            for x in range(20):
+                square(x)
+        # evicted calls do not pile up
+        assert len(square._calls) <= 8
+        assert [c.x for c in square.calls] == [17, 18, 19]
+        assert square.calls.lookup(18) == [1]
+
+    def test_persist(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, "cache.bin")
+
+        @memoize
+        def square(x: int) -> int:
+            return x * x
+
+        square(3), square(4)
+        square.save(path)
+
+        @crystalize
+        def square(x: int) -> int:
+            raise AssertionError("Warm started, should not be computed")
+
+        square.load(path)
+        assert square(3) == 9 and square(4) == 16
+        assert square.cache_info().hits == 2
+
+    def test_validated(self):
+        @memoize
+        def half(x: int) -> int:
+            return x / 2
+
+        # the result as validated, the same computed, cached and recorded
+        assert half(3) == half(3) == 1
+        assert type(half(3)) is int
+        assert [c.result for c in half.calls] == [1]
+
+    def test_persist_pickled(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, "cache.bin")
+
+        @memoize
+        def pair(x, y: int) -> tuple:
+            return (x, y)
+
+        pair("a", 1)
+        # no column for x (no type hint) : pickled
+        pair.save(path)
+        pair.cache_clear()
+        with self.assertRaises(ValueError):
+            pair.load(path)
+        pair.load(path, allow_pickle=True)
+        assert [(c.x, c.y, c.result) for c in pair.calls] == [("a", 1, ("a", 1))]
+
+    def test_method(self):
+        class Scaled:
+            def __init__(self, k):
+                self.k = k
+
+            @memoize
+            def times(self, x: int) -> int:
+                return self.k * x
+
+        a, b = Scaled(2), Scaled(3)
+        # bound to each instance, which is part of the key
+        assert (a.times(2), b.times(2), a.times(x=2)) == (4, 6, 4)
+        assert Scaled.times.cache_info().hits == 1
+        assert Scaled.times(a, 2) == 4
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+
+            @memoize
+            def variadic(*args: int) -> int:
+                return len(args)
+
+        with self.assertRaises(TypeError):
+
+            @memoize
+            def result(result: int) -> int:
+                return result
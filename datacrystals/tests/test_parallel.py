@@ -0,0 +1,85 @@
+import operator
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from datacrystals._collection import _collection_from_class
+from datacrystals._crystals import datacrystal
+from datacrystals.tests.test_collection import Shard, Tick
+
+
+@datacrystal
+class Bar:
+    ts: datetime
+    notional: Decimal
+
+
+# module level functions, to be pickled to the worker processes
+
+
+def expensive(tick):
+    return tick.price > 5
+
+
+def notional(tick):
+    return Bar(ts=tick.ts, notional=tick.price * 100)
+
+
+def total(acc, tick):
+    return acc + tick.price
+
+
+def answer(shard):
+    return shard.answer
+
+
+def same(elem):
+    return elem
+
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        t0 = datetime(2021, 1, 1)
+        self.Collec = _collection_from_class(Tick, index="ts")
+        self.cinst = self.Collec.from_columns(
+            {
+                "ts": [t0 + timedelta(seconds=s) for s in range(100)],
+                "price": [Decimal(s % 10) for s in range(100)],
+            }
+        )
+
+    def test_filter(self):
+        for workers in (1, 3):
+            filtered = self.cinst.filter(expensive, workers=workers)
+            assert type(filtered) is self.Collec
+            assert list(filtered) == [t for t in self.cinst if t.price > 5]
+
+    def test_map(self):
+        expected = [notional(t) for t in self.cinst]
+        for workers in (1, 3):
+            bars = self.cinst.map(notional, into=Bar, workers=workers)
+            assert bars.Inner is Bar
+            assert list(bars) == expected
+
+        with self.assertRaises(TypeError):
+            self.cinst.map(same, into=Bar, workers=2)
+
+    def test_reduce(self):
+        expected = sum(t.price for t in self.cinst)
+        assert self.cinst.reduce(total, Decimal(0)) == expected
+        assert (
+            self.cinst.reduce(total, Decimal(0), combine=operator.add, workers=3)
+            == expected
+        )
+        with self.assertRaises(ValueError):
+            self.cinst.reduce(total, Decimal(0), workers=3)
+
+        # nothing to reduce
+        assert self.Collec().reduce(total, Decimal(0)) == Decimal(0)
+
+    def test_fallback(self):
+        # ints out of the column representation : shards are pickled
+        Collec = _collection_from_class(Shard)
+        cinst = Collec(*[Shard(answer=2 ** 70 + a) for a in range(10)])
+        assert cinst.filter(answer, workers=2)[0] == Shard(answer=2 ** 70)
+        assert list(cinst.map(same, workers=2)) == list(cinst)
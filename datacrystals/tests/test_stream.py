@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+
+import hypothesis.strategies as st
+from hypothesis import given, settings
+
+from datacrystals._collection import _collection_from_class
+from datacrystals.tests.test_collection import Shard
+
+
+class TestStream(unittest.TestCase):
+    @given(data=st.data(), consumers=st.integers(min_value=1, max_value=5))
+    @settings(deadline=None)
+    def test_aiter(self, data, consumers):
+        Collec = _collection_from_class(Shard, asynchronous=True)
+        elems = data.draw(st.lists(Shard.strategy(), min_size=1, max_size=10))
+        cinst = Collec(*elems[:2])
+
+        async def consume():
+            seen = []
+            async for e in cinst:
+                seen.append(e)
+                if len(seen) == len(elems):
+                    return seen
+
+        async def produce():
+            for e in elems[2:]:
+                await asyncio.sleep(0)
+                cinst(e)
+
+        async def main():
+            return await asyncio.gather(
+                *(consume() for _ in range(consumers)), produce()
+            )
+
+        *seen, _ = asyncio.run(asyncio.wait_for(main(), timeout=5))
+        for s in seen:
+            assert s == elems  # all consumers follow the flow of time, in order
+
+    def test_tail(self):
+        Collec = _collection_from_class(Shard, asynchronous=True)
+        cinst = Collec(Shard(answer=1), Shard(answer=2))
+
+        async def consume():
+            async for e in cinst.tail(last=1):
+                if e.answer == 3:
+                    return [2, 3]
+                assert e.answer == 2
+
+        async def main():
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0)
+            cinst.extend({"answer": [3]})
+            return await task
+
+        assert asyncio.run(asyncio.wait_for(main(), timeout=5)) == [2, 3]
+
+    def test_coalesced_wakeups(self):
+        Collec = _collection_from_class(Shard, asynchronous=True)
+        cinst = Collec()
+        wakeups = []
+
+        async def consume():
+            async for e in cinst:
+                wakeups.append(len(cinst))
+                if e.answer == 99:
+                    return True
+
+        async def main():
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0)  # consumer is now waiting
+            for a in range(100):
+                cinst(Shard(answer=a))
+            assert cinst._stream._scheduled  # one wakeup for all appends
+            return await task
+
+        assert asyncio.run(asyncio.wait_for(main(), timeout=5))
+        # the consumer was woken up once, when all elements were already there
+        assert wakeups == [100] * 100
+
+    def test_backpressure(self):
+        Collec = _collection_from_class(Shard, asynchronous=True)
+        cinst = Collec()
+        cinst.maxlag = 2
+        lags = []
+
+        async def consume():
+            async for e in cinst:
+                lags.append(len(cinst) - e.answer - 1)
+                await asyncio.sleep(0.001)  # slow consumer
+                if e.answer == 19:
+                    return
+
+        async def produce():
+            for a in range(20):
+                await cinst.put(Shard(answer=a))
+
+        async def main():
+            await asyncio.gather(consume(), produce())
+
+        asyncio.run(asyncio.wait_for(main(), timeout=5))
+        assert max(lags) <= cinst.maxlag
+
+    def test_closed_loop(self):
+        Collec = _collection_from_class(Shard, asynchronous=True)
+        cinst = Collec(Shard(answer=1))
+
+        async def consume():
+            async for _ in cinst.tail():
+                pass
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(consume(), timeout=0.1))
+        # its consumer is gone with the loop, appending still works
+        cinst(Shard(answer=2))
+        assert len(cinst) == 2
+
+        # even when the consumer was never closed
+        follow = cinst.tail()
+        loop = asyncio.new_event_loop()
+        with self.assertRaises(asyncio.TimeoutError):
+            loop.run_until_complete(asyncio.wait_for(follow.__anext__(), timeout=0.1))
+        loop.close()
+        cinst(Shard(answer=3))
+        assert len(cinst) == 3
+
+    def test_not_asynchronous(self):
+        cinst = _collection_from_class(Shard)()
+        assert not hasattr(cinst, "__aiter__")
+
+
+if __name__ == "__main__":
+    unittest.main()
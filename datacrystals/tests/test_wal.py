@@ -0,0 +1,172 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import hypothesis.strategies as st
+from hypothesis import given, settings
+
+from datacrystals._collection import _collection_from_class
+from datacrystals.tests.test_collection import Shard, Tick
+
+
+class TestDurable(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    @given(
+        batches=st.lists(
+            st.tuples(st.booleans(), st.lists(st.integers(-100, 100), max_size=5)),
+            max_size=8,
+        ),
+        group=st.integers(min_value=1, max_value=4),
+        snapshot_every=st.sampled_from([None, 1, 3, 10]),
+    )
+    @settings(deadline=None)
+    def test_reopen(self, batches, group, snapshot_every):
+        path = tempfile.mkdtemp(dir=self.root)
+        Collec = _collection_from_class(Shard)
+        cinst = Collec.durable(path, group=group, snapshot_every=snapshot_every)
+        expected = []
+        for as_frame, answers in batches:
+            if as_frame:
+                cinst.extend({"answer": answers, "question": [str(a) for a in answers]})
+            else:
+                for a in answers:
+                    cinst(Shard(answer=a, question=str(a)))
+            cinst.flush()
+            expected += [Shard(answer=a, question=str(a)) for a in answers]
+            # restarting : committed rows are replayed, appends go on in another segment
+            cinst = Collec.durable(path, group=group, snapshot_every=snapshot_every)
+            assert list(cinst) == expected
+
+        cinst(Shard(answer=0)).flush()
+        assert list(Collec.durable(path)) == expected + [Shard(answer=0)]
+
+    def test_snapshot(self):
+        Collec = _collection_from_class(Tick, index="ts")
+        t0 = datetime(2021, 1, 1)
+        ticks = [
+            Tick(ts=t0 + timedelta(seconds=s), price=Decimal(s)) for s in range(10)
+        ]
+        cinst = Collec.durable(self.root, snapshot_every=4)
+        cinst.extend(ticks[:3])
+        cinst.extend(
+            {"ts": [t.ts for t in ticks[3:6]], "price": [t.price for t in ticks[3:6]]}
+        )
+        # a snapshot after 6 rows logged, and only the log after it
+        assert sorted(os.listdir(self.root)) == [
+            "log-00000001.wal",
+            "snapshot-00000001.dcc",
+        ]
+        cinst.extend(ticks[6:])
+        cinst.snapshot().flush()
+        assert sorted(os.listdir(self.root)) == [
+            "log-00000003.wal",
+            "snapshot-00000003.dcc",
+        ]
+
+        reopened = Collec.durable(self.root)
+        assert list(reopened) == ticks
+        assert reopened.asof(t0 + timedelta(seconds=4.5)).price == Decimal(4)
+        # the index is still ascending
+        with self.assertRaises(ValueError):
+            reopened(ticks[0])
+
+        # a snapshot interrupted before its rename is ignored
+        with open(os.path.join(self.root, "snapshot-00000009.dcc.tmp"), "wb") as f:
+            f.write(b"partial")
+        assert list(Collec.durable(self.root)) == ticks
+
+        with self.assertRaises(TypeError):
+            _collection_from_class(Tick)().snapshot()
+
+    def test_torn(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec.durable(self.root, group=1)
+        for a in range(3):
+            cinst(Shard(answer=a))
+
+        # the last record is torn by a crash, and garbage follows
+        segment = os.path.join(self.root, "log-00000000.wal")
+        with open(segment, "rb+") as f:
+            f.truncate(os.path.getsize(segment) - 1)
+        with open(segment, "ab") as f:
+            f.write(b"garbage")
+        reopened = Collec.durable(self.root)
+        assert [s.answer for s in reopened] == [0, 1]
+        reopened(Shard(answer=3)).flush()
+        assert [s.answer for s in Collec.durable(self.root)] == [0, 1, 3]
+
+    def test_group(self):
+        Collec = _collection_from_class(Shard, kind="set")
+        cinst = Collec.durable(self.root, group=3, interval=3600)
+        cinst(Shard(answer=1))(Shard(answer=1))(Shard(answer=2))
+        # not committed yet (the repeated row is not logged)
+        assert len(Collec.durable(self.root)) == 0
+        cinst(Shard(answer=3))
+        assert [s.answer for s in Collec.durable(self.root)] == [1, 2, 3]
+
+    def test_interval(self):
+        Collec = _collection_from_class(Shard)
+        cinst = Collec.durable(self.root, group=1000, interval=0.05)
+        cinst(Shard(answer=1))(Shard(answer=2))
+        # committed by the timer, without any later append nor flush
+        time.sleep(0.5)
+        assert [s.answer for s in Collec.durable(self.root)] == [1, 2]
+
+    def test_exit(self):
+        # a pending group is committed when the interpreter exits normally
+        code = (
+            "import sys; from datacrystals._collection import _collection_from_class;"
+            "from datacrystals.tests.test_collection import Shard;"
+            "_collection_from_class(Shard).durable(sys.argv[1], group=1000, interval=3600)"
+            "(Shard(answer=1))(Shard(answer=2))"
+        )
+        subprocess.run([sys.executable, "-c", code, self.root], check=True)
+        durable = _collection_from_class(Shard).durable(self.root)
+        assert [s.answer for s in durable] == [1, 2]
+
+    def test_unpacked(self):
+        # rows are replayed without pickle : rows out of the packed representation are not appended
+        cinst = _collection_from_class(Shard).durable(self.root)
+        with self.assertRaises(ValueError):
+            cinst(Shard(answer=2 ** 70))
+        with self.assertRaises(ValueError):
+            cinst.extend({"answer": [1, 2 ** 70]})
+        cinst(Shard(answer=1)).flush()
+        assert list(cinst) == [Shard(answer=1)]
+        assert list(_collection_from_class(Shard).durable(self.root)) == list(cinst)
+
+    def test_aware(self):
+        # a time zone would be lost in the log : rejected, before anything is appended
+        Collec = _collection_from_class(Tick, index="ts")
+        cinst = Collec.durable(self.root, snapshot_every=1)
+        aware = datetime(2021, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        with self.assertRaises(ValueError):
+            cinst(Tick(ts=aware, price=Decimal(1)))
+        with self.assertRaises(ValueError):
+            cinst.extend({"ts": [aware], "price": [1]})
+        assert len(cinst) == 0
+        tick = Tick(ts=datetime(2021, 1, 1), price=Decimal(1))
+        cinst.extend([tick]).flush()
+        assert list(Collec.durable(self.root)) == [tick]
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            _collection_from_class(Shard).durable(self.root, fsync="sometimes")
+        with self.assertRaises(TypeError):
+            _collection_from_class(Shard, kind="bag").durable(self.root)
+        _collection_from_class(Shard).durable(self.root)
+        with self.assertRaises(ValueError):
+            _collection_from_class(Tick).durable(self.root)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,25 +14,18 @@ class Candle:
     close: int
 
 
-OHLC = datacrystals.collection(Candle)
-
-
-# TODO : this should be specified when constructing the collection type...
-def as_candle(self):
-    return Candle(
-        open=self._df.iloc[0].open,
-        high=max(self._df.high),
-        low=min(self._df.low),
-        close=self._df.iloc[-1].close,
-    )
-
-
-setattr(OHLC, "as_candle", as_candle)
+# How candles are merged together, each field on its own.
+OHLC = datacrystals.collection(
+    Candle, reducers=dict(open="first", high="max", low="min", close="last")
+)
 
 ohlc = OHLC(
     Candle(open=1, high=4, low=1, close=3), Candle(open=3, high=5, low=2, close=2)
 )
 
+# incrementally maintained, appending candles does not go through the whole collection again
+candle = ohlc.aggregate()
+
 if __name__ == "__main__":
     # interactive example
     import sys
@@ -1,3 +1,4 @@
+import glob
 import subprocess
 
 import nox
@@ -15,7 +16,7 @@ TYPED_FILES = {
     "datacrystals/_version.py",
 }
 
-SOURCE_FILES = ["docs/", "datacrystals/", "noxfile.py", "setup.py"]
+SOURCE_FILES = ["docs/", "datacrystals/", "benchmarks/", "noxfile.py", "setup.py"]
 
 
 # Ref : urllib3 has a strict nox-based process that we duplicate here.
@@ -70,7 +71,7 @@ def lint(session):
 def tests(session):
 
     # install the package first to retrieve all dependencies before testing
-    session.install(".")
+    session.install(".[arrow]")
     session.install("pytest", "pytest-asyncio")
 
     # displaying current machine date (it could influence tests if not handled properly)
@@ -79,6 +80,23 @@ def tests(session):
     session.run(*"pytest -sv".split())
 
 
+@nox.session
+def benchmarks(session):
+
+    session.install(".")
+    session.install("pytest", "pytest-benchmark")
+
+    # results are saved as JSON in .benchmarks/, and compared with the previous run, failing on regression.
+    args = ["--benchmark-autosave"]
+    if glob.glob(".benchmarks/*/*.json"):
+        args += ["--benchmark-compare", "--benchmark-compare-fail=median:25%"]
+
+    # larger collections with : nox -s benchmarks -- --max-rows=10000000
+    session.run(
+        *"pytest benchmarks -o python_files=bench_*.py".split(), *args, *session.posargs
+    )
+
+
 @nox.session
 def docs(session):
 
@@ -22,5 +22,8 @@ setup(
         "hypothesis",
         "tabulate",
     ],
+    extras_require={
+        "arrow": ["pyarrow"],
+    },
     zip_safe=False,
 )